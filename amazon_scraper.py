@@ -1,18 +1,51 @@
-import requests
 from bs4 import BeautifulSoup
 import time
 import random
 import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote_plus
 from requests.exceptions import RequestException
 
+import http_client
+import stream_parser
+from block_detection import BlockedPageError
+
 logger = logging.getLogger(__name__)
 
+BASE_URL = "https://www.amazon.in"
+PAGE_DELAY = (2, 5)  # seconds slept between result pages when following next-page links
+RESULTS_PER_PAGE = 16  # conservative; pages usually carry more once sponsored slots are counted
+PARALLEL_PAGES = 3  # result pages fetched at once; the per-host budget lives in http_client
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": http_client.ACCEPT_ENCODING,
+    "Connection": "keep-alive",
+}
+
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+def _reset_after_fork():
+    # A forked worker process inherits the pool but none of its threads
+    global _page_pool, _page_pool_lock
+    _page_pool = None
+    _page_pool_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
 def search(keywords, num_products=30):
     try:
         num_products = int(num_products)
 
         # Fetch data
-        all_data = fetch_amazon_data(keywords, num_products)
+        with http_client.page_context(search="keyword", wanted=num_products):
+            all_data = fetch_amazon_data(keywords, num_products)
         
         # Process data
         products = process_amazon_data(all_data, num_products)
@@ -35,45 +68,207 @@ def search(keywords, num_products=30):
         raise Exception(error_msg)
 
 def fetch_amazon_data(keyword, num_products):
-    all_data = []
-    url = f"https://www.amazon.in/s?k={keyword.replace(' ', '+')}"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Connection": "keep-alive",
-    }
+    pages_needed = max(1, -(-num_products // RESULTS_PER_PAGE))
 
-    page = 1
-    while len(all_data) * 16 < num_products:  # Assuming 16 products per page
-        try:
-            logger.info(f"Fetching page {page} for '{keyword}'")
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
+    try:
+        logger.info(f"Fetching page 1 for '{keyword}'")
+        first_page = fetch_search_page(search_url(keyword), max_results=num_products)
+    except RequestException as e:
+        logger.error(f"An error occurred while fetching results for '{keyword}' on page 1: {e}")
+        return []
+
+    all_data = [first_page]
+    found = count_results(first_page)
+    if found >= num_products or pages_needed == 1 or not first_page.find("a", class_="s-pagination-next"):
+        return all_data
+
+    # Page N is addressable directly, so the remaining pages go out together
+    # instead of one next-link hop (plus sleep) at a time.
+    last_page = last_page_number(first_page)
+    page_numbers = list(range(2, min(pages_needed, last_page or pages_needed) + 1))
+    pages, blocked = fetch_pages_direct(keyword, page_numbers, num_products - found)
+    all_data.extend(pages)
+    found += sum(count_results(soup) for soup in pages)
+
+    if len(all_data) < len(page_numbers) + 1 and found < num_products and not blocked:
+        logger.warning(f"Direct page URLs failed for '{keyword}' after page {len(all_data)}, following next-page links instead")
+        for soup in iter_amazon_pages(keyword, start_soup=all_data[-1], start_page=len(all_data)):
             all_data.append(soup)
+            if len(all_data) >= len(page_numbers) + 1:
+                break
+    return all_data
+
+def search_url(keyword, page=1):
+    url = f"{BASE_URL}/s?k={quote_plus(keyword)}"
+    return url if page == 1 else f"{url}&page={page}"
 
-            next_page = soup.find("a", class_="s-pagination-next")
-            if next_page and "href" in next_page.attrs:
-                url = "https://www.amazon.in" + next_page["href"]
-                logger.info(f"Fetched page {page}, moving to next page...")
-                page += 1
-                time.sleep(random.uniform(2, 5))
-            else:
-                logger.info(f"No more pages found for '{keyword}'")
+def is_search_result(element):
+    return element.tag == "div" and element.get("data-component-type") == "s-search-result"
+
+def is_pagination(element):
+    return element.tag == "span" and stream_parser.has_class(element, "s-pagination-strip")
+
+def fetch_search_page(url, max_results=None):
+    # Parses the page while it downloads and keeps only the result blocks and
+    # the pagination bar. With max_results, the transfer is cut off as soon as
+    # that many results have been parsed (the pagination bar comes after them).
+    with http_client.stream(url, headers=HEADERS, timeout=10) as body:
+        return parse_search_page(body.iter_chunks(), max_results, body.encoding)
+
+def parse_search_page(chunks, max_results=None, encoding=None):
+    fragments = []
+    results = 0
+    elements = stream_parser.iter_closed_elements(
+        chunks, lambda el: is_search_result(el) or is_pagination(el), tags=("div", "span"), encoding=encoding)
+    for element in elements:
+        fragments.append(stream_parser.to_html(element))
+        element.clear()
+        if is_search_result(element):
+            results += 1
+            if max_results and results >= max_results:
                 break
+    return BeautifulSoup("".join(fragments), 'html.parser')
+
+def count_results(soup):
+    return len(soup.find_all("div", {"data-component-type": "s-search-result"}))
+
+def page_pool():
+    # Shared by every search; searches started from two threads at once
+    # must not each make one
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            _page_pool = ThreadPoolExecutor(max_workers=PARALLEL_PAGES, thread_name_prefix="amazon-pages")
+        return _page_pool
+
+def fetch_pages_direct(keyword, page_numbers, max_results=None):
+    # Returns the pages fetched in order up to the first failure, and whether
+    # that failure was a block (in which case falling back is pointless).
+    logger.info(f"Fetching pages {page_numbers[0]}-{page_numbers[-1]} for '{keyword}' in parallel")
+    context = http_client.get_page_context()
+    futures = [page_pool().submit(http_client.run_in_page_context, context, fetch_search_page, search_url(keyword, page), max_results)
+               for page in page_numbers]
+    pages = []
+    try:
+        for page, future in zip(page_numbers, futures):
+            try:
+                soup = future.result()
+            except BlockedPageError as e:
+                logger.warning(f"Blocked on page {page} for '{keyword}', keeping the {len(pages) + 1} pages already fetched: {e}")
+                return pages, True
+            except RequestException as e:
+                logger.error(f"An error occurred while fetching results for '{keyword}' on page {page}: {e}")
+                return pages, False
+            if not soup.find("div", {"data-component-type": "s-search-result"}):
+                logger.warning(f"Page {page} for '{keyword}' has no results")
+                return pages, False
+            pages.append(soup)
+    finally:
+        # Pages after the first failure are never used: don't spend the
+        # host's request budget on the ones not started yet
+        for future in futures:
+            future.cancel()
+    return pages, False
+
+def last_page_number(soup):
+    numbers = [int(item.get_text(strip=True)) for item in soup.find_all(class_="s-pagination-item")
+               if re.fullmatch(r"\d+", item.get_text(strip=True))]
+    return max(numbers) if numbers else None
+
+def iter_amazon_pages(keyword, start_soup=None, start_page=1):
+    # Yields result pages lazily by following next-page links, so callers can
+    # stop paginating (and skip the inter-page sleep) as soon as they have
+    # what they need. With start_soup, continues after an already fetched page.
+    url = search_url(keyword)
+    page = start_page
+    if start_soup is not None:
+        next_page = start_soup.find("a", class_="s-pagination-next")
+        if not next_page or "href" not in next_page.attrs:
+            return
+        url = BASE_URL + next_page["href"]
+        page += 1
+
+    while True:
+        try:
+            logger.info(f"Fetching page {page} for '{keyword}'")
+            soup = fetch_search_page(url)
+        except BlockedPageError as e:
+            # Fail fast: no point paging further (and sleeping) once Amazon serves a robot check
+            if page == 1:
+                raise
+            logger.warning(f"Blocked on page {page} for '{keyword}', keeping the {page - 1} pages already fetched: {e}")
+            return
         except RequestException as e:
             logger.error(f"An error occurred while fetching results for '{keyword}' on page {page}: {e}")
-            break
+            return
 
-    return all_data
+        yield soup
+
+        next_page = soup.find("a", class_="s-pagination-next")
+        if next_page and "href" in next_page.attrs:
+            url = BASE_URL + next_page["href"]
+            logger.info(f"Fetched page {page}, moving to next page...")
+            page += 1
+            time.sleep(random.uniform(*PAGE_DELAY))
+        else:
+            logger.info(f"No more pages found for '{keyword}'")
+            return
+
+def find_target_ranks(keyword, target_asins, max_rank=100):
+    # Rank lookup for a handful of ASINs: stops paginating once every target has
+    # an organic rank. Sponsored slots are recorded when seen but are bought
+    # placements, so they don't count as having located a product.
+    targets = list(dict.fromkeys(target_asins))
+    found = {}
+    products = []
+    organic_position = 0
+    pages = 0
+
+    # Target lookups archive like keyword searches that asked for max_rank results
+    with http_client.page_context(search="keyword", wanted=max_rank):
+        for soup in iter_amazon_pages(keyword):
+            pages += 1
+            for product in process_amazon_data([soup], max_rank - len(products)):
+                product["rank"] = len(products) + 1
+                products.append(product)
+                if product["type"] == "Organic":
+                    organic_position += 1
+
+                if product["asin"] in targets:
+                    entry = found.setdefault(product["asin"], new_target_entry(keyword, product["asin"], product["title"]))
+                    if product["type"] == "Sponsored" and entry["sponsored_rank"] == "N/A":
+                        entry["sponsored_rank"] = product["rank"]
+                        entry["sponsored_page"] = pages
+                    elif product["type"] == "Organic" and entry["organic_rank"] == "N/A":
+                        entry["organic_rank"] = product["rank"]
+                        entry["organic_position"] = organic_position
+                        entry["page"] = pages
+
+            located = sum(1 for entry in found.values() if entry["organic_rank"] != "N/A")
+            if located == len(targets) or len(products) >= max_rank:
+                break
+
+    logger.info(f"Located {len(found)}/{len(targets)} targets for '{keyword}' in {pages} pages ({len(products)} results)")
+    return [found.get(asin) or new_target_entry(keyword, asin, "Not found") for asin in targets]
+
+def new_target_entry(keyword, asin, title):
+    return {
+        "keyword": keyword,
+        "asin": asin,
+        "title": title,
+        "organic_rank": "N/A",
+        "organic_position": "N/A",
+        "page": "N/A",
+        "sponsored_rank": "N/A",
+        "sponsored_page": "N/A",
+    }
 
 def process_amazon_data(all_data, num_products=30):
     products = []
     for soup in all_data:
         search_results = soup.find_all("div", {"data-component-type": "s-search-result"})
         
-        logger.info(f"Found {len(search_results)} search results on this page")
+        logger.info("Found %d search results on this page", len(search_results))
 
         for result in search_results:
             if len(products) >= num_products:
@@ -81,7 +276,7 @@ def process_amazon_data(all_data, num_products=30):
 
             try:
                 asin = result.get("data-asin")
-                logger.debug(f"Processing product with ASIN: {asin}")
+                logger.debug("Processing product with ASIN: %s", asin)
 
                 title_element = result.find("h2", class_="a-size-mini")
                 title = title_element.text.strip() if title_element else "Title not found"
@@ -106,7 +301,7 @@ def process_amazon_data(all_data, num_products=30):
                 sponsored_class = result.get("class", [])
                 product_type = "Sponsored" if "AdHolder" in sponsored_class else "Organic"
                 
-                logger.debug(f"Product type determined: {product_type}")
+                logger.debug("Product type determined: %s", product_type)
 
                 products.append({
                     "rank": len(products) + 1,
@@ -119,15 +314,12 @@ def process_amazon_data(all_data, num_products=30):
                     "type": product_type
                 })
 
-                logger.debug(f"Successfully processed product: {title}")
+                logger.debug("Successfully processed product: %s", title)
 
             except AttributeError as ae:
-                logger.error(f"AttributeError processing product: {str(ae)}")
+                logger.error("AttributeError processing product: %s", ae)
             except Exception as e:
-                logger.error(f"Error processing product: {str(e)}")
+                logger.error("Error processing product: %s", e)
 
-    logger.info(f"Processed {len(products)} products in total")
+    logger.info("Processed %d products in total", len(products))
     return products[:num_products]
-
-# Set up more detailed logging
-logging.basicConfig(level=logging.DEBUG)
\ No newline at end of file
@@ -0,0 +1,165 @@
+import asyncio
+import os
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+
+from stub_server import FIXTURES_DIR, gzip_bytes, load_fixture, route_fixture
+
+
+class H2StubServer:
+    # The recorded pages of stub_server over cleartext HTTP/2 (prior
+    # knowledge, no TLS): every request on a connection is its own stream,
+    # answered concurrently after the configured latency. Responses are br
+    # or gzip encoded as the request's Accept-Encoding allows.
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, gzip=True, handshake=0.0):
+        self.address = address
+        self.latency = latency
+        self.handshake = handshake
+        self.gzip = gzip
+        self.fixtures = {name: load_fixture(name) for name in os.listdir(FIXTURES_DIR) if name.endswith(".html")}
+        self.encoded = {}
+        self.stats_lock = threading.Lock()
+        self.request_count = 0
+        self.bytes_sent = 0
+        self.connection_count = 0
+        self.server_address = None
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(asyncio.start_server(self.serve, *self.address))
+            self.server_address = self._server.sockets[0].getsockname()
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        async def close():
+            self._server.close()
+            for task in asyncio.all_tasks():
+                if task is not asyncio.current_task():
+                    task.cancel()
+            await self._server.wait_closed()
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.request_count = 0
+            self.bytes_sent = 0
+            self.connection_count = 0
+
+    async def serve(self, reader, writer):
+        with self.stats_lock:
+            self.connection_count += 1
+        if self.handshake:
+            await asyncio.sleep(self.handshake)
+        conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding="utf-8"))
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        windows = {}  # stream id -> event set when the client opens its flow-control window
+        tasks = set()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        windows[event.stream_id] = asyncio.Event()
+                        task = asyncio.ensure_future(self.respond(conn, writer, event.stream_id, dict(event.headers), windows))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                    elif isinstance(event, h2.events.WindowUpdated):
+                        for stream_id, window in windows.items():
+                            if event.stream_id in (0, stream_id):
+                                window.set()
+                    elif isinstance(event, h2.events.StreamReset):
+                        window = windows.pop(event.stream_id, None)
+                        if window:
+                            window.set()
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        return
+                writer.write(conn.data_to_send())
+                await writer.drain()
+        except (ConnectionError, h2.exceptions.ProtocolError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def respond(self, conn, writer, stream_id, headers, windows):
+        with self.stats_lock:
+            self.request_count += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        parts = urlsplit(headers[":path"])
+        body = route_fixture(self.fixtures, parts.path, parse_qs(parts.query))
+        status = "200" if body is not None else "404"
+        body = body or b"Not found"
+        response_headers = [(":status", status), ("content-type", "text/html; charset=utf-8")]
+        accepted = headers.get("accept-encoding", "")
+        encoding = None
+        if self.gzip and brotli and "br" in accepted:
+            encoding = "br"
+        elif self.gzip and "gzip" in accepted:
+            encoding = "gzip"
+        if encoding:
+            # Encoded once per page: the server shares the benchmark's CPU
+            key = (body, encoding)
+            if key not in self.encoded:
+                self.encoded[key] = brotli.compress(body, quality=5) if encoding == "br" else gzip_bytes(body)
+            body = self.encoded[key]
+            response_headers.append(("content-encoding", encoding))
+        response_headers.append(("content-length", str(len(body))))
+        try:
+            conn.send_headers(stream_id, response_headers)
+            sent = 0
+            while sent < len(body):
+                window = conn.local_flow_control_window(stream_id)
+                if window <= 0:
+                    windows[stream_id].clear()
+                    writer.write(conn.data_to_send())
+                    await windows[stream_id].wait()
+                    if stream_id not in windows:
+                        return
+                    continue
+                size = min(window, conn.max_outbound_frame_size, len(body) - sent)
+                conn.send_data(stream_id, body[sent:sent + size], end_stream=sent + size == len(body))
+                sent += size
+                writer.write(conn.data_to_send())
+                await writer.drain()
+            with self.stats_lock:
+                self.bytes_sent += sent
+        except (h2.exceptions.StreamClosedError, h2.exceptions.ProtocolError, ConnectionError):
+            # Streaming clients reset streams once they have what they need
+            pass
+        finally:
+            windows.pop(stream_id, None)
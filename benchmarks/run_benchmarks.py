@@ -0,0 +1,919 @@
+"""Offline benchmarks for the scrapers and the Excel export.
+
+Replays the recorded pages in benchmarks/fixtures through a local stand-in
+server, so nothing here touches amazon.in or flipkart.com.
+
+    python benchmarks/run_benchmarks.py --latency 0.05 --save bench.json
+    python benchmarks/run_benchmarks.py --compare bench.json --tolerance 0.15
+"""
+import argparse
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import socket
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import openpyxl
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import amazon_scraper
+import block_detection
+import crawl_node
+import flipkart_scraper
+import http_client
+import log_setup
+import page_archive
+import product_info_fetcher
+import product_lookup
+import profiling
+import proxy_pool
+import rank_analytics
+import sharded_runner
+import sheets_sync
+import watchlist
+from export_utils import export_to_excel
+import stub_server
+from h2_stub_server import H2StubServer
+from sheets_stub import GoogleStubServer
+from stub_server import StubServer
+from work_queue import WorkQueue
+
+KEYWORDS = ["perfume", "perfume for men", "perfume for women", "unisex perfumes", "long lasting perfumes",
+            "bellavita perfumes", "wild stone perfume for men", "renee perfume"]
+AMAZON_ASINS = [f"B0BENCH{i:03d}" for i in range(24)]
+FLIPKART_LINKS = [f"/bella-vita-perfume-{i}/p/itmbench{i:05d}?pid=PRFBENCH{i:05d}" for i in range(24)]
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def point_scrapers_at(base_url):
+    amazon_scraper.BASE_URL = base_url
+    amazon_scraper.PAGE_DELAY = (0, 0)
+    flipkart_scraper.BASE_URL = base_url
+    flipkart_scraper.PAGE_DELAY = (0, 0)
+    product_info_fetcher.AMAZON_BASE_URL = base_url
+
+
+def measure(calls, server, repeat=1):
+    # Timing pass first, then a separate tracemalloc pass so tracing overhead
+    # never leaks into the latency figures.
+    latencies = []
+    items = 0
+    server.reset_stats()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for call in calls:
+            t0 = time.perf_counter()
+            result = call()
+            latencies.append(time.perf_counter() - t0)
+            items += count_items(result)
+    wall = time.perf_counter() - start
+    requests_made = server.request_count
+    bytes_sent = server.bytes_sent
+
+    gc.collect()
+    tracemalloc.start()
+    for call in calls:
+        call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "calls": len(latencies),
+        "items": items,
+        "wall_s": round(wall, 4),
+        "throughput_items_per_s": round(items / wall, 2) if wall else 0.0,
+        "latency_p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "latency_p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "requests": requests_made,
+        "bytes_received": bytes_sent,
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def count_items(result):
+    if result is None:
+        return 0
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 1
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+@scenario("amazon_search")
+def bench_amazon_search(server, args):
+    return measure([lambda k=k: amazon_scraper.search(k, args.ranks) for k in KEYWORDS[:args.keywords]], server, args.repeat)
+
+
+@scenario("flipkart_search")
+def bench_flipkart_search(server, args):
+    return measure([lambda k=k: flipkart_scraper.search(k, args.ranks) for k in KEYWORDS[:args.keywords]], server, args.repeat)
+
+
+@scenario("amazon_product_info")
+def bench_amazon_product_info(server, args):
+    asins = AMAZON_ASINS[:args.products]
+    return measure([lambda a=a: product_info_fetcher.fetch_amazon_product_info(a) for a in asins], server, args.repeat)
+
+
+@scenario("flipkart_product_info")
+def bench_flipkart_product_info(server, args):
+    links = [server.base_url + link for link in FLIPKART_LINKS[:args.products]]
+    return measure([lambda u=u: product_info_fetcher.fetch_flipkart_product_info(u) for u in links], server, args.repeat)
+
+
+@scenario("export_to_excel")
+def bench_export(server, args):
+    products = amazon_scraper.search(KEYWORDS[0], args.ranks)
+    results = {f"{KEYWORDS[i % len(KEYWORDS)]} {i}": products for i in range(args.export_keywords)}
+    out_dir = tempfile.mkdtemp(prefix="bench_export_")
+    file_path = os.path.join(out_dir, "rank.xlsx")
+    rows = [row for keyword_rows in results.values() for row in keyword_rows]
+
+    def export():
+        export_to_excel(results, file_path, "Amazon")
+        return rows
+
+    return measure([export], server, args.repeat)
+
+
+@scenario("export_parallel")
+def bench_export_parallel(server, args):
+    products = amazon_scraper.search(KEYWORDS[0], 100)
+    results = {f"{KEYWORDS[i % len(KEYWORDS)]} {i}": products for i in range(args.parallel_keywords)}
+    out_dir = tempfile.mkdtemp(prefix="bench_export_")
+    rows = [row for keyword_rows in results.values() for row in keyword_rows]
+
+    start = time.perf_counter()
+    export_to_excel(results, os.path.join(out_dir, "serial.xlsx"), "Amazon", max_workers=1)
+    serial = time.perf_counter() - start
+
+    def export():
+        export_to_excel(results, os.path.join(out_dir, "parallel.xlsx"), "Amazon", max_workers=args.workers)
+        return rows
+
+    metrics = measure([export], server, args.repeat)
+    metrics["serial_wall_s"] = round(serial, 4)
+    metrics["speedup"] = round(serial / (metrics["wall_s"] / args.repeat), 2)
+    return metrics
+
+
+def fixture_asins():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "amazon_search_p1.html")) as f:
+        return re.findall(r'data-asin="(\w+)"[^>]*class="[^"]*s-asin[^"]*"', f.read())
+
+
+@scenario("amazon_bulk_lookup")
+def bench_amazon_bulk_lookup(server, args):
+    # Same number of products as amazon_product_info, resolved through search
+    # pages; two ASINs the search never returns go to /dp/ as a fallback.
+    # The stand-in serves its recorded search page for any query, so this
+    # measures the request saving, not whether Amazon still ORs "|" terms.
+    asins = fixture_asins()[:max(args.products - 2, 0)] + AMAZON_ASINS[:2]
+    stats = {}
+
+    def lookup():
+        products, run_stats = product_lookup.lookup_amazon_products(asins, product_lookup.SEARCH_RESULT_FIELDS)
+        stats.update(run_stats)
+        return [product for product in products if product]
+
+    metrics = measure([lookup], server, args.repeat)
+    metrics["search_misses"] = stats["search_misses"]
+    metrics["requests_saved"] = stats["requests_saved"]
+    return metrics
+
+
+@scenario("sharded_lookup")
+def bench_sharded_lookup(server, args):
+    # A catalog none of whose ASINs are on the search pages, so every product
+    # is a /dp/ page: one process holding every result (as the app does) vs
+    # sharded_runner's worker processes under the same total host budget.
+    # peak_memory_kb is the parent's, with the spill merge and export.
+    asins = [f"B0CAT{i:05d}" for i in range(args.catalog)]
+    shards = args.workers or 4
+    out_dir = tempfile.mkdtemp(prefix="bench_sharded_")
+    limit = http_client.DEFAULT_LIMIT
+
+    def single():
+        products, _ = product_lookup.lookup_amazon_products(asins, max_workers=limit[0])
+        export_to_excel({"product": products}, os.path.join(out_dir, "single.xlsx"), "Amazon")
+        return [product for product in products if product]
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    expected = [product["ASIN"] for product in single()]
+    single_wall = time.perf_counter() - start
+    _, single_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    output = os.path.join(out_dir, "sharded.xlsx")
+
+    def sharded():
+        stats = sharded_runner.run_sharded(asins, output, shards, threads=limit[0],
+                                           spill_dir=os.path.join(out_dir, "spill"))
+        return [None] * stats["exported"]
+
+    metrics = measure([sharded], server, args.repeat)
+    exported = [row[1] for row in openpyxl.load_workbook(output, read_only=True).active.iter_rows(min_row=2, values_only=True)]
+    metrics["shards"] = shards
+    metrics["single_process_wall_s"] = round(single_wall, 4)
+    metrics["single_process_peak_memory_kb"] = round(single_peak / 1024, 1)
+    metrics["speedup"] = round(single_wall / (metrics["wall_s"] / args.repeat), 2)
+    metrics["same_rows"] = exported == expected
+    return metrics
+
+
+@scenario("amazon_target_ranks")
+def bench_amazon_target_ranks(server, args):
+    # Our listings on page one: the lookup should stop after a single page
+    targets = fixture_asins()[3:6]
+    return measure([lambda k=k: amazon_scraper.find_target_ranks(k, targets, 100) for k in KEYWORDS[:args.keywords]], server, args.repeat)
+
+
+@scenario("amazon_search_blocked")
+def bench_amazon_search_blocked(server, args):
+    # Every response is a robot check: measures how quickly a run gives up
+    host = server.base_url.split("://", 1)[1]
+
+    def search(keyword):
+        try:
+            return amazon_scraper.search(keyword, args.ranks)
+        except Exception:
+            return None
+
+    server.block_rate = 1.0
+    try:
+        block_detection.reset_circuit_breakers()
+        block_detection._breakers[host] = block_detection.CircuitBreaker(host, cooldown=60.0, max_wait=0.0)
+        return measure([lambda k=k: search(k) for k in KEYWORDS[:args.keywords]], server, args.repeat)
+    finally:
+        server.block_rate = 0.0
+        block_detection.reset_circuit_breakers()
+
+
+def crawl_with_nodes(nodes, keywords, ranks):
+    # Coordinator enqueues, then `nodes` worker processes drain the queue file,
+    # as separate machines would (each with its own per-host throttle)
+    queue_path = os.path.join(tempfile.mkdtemp(prefix="bench_crawl_"), "queue.db")
+    queue = WorkQueue(queue_path)
+    crawl_node.enqueue_keywords(queue, "amazon", keywords, ranks)
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=crawl_node.run_workers, args=(queue_path, 1, f"node{i}")) for i in range(nodes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [row for _, rows in queue.results("search") for row in rows]
+
+
+@scenario("crawl_nodes")
+def bench_crawl_nodes(server, args):
+    keywords = [f"{KEYWORDS[i % len(KEYWORDS)]} {i}" for i in range(args.crawl_keywords)]
+
+    start = time.perf_counter()
+    crawl_with_nodes(1, keywords, args.ranks)
+    single = time.perf_counter() - start
+
+    metrics = measure([lambda: crawl_with_nodes(args.nodes, keywords, args.ranks)], server, args.repeat)
+    metrics["single_node_wall_s"] = round(single, 4)
+    metrics["speedup"] = round(single / (metrics["wall_s"] / args.repeat), 2)
+    return metrics
+
+
+@scenario("archive_reextract")
+def bench_archive_reextract(server, args):
+    # A run is archived once (searches, product pages and a batch ASIN
+    # lookup), then re-extracted from disk; requests stays 0 for the timed
+    # part. same_as_live: the keyword rows match the live run's, and batch
+    # searches came back as products rather than keywords.
+    archive = page_archive.enable(tempfile.mkdtemp(prefix="bench_archive_"))
+    live = {}
+    try:
+        for keyword in KEYWORDS[:args.keywords]:
+            live["amazon", keyword] = amazon_scraper.search(keyword, args.ranks)
+            live["flipkart", keyword] = flipkart_scraper.search(keyword, args.ranks)
+        for asin in AMAZON_ASINS[:args.products]:
+            product_info_fetcher.fetch_amazon_product_info(asin)
+        product_lookup.lookup_amazon_products(fixture_asins()[:args.products], product_lookup.SEARCH_RESULT_FIELDS)
+    finally:
+        page_archive.disable()
+    day_dir = archive.day_dir()
+
+    def reextract():
+        results = page_archive.reextract(day_dir, args.workers)
+        return [row for platform in results.values() for rows in platform["search"].values() for row in rows] + \
+            [info for platform in results.values() for info in platform["product"]]
+
+    metrics = measure([reextract], server, args.repeat)
+    results = page_archive.reextract(day_dir, 1)
+    metrics["same_as_live"] = all(
+        [row["asin" if platform == "amazon" else "product_id"] for row in results[platform]["search"].get(keyword, [])] ==
+        [row["asin" if platform == "amazon" else "product_id"] for row in rows] for (platform, keyword), rows in live.items()) \
+        and len(results["amazon"]["search"]) == args.keywords \
+        and len(results["amazon"]["product"]) == args.products * 2
+    entries = list(page_archive.iter_index(day_dir))
+    unique = {entry["sha256"] for entry in entries}
+    metrics["pages"] = len(entries)
+    metrics["unique_pages"] = len(unique)
+    metrics["raw_kb"] = round(sum(entry["bytes"] for entry in entries) / 1024, 1)
+    metrics["archive_kb"] = round(sum(os.path.getsize(page_archive.find_object(day_dir, digest)) for digest in unique) / 1024, 1)
+    return metrics
+
+
+LOG_OVERHEAD_BUDGET = 0.05  # share of parse/process time logging may add at the default level
+
+
+def logged_time(calls, rounds, configure=None):
+    # Seconds for rounds passes over calls with logging set up by configure
+    # (None = logging off). Queued records are written out before the clock stops.
+    previous = logging.root.manager.disable
+    handler = None
+    logging.disable(logging.NOTSET if configure else logging.CRITICAL)
+    gc.collect()
+    try:
+        start = time.perf_counter()
+        handler = configure() if configure else None
+        for _ in range(rounds):
+            for call in calls:
+                call()
+        log_setup.stop_logging()
+        if isinstance(handler, logging.Handler):
+            handler.flush()
+        return time.perf_counter() - start
+    finally:
+        log_setup.stop_logging()
+        if isinstance(handler, logging.Handler):
+            logging.root.removeHandler(handler)
+        logging.root.setLevel(logging.WARNING)
+        logging.disable(previous)
+
+
+@scenario("logging_overhead")
+def bench_logging_overhead(server, args):
+    # Search result pages processed with logging off, with the old setup
+    # (root at DEBUG, written synchronously: what amazon_scraper's import-time
+    # basicConfig did), and with log_setup at INFO and at DEBUG. Output goes
+    # to os.devnull; overhead_* are relative to logging off.
+    devnull = open(os.devnull, "w")
+    amazon_soups = [amazon_scraper.parse_search_page([stub_server.load_fixture(f"amazon_search_p{page}.html")])
+                    for page in range(1, stub_server.AMAZON_SEARCH_PAGES + 1)]
+    flipkart_soups = [flipkart_scraper.parse_search_page([stub_server.load_fixture(f"flipkart_search_p{page}.html")])
+                      for page in range(1, stub_server.FLIPKART_SEARCH_PAGES + 1)]
+    calls = [lambda soup=soup: amazon_scraper.process_amazon_data([soup], 100) for soup in amazon_soups] + \
+        [lambda soup=soup: flipkart_scraper.process_flipkart_data([soup], 100) for soup in flipkart_soups]
+
+    def synchronous():
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(logging.Formatter(log_setup.LOG_FORMAT))
+        logging.root.addHandler(handler)
+        logging.root.setLevel(logging.DEBUG)
+        return handler
+
+    setups = {
+        "off": None,
+        "sync_debug": synchronous,
+        "queue_info": lambda: log_setup.setup_logging(logging.INFO, devnull),
+        "queue_debug": lambda: log_setup.setup_logging(logging.DEBUG, devnull),
+    }
+    try:
+        for call in calls:
+            call()
+        metrics = measure(calls * args.parse_rounds, server, args.repeat)
+        # Setups take turns, best of five each, so drift on the machine hits all alike
+        best = {}
+        for _ in range(5):
+            for name, configure in setups.items():
+                elapsed = logged_time(calls, args.parse_rounds, configure)
+                best[name] = min(elapsed, best.get(name, elapsed))
+        for name in list(setups)[1:]:
+            metrics[f"overhead_{name}_pct"] = round((best[name] / best["off"] - 1) * 100, 1)
+    finally:
+        devnull.close()
+    metrics["within_budget"] = metrics["overhead_queue_info_pct"] <= LOG_OVERHEAD_BUDGET * 100
+    return metrics
+
+
+PROFILE_OVERHEAD_BUDGET = 0.05  # share of a run's wall time the sampling profiler may add
+
+
+@scenario("profiling_overhead")
+def bench_profiling_overhead(server, args):
+    # A small rank run end to end (searches, product pages, Excel export)
+    # with and without the sampling profiler, best of three each in turns.
+    # stage_*_pct is where the profiled run's busy time went.
+    out_dir = tempfile.mkdtemp(prefix="bench_profile_")
+    keywords = KEYWORDS[:args.keywords]
+    asins = AMAZON_ASINS[:args.products]
+
+    def run():
+        results = {keyword: amazon_scraper.search(keyword, args.ranks) for keyword in keywords}
+        products = [product_info_fetcher.fetch_amazon_product_info(asin) for asin in asins]
+        export_to_excel(results, os.path.join(out_dir, "rank.xlsx"), "Amazon")
+        export_to_excel({"product": [product for product in products if product]},
+                        os.path.join(out_dir, "product.xlsx"), "Amazon")
+        return [row for rows in results.values() for row in rows] + products
+
+    metrics = measure([run], server, args.repeat)
+    best = {}
+    profiler = None
+    for _ in range(3):
+        for name in ("off", "on"):
+            gc.collect()
+            start = time.perf_counter()
+            if name == "on":
+                # The stand-in server runs in this process: its threads are not the app's
+                with profiling.SamplingProfiler(exclude_targets={"serve_forever", "process_request_thread"}) as profiler:
+                    run()
+            else:
+                run()
+            elapsed = time.perf_counter() - start
+            best[name] = min(elapsed, best.get(name, elapsed))
+    metrics["overhead_pct"] = round((best["on"] / best["off"] - 1) * 100, 1)
+    metrics["within_budget"] = metrics["overhead_pct"] <= PROFILE_OVERHEAD_BUDGET * 100
+    metrics["samples"] = profiler.sample_count
+    totals = profiler.stage_totals()
+    busy = sum(seconds for stage, seconds in totals.items() if stage != "idle")
+    for stage in profiling.STAGES:
+        metrics[f"stage_{stage}_pct"] = round(totals.get(stage, 0.0) / busy * 100, 1) if busy else 0.0
+    collapsed_path, _ = profiler.write(os.path.join(out_dir, "run"))
+    metrics["collapsed_lines"] = sum(1 for _ in open(collapsed_path))
+    # The bench run has no uploads: check attribution on stand-in stacks
+    upload_stack = synthetic_stack([("/lib/python3/ssl.py", "recv_into"), ("/lib/python3/http/client.py", "read"),
+                                    ("/site-packages/httplib2/__init__.py", "request"),
+                                    ("/site-packages/googleapiclient/http.py", "execute"),
+                                    (os.path.join(ROOT, "sheets_sync.py"), "append_results")])
+    fetch_stack = synthetic_stack([("/lib/python3/ssl.py", "recv_into"), ("/lib/python3/http/client.py", "read"),
+                                   ("/site-packages/urllib3/connectionpool.py", "urlopen"),
+                                   ("/site-packages/requests/sessions.py", "get"),
+                                   (os.path.join(ROOT, "http_client.py"), "open_request"),
+                                   (os.path.join(ROOT, "amazon_scraper.py"), "fetch_search_page")])
+    metrics["upload_stack_attributed"] = profiler.stack_stage(upload_stack) == "upload"
+    metrics["fetch_stack_attributed"] = profiler.stack_stage(fetch_stack) == "fetch"
+    return metrics
+
+
+def synthetic_stack(frames):
+    # Code objects standing in for a live stack, leaf first: (file path, function name)
+    codes = []
+    for path, name in frames:
+        namespace = {}
+        exec(compile(f"def {name}(): pass", path, "exec"), namespace)
+        codes.append(namespace[name].__code__)
+    return tuple(codes)
+
+
+def synthetic_rank_history(keywords, days, ranks, seed=5):
+    # keywords x days x ranks rows, built straight as columns: each keyword
+    # draws from its own pool of 60 products (pools overlap between
+    # keywords), reshuffled a little every day; 15% of slots are sponsored
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    catalogue = 20000
+    pool = 60
+    keyword_codes = np.repeat(np.arange(keywords, dtype=np.int32), days * ranks)
+    day_codes = np.tile(np.repeat(np.arange(days, dtype=np.int32), ranks), keywords)
+    rank = np.tile(np.arange(1, ranks + 1, dtype=np.int16), keywords * days)
+    shift = np.repeat(rng.integers(0, pool, keywords * days), ranks)
+    local = (rank - 1 + shift + rng.integers(0, 3, len(rank))) % pool
+    product_codes = ((keyword_codes.astype(np.int64) * 37 + local) % catalogue).astype(np.int32)
+    dates = pd.date_range("2024-01-01", periods=days).date
+    return rank_analytics.build_frame(
+        pd.Categorical.from_codes(day_codes, dates),
+        pd.Categorical.from_codes(np.zeros(len(rank), dtype=np.int8), ["Amazon"]),
+        pd.Categorical.from_codes(keyword_codes, [f"keyword {i}" for i in range(keywords)]),
+        pd.Categorical.from_codes(product_codes, [f"B0SYNTH{i:05d}" for i in range(catalogue)]),
+        rank,
+        (rng.random(len(rank)) < 0.15).astype(np.int8),
+    )
+
+
+@scenario("rank_analytics")
+def bench_rank_analytics(server, args):
+    # A year of rank history (--analytics-keywords keywords x 365 days x
+    # --ranks results): time for the per-keyword metrics pass, plus the
+    # keyword x product pass and a pass restricted to 50 of "our" products.
+    # build_s is turning the columns into the frame, done once per load.
+    start = time.perf_counter()
+    frame = synthetic_rank_history(args.analytics_keywords, 365, args.ranks)
+    build = time.perf_counter() - start
+    ours = list(frame["product"].cat.categories[:50])
+
+    metrics = measure([lambda: rank_analytics.keyword_metrics(frame)["keyword"].tolist()], server, args.repeat)
+    timings = {}
+    for name, call in (("pair_metrics_s", lambda: rank_analytics.pair_metrics(frame)),
+                       ("own_products_s", lambda: rank_analytics.keyword_metrics(frame, ours))):
+        start = time.perf_counter()
+        call()
+        timings[name] = round(time.perf_counter() - start, 4)
+    metrics["rows"] = len(frame)
+    metrics["frame_mb"] = round(frame.memory_usage(deep=False).sum() / 2 ** 20, 1)
+    metrics["build_s"] = round(build, 4)
+    metrics.update(timings)
+    return metrics
+
+
+def simulated_changes(rates, days, seed=7):
+    # Poisson price changes per product over the simulated period
+    rng = random.Random(seed)
+    changes = []
+    for rate in rates:
+        times, t = [], rng.expovariate(rate)
+        while t < days * watchlist.DAY:
+            times.append(t)
+            t += rng.expovariate(rate)
+        changes.append(times)
+    return changes
+
+
+def staleness(changes, polls, end):
+    # Seconds a product showed an outdated price (a change not yet polled)
+    # and the number of changes overwritten before any poll saw them
+    stale, missed = 0.0, 0
+    polls = sorted(polls) + [end]
+    index = 0
+    for poll in polls:
+        first = None
+        while index < len(changes) and changes[index] < poll:
+            first = changes[index] if first is None else first
+            missed += first != changes[index]
+            index += 1
+        if first is not None:
+            stale += poll - first
+    return stale, missed
+
+
+@scenario("watchlist_freshness")
+def bench_watchlist_freshness(server, args):
+    # Simulated two weeks of a watchlist where most prices sit still and a few
+    # move several times a day: every product polled on the same interval
+    # versus the watchlist scheduler on --watch-budget of those requests.
+    # stale_pct is the share of product-time spent showing an outdated price,
+    # volatile_stale_pct the same for products changing at least daily.
+    rng = random.Random(3)
+    products = args.watch_products
+    rates = [rng.choice([1 / 21, 1 / 14, 1 / 7] * 6 + [1, 2] * 2 + [6, 8]) / watchlist.DAY for _ in range(products)]
+    days = 14
+    end = days * watchlist.DAY
+    changes = simulated_changes(rates, days)
+    uniform_budget = products * 4
+
+    def price_at(index, now):
+        return {"price": str(sum(t <= now for t in changes[index])), "In Stock": "In Stock", "BestSeller": "N/A"}
+
+    def uniform():
+        interval = watchlist.DAY * products / uniform_budget
+        return [[offset + k * interval for k in range(int((end - offset) // interval) + 1)]
+                for offset in (interval * i / products for i in range(products))]
+
+    def scheduled():
+        asins = [f"B0WATCH{i:03d}" for i in range(products)]
+        clock = {"now": 0.0}
+        listed = watchlist.Watchlist(None, int(uniform_budget * args.watch_budget), changes_path=None,
+                                     fetch=lambda asin: price_at(asins.index(asin), clock["now"]))
+        listed.add(asins, now=0.0)
+        polls = [[] for _ in asins]
+        while True:
+            clock["now"] = min(item["next_poll"] for item in listed.items.values())
+            if listed.budget_left(clock["now"]) <= 0:
+                clock["now"] = max(clock["now"], listed.sent[0] + watchlist.DAY + 1)
+            if clock["now"] >= end:
+                break
+            for asin in listed.run_once(clock["now"]):
+                polls[asins.index(asin)].append(clock["now"])
+        return polls
+
+    results = {}
+    for name, run in (("uniform", uniform), ("watchlist", scheduled)):
+        start = time.perf_counter()
+        polls = run()
+        elapsed = time.perf_counter() - start
+        totals = [staleness(changes[i], polls[i], end) for i in range(products)]
+        volatile = [i for i in range(products) if rates[i] * watchlist.DAY >= 1]
+        results[name] = {
+            "polls_per_day": round(sum(len(p) for p in polls) / days),
+            "stale_pct": round(sum(stale for stale, _ in totals) / (products * end) * 100, 2),
+            "volatile_stale_pct": round(sum(totals[i][0] for i in volatile) / (len(volatile) * end) * 100, 2),
+            "missed_changes": sum(missed for _, missed in totals),
+            "sim_s": round(elapsed, 3),
+        }
+    metrics = {"calls": products, "items": products, "wall_s": results["watchlist"]["sim_s"],
+               "throughput_items_per_s": round(products / results["watchlist"]["sim_s"], 2),
+               "requests": 0, "peak_memory_kb": 0.0, "true_changes": sum(len(c) for c in changes)}
+    for name, result in results.items():
+        metrics.update({f"{name}_{key}": value for key, value in result.items()})
+    return metrics
+
+
+def google_service(api, version, root_url):
+    # A Google API client that talks to the stand-in server, without
+    # credentials. rootUrl rather than api_endpoint, which uploads ignore.
+    import httplib2
+    from googleapiclient.discovery import build_from_document
+    from drive_client import drive_client_cache
+    document = dict(drive_client_cache.discovery_document(api, version), rootUrl=root_url)
+    document["baseUrl"] = root_url + document["servicePath"]
+    return build_from_document(document, http=httplib2.Http())
+
+
+def upload_csv(service, rows, file_name, folder_id):
+    # The per-keyword CSV upload the cloud save did before (main2.save_to_drive_csv,
+    # without its half-second pause)
+    import csv
+    from googleapiclient.http import MediaFileUpload
+    with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".csv", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+        writer.writeheader()
+        writer.writerows(rows)
+    try:
+        media = MediaFileUpload(f.name, resumable=True, mimetype="text/csv")
+        service.files().create(body={"name": file_name, "parents": [folder_id]}, media_body=media, fields="id").execute()
+    finally:
+        os.unlink(f.name)
+
+
+@scenario("sheets_sync")
+def bench_sheets_sync(server, args):
+    # --sheets-saves cloud saves of --crawl-keywords keywords (--ranks rows
+    # each) spread over the four keyword groups, against a stand-in for the
+    # Drive and Sheets APIs: a CSV upload per keyword versus one batched
+    # append per group spreadsheet. Requests and wall time per save.
+    google = GoogleStubServer(latency=args.latency).start()
+    drive = google_service("drive", "v3", f"{google.base_url}/")
+    sheets = google_service("sheets", "v4", f"{google.base_url}/")
+    groups = ["rank_fetcher", "generic", "branded", "competition"]
+    keywords = [f"{KEYWORDS[i % len(KEYWORDS)]} {i}" for i in range(args.crawl_keywords)]
+    results = {keyword: [{"rank": rank, "asin": f"B0SHEET{rank:03d}", "title": f"Product {rank}", "price": 499.0 + rank,
+                          "rating": 4.2, "reviews": 1200 + rank, "type": "Organic", "link": f"/dp/B0SHEET{rank:03d}",
+                          "BestSeller": "No", "In Stock": "Yes"} for rank in range(1, args.ranks + 1)]
+               for keyword in keywords}
+    state = tempfile.NamedTemporaryFile(suffix=".json", delete=False).name
+    os.unlink(state)
+    sync = sheets_sync.SheetsSync(state_path=state)
+
+    def save_csv():
+        for i, (keyword, rows) in enumerate(results.items()):
+            upload_csv(drive, rows, f"{keyword} - {time.strftime('%H:%M - %d/%m/%y')}.csv", f"folder-{groups[i % 4]}")
+
+    def save_sheets():
+        by_group = {}
+        for i, (keyword, rows) in enumerate(results.items()):
+            by_group.setdefault(groups[i % 4], {})[keyword] = rows
+        for group, group_results in by_group.items():
+            sync.append_results(sheets, drive, group_results, "Amazon", f"folder-{group}", f"Amazon {group} ranks")
+
+    metrics = {}
+    try:
+        for name, save in (("csv", save_csv), ("sheets", save_sheets)):
+            google.reset_stats()
+            start = time.perf_counter()
+            for _ in range(args.sheets_saves):
+                save()
+            wall = time.perf_counter() - start
+            metrics[f"{name}_requests_per_save"] = round(google.request_count / args.sheets_saves, 1)
+            metrics[f"{name}_s_per_save"] = round(wall / args.sheets_saves, 4)
+            metrics[f"{name}_kb_sent_per_save"] = round(google.bytes_received / args.sheets_saves / 1024, 1)
+        appended = sum(google.rows(f"Amazon {group} ranks").get(keyword, 0) for group in groups for keyword in keywords)
+        metrics["sheet_rows"] = appended
+        metrics["rows_complete"] = appended == args.sheets_saves * args.crawl_keywords * args.ranks + args.crawl_keywords
+        # Target rank runs of both platforms stay on CSV, plain searches don't
+        metrics["target_ranks_kept_off"] = (
+            sheets_sync.has_target_ranks({"k": [amazon_scraper.new_target_entry("k", "B0SHEET001", "t")]})
+            and sheets_sync.has_target_ranks({"k": [flipkart_scraper.new_target_entry("k", "PID", "t", 3, 1)]})
+            and not sheets_sync.has_target_ranks(results))
+    finally:
+        google.stop()
+        if os.path.exists(state):
+            os.unlink(state)
+    return metrics
+
+
+@scenario("http2_transport")
+def bench_http2_transport(server, args):
+    # Searches (PARALLEL_PAGES pages at once) and product pages on four
+    # threads over HTTP/1.1 (requests) against a stub server, then over
+    # HTTP/2 (httpx) against a stand-in serving the same pages. Every new
+    # connection costs --handshake seconds (TCP + TLS round trips). A search
+    # that stops reading early has to drop its HTTP/1.1 connection, but only
+    # resets its stream on HTTP/2. h2 pages are br encoded when brotli is there.
+    from concurrent.futures import ThreadPoolExecutor
+
+    def run():
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            products = list(pool.map(product_info_fetcher.fetch_amazon_product_info, AMAZON_ASINS[:args.products]))
+        rows = [row for keyword in KEYWORDS[:args.keywords] for row in amazon_scraper.search(keyword, args.ranks)]
+        return rows + [product for product in products if product]
+
+    metrics = {}
+    h1_server = StubServer(latency=args.latency, gzip=not args.no_gzip, handshake=args.handshake).start()
+    h2_server = H2StubServer(latency=args.latency, gzip=not args.no_gzip, handshake=args.handshake).start()
+    try:
+        for name, target in (("http1", h1_server), ("http2", h2_server)):
+            point_scrapers_at(target.base_url)
+            http_client.HTTP2_CLEARTEXT = name == "http2"
+            http_client.set_transport(name)
+            result = measure([run], target, args.repeat)
+            metrics[f"{name}_wall_s"] = result["wall_s"]
+            metrics[f"{name}_items"] = result["items"]
+            metrics[f"{name}_requests"] = result["requests"]
+            metrics[f"{name}_connections"] = target.connection_count
+            metrics[f"{name}_kb_received"] = round(result["bytes_received"] / 1024, 1)
+    finally:
+        http_client.set_transport("http1")
+        http_client.HTTP2_CLEARTEXT = False
+        point_scrapers_at(server.base_url)
+        h1_server.stop()
+        h2_server.stop()
+    metrics["accept_encoding"] = http_client.ACCEPT_ENCODING
+    metrics["speedup"] = round(metrics["http1_wall_s"] / metrics["http2_wall_s"], 2)
+    return metrics
+
+
+def unused_port_url():
+    # Nothing listens there: stands in for a proxy that has gone down
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+@scenario("proxy_pool")
+def bench_proxy_pool(server, args):
+    # Product pages through stand-in proxies (stub servers answering
+    # absolute-URL requests): two fast, one slow, one that only serves
+    # captcha pages and one that refuses connections. via_* is how many
+    # requests each proxy ended up carrying.
+    options = {"gzip": not args.no_gzip, "bandwidth": args.bandwidth}
+    proxies = {
+        "fast1": StubServer(latency=args.latency, **options).start(),
+        "fast2": StubServer(latency=args.latency, **options).start(),
+        "slow": StubServer(latency=args.latency + 1.0, **options).start(),
+        "blocked": StubServer(latency=args.latency, block_rate=1.0, **options).start(),
+    }
+    pool = proxy_pool.ProxyPool([proxy.base_url for proxy in proxies.values()] + [unused_port_url()], max_latency=0.5)
+    http_client.set_proxy_pool(pool)
+    try:
+        asins = AMAZON_ASINS[:args.products]
+        metrics = measure([lambda a=a: product_info_fetcher.fetch_amazon_product_info(a) for a in asins], server, args.repeat)
+    finally:
+        http_client.set_proxy_pool(None)
+        block_detection.reset_circuit_breakers()
+        for proxy in proxies.values():
+            proxy.stop()
+    metrics["requests"] = sum(proxy.request_count for proxy in proxies.values())
+    for name, proxy in proxies.items():
+        metrics[f"via_{name}"] = proxy.request_count
+    metrics["evictions"] = sum(stats["evictions"] for stats in pool.stats())
+    return metrics
+
+
+def register_parse_scenario(profile):
+    # Parse-only: recorded product pages fed in 16 KB chunks, no network.
+    # parsed_kb is how much of each page the profile had to read on average.
+    @scenario(f"parse_{profile}")
+    def bench_parse(server, args):
+        amazon_pages = [stub_server.load_fixture(name) for name in stub_server.AMAZON_DP_FIXTURES]
+        flipkart_page = stub_server.load_fixture("flipkart_product.html")
+        fed = []
+
+        def chunks(page):
+            for offset in range(0, len(page), 16384):
+                fed.append(len(page[offset:offset + 16384]))
+                yield page[offset:offset + 16384]
+
+        def parse_amazon(page):
+            soup = product_info_fetcher.parse_amazon_page(chunks(page), profile)
+            return product_info_fetcher.process_amazon_data(soup, "B0BENCH000", profile)
+
+        def parse_flipkart():
+            fed.append(len(flipkart_page))
+            soup = product_info_fetcher.parse_flipkart_page(flipkart_page, profile)
+            return product_info_fetcher.process_flipkart_data(soup, "https://www.flipkart.com/p/itmbench", profile)
+
+        calls = [lambda page=page: parse_amazon(page) for page in amazon_pages] + [parse_flipkart]
+        for call in calls:
+            call()
+        parsed_kb = round(sum(fed) / len(calls) / 1024, 1)
+
+        metrics = measure(calls * args.parse_rounds, server, args.repeat)
+        metrics["parsed_kb"] = parsed_kb
+        return metrics
+    return bench_parse
+
+
+@scenario("parse_whole_page")
+def bench_parse_whole_page(server, args):
+    # Reference point: the same pages parsed into a full tree, as before profiles
+    from bs4 import BeautifulSoup
+    amazon_pages = [stub_server.load_fixture(name) for name in stub_server.AMAZON_DP_FIXTURES]
+    flipkart_page = stub_server.load_fixture("flipkart_product.html")
+    calls = [lambda page=page: product_info_fetcher.process_amazon_data(BeautifulSoup(page, "html.parser"), "B0BENCH000")
+             for page in amazon_pages]
+    calls.append(lambda: product_info_fetcher.process_flipkart_data(BeautifulSoup(flipkart_page, "lxml"), "https://www.flipkart.com/p/itmbench"))
+    metrics = measure(calls * args.parse_rounds, server, args.repeat)
+    metrics["parsed_kb"] = round((sum(len(page) for page in amazon_pages) + len(flipkart_page)) / len(calls) / 1024, 1)
+    return metrics
+
+
+for profile_name in product_info_fetcher.FETCH_PROFILES:
+    register_parse_scenario(profile_name)
+
+
+def compare(current, baseline, tolerance):
+    regressions = []
+    for name, metrics in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if metrics["throughput_items_per_s"] < base["throughput_items_per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {metrics['throughput_items_per_s']} < baseline {base['throughput_items_per_s']}")
+        if metrics["peak_memory_kb"] > base["peak_memory_kb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory {metrics['peak_memory_kb']} KB > baseline {base['peak_memory_kb']} KB")
+        if metrics["requests"] > base["requests"]:
+            regressions.append(f"{name}: {metrics['requests']} requests > baseline {base['requests']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline scraper/export benchmarks")
+    parser.add_argument("--only", nargs="*", choices=sorted(SCENARIOS), help="scenarios to run (default: all)")
+    parser.add_argument("--latency", type=float, default=0.05, help="stand-in server latency per response (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency per response (s)")
+    parser.add_argument("--bandwidth", type=int, default=0, help="stand-in server bytes/s per response (0 = unlimited)")
+    parser.add_argument("--handshake", type=float, default=0.1, help="seconds a new connection costs in http2_transport")
+    parser.add_argument("--no-gzip", action="store_true", help="serve uncompressed pages")
+    parser.add_argument("--keywords", type=int, default=4, help="keywords per search scenario")
+    parser.add_argument("--ranks", type=int, default=50, help="num_products per search")
+    parser.add_argument("--products", type=int, default=12, help="products per product-info scenario")
+    parser.add_argument("--parse-rounds", type=int, default=20, help="passes over the recorded pages in parse scenarios")
+    parser.add_argument("--export-keywords", type=int, default=20, help="keyword sheets in the export scenario")
+    parser.add_argument("--parallel-keywords", type=int, default=100, help="keyword sheets in the parallel export scenario")
+    parser.add_argument("--catalog", type=int, default=300, help="ASINs in the sharded_lookup scenario")
+    parser.add_argument("--crawl-keywords", type=int, default=16, help="keyword tasks in the crawl_nodes scenario")
+    parser.add_argument("--nodes", type=int, default=4, help="worker processes in the crawl_nodes scenario")
+    parser.add_argument("--analytics-keywords", type=int, default=1000, help="keywords in the rank_analytics year of history")
+    parser.add_argument("--sheets-saves", type=int, default=5, help="cloud saves in the sheets_sync scenario")
+    parser.add_argument("--watch-products", type=int, default=200, help="products in the watchlist_freshness simulation")
+    parser.add_argument("--watch-budget", type=float, default=0.75, help="watchlist requests as a share of uniform polling's")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for parallel scenarios (default: CPU count)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--save", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown vs baseline")
+    parser.add_argument("--verbose", action="store_true", help="keep scraper logging enabled")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    server = StubServer(latency=args.latency, jitter=args.jitter, bandwidth=args.bandwidth,
+                        gzip=not args.no_gzip).start()
+    point_scrapers_at(server.base_url)
+
+    results = {}
+    try:
+        for name in args.only or SCENARIOS:
+            results[name] = SCENARIOS[name](server, args)
+            print(f"{name:<24} " + "  ".join(f"{k}={v}" for k, v in results[name].items()))
+    finally:
+        server.stop()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
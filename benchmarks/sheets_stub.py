@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+
+SPREADSHEET_MIME = "application/vnd.google-apps.spreadsheet"
+
+
+class GoogleStubHandler(BaseHTTPRequestHandler):
+    # The handful of Drive v3 and Sheets v4 calls the app makes: file
+    # list/create, resumable CSV upload, spreadsheet get and batchUpdate.
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.handle_call("GET")
+
+    def do_POST(self):
+        self.handle_call("POST")
+
+    def do_PUT(self):
+        self.handle_call("PUT")
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_call(self, method):
+        server = self.server
+        parts = urlsplit(self.path)
+        path = unquote(parts.path)
+        query = parse_qs(parts.query)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if server.latency:
+            time.sleep(server.latency)
+
+        with server.lock:
+            server.request_count += 1
+            server.bytes_received += len(body)
+            status, payload, headers = self.route(method, path, query, body)
+
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def route(self, method, path, query, body):
+        server = self.server
+        if path == "/drive/v3/files" and method == "GET":
+            return 200, {"files": server.find_files(query.get("q", [""])[0])}, {}
+        if path == "/drive/v3/files" and method == "POST":
+            return 200, {"id": server.create_file(json.loads(body or b"{}"))}, {}
+        if path == "/upload/drive/v3/files" and method == "POST":
+            upload_id = uuid.uuid4().hex
+            server.uploads[upload_id] = json.loads(body or b"{}")
+            location = f"{server.base_url}/upload/drive/v3/files?uploadType=resumable&upload_id={upload_id}"
+            return 200, {}, {"Location": location}
+        if path == "/upload/drive/v3/files" and method == "PUT":
+            metadata = server.uploads.pop(query.get("upload_id", [""])[0], None)
+            if metadata is None:
+                return 404, error(404, "Upload session not found"), {}
+            return 200, {"id": server.create_file(metadata, content=body)}, {}
+        if path.startswith("/v4/spreadsheets/"):
+            spreadsheet_id, _, action = path[len("/v4/spreadsheets/"):].partition(":")
+            spreadsheet = server.files.get(spreadsheet_id)
+            if spreadsheet is None or spreadsheet.get("mimeType") != SPREADSHEET_MIME:
+                return 404, error(404, "Requested entity was not found."), {}
+            if method == "GET" and not action:
+                return 200, {"spreadsheetId": spreadsheet_id, "sheets": [
+                    {"properties": {"sheetId": sheet_id, "title": sheet["title"]}}
+                    for sheet_id, sheet in spreadsheet["sheets"].items()]}, {}
+            if method == "POST" and action == "batchUpdate":
+                return server.batch_update(spreadsheet, json.loads(body))
+        return 404, error(404, f"No stand-in for {method} {path}"), {}
+
+
+def error(code, message):
+    return {"error": {"code": code, "message": message}}
+
+
+class GoogleStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0):
+        super().__init__(address, GoogleStubHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.files = {}
+        self.uploads = {}
+        self.request_count = 0
+        self.bytes_received = 0
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def reset_stats(self):
+        with self.lock:
+            self.request_count = 0
+            self.bytes_received = 0
+
+    def create_file(self, metadata, content=None):
+        file_id = uuid.uuid4().hex
+        entry = {"name": metadata.get("name"), "parents": metadata.get("parents", []),
+                 "mimeType": metadata.get("mimeType"), "content": content}
+        if entry["mimeType"] == SPREADSHEET_MIME:
+            entry["sheets"] = {0: {"title": "Sheet1", "rows": []}}
+        self.files[file_id] = entry
+        return file_id
+
+    def find_files(self, q):
+        # Only the "name = '...' and '...' in parents and mimeType = '...'" form;
+        # nothing is ever trashed here
+        terms = dict(term.split(" = ", 1) for term in q.split(" and ") if " = " in term)
+        terms.pop("trashed", None)
+        parents = [term.split("'")[1] for term in q.split(" and ") if term.endswith(" in parents")]
+        return [{"id": file_id} for file_id, entry in self.files.items()
+                if all(entry.get(key) == value.strip("'") for key, value in terms.items())
+                and all(parent in entry["parents"] for parent in parents)]
+
+    def batch_update(self, spreadsheet, body):
+        # All or nothing, like the real API
+        sheets = {sheet_id: dict(sheet, rows=list(sheet["rows"])) for sheet_id, sheet in spreadsheet["sheets"].items()}
+        for request in body.get("requests", []):
+            if "addSheet" in request:
+                properties = request["addSheet"]["properties"]
+                sheet_id = properties.get("sheetId", max(sheets, default=0) + 1)
+                if sheet_id in sheets or any(sheet["title"] == properties["title"] for sheet in sheets.values()):
+                    return 400, error(400, f"A sheet with the name \"{properties['title']}\" already exists."), {}
+                sheets[sheet_id] = {"title": properties["title"], "rows": []}
+            elif "appendCells" in request:
+                sheet = sheets.get(request["appendCells"]["sheetId"])
+                if sheet is None:
+                    return 400, error(400, f"No grid with id: {request['appendCells']['sheetId']}"), {}
+                sheet["rows"].extend(request["appendCells"]["rows"])
+            elif "deleteSheet" in request:
+                if sheets.pop(request["deleteSheet"]["sheetId"], None) is None or not sheets:
+                    return 400, error(400, "Invalid deleteSheet request"), {}
+            else:
+                return 400, error(400, f"Unsupported request {list(request)}"), {}
+        spreadsheet["sheets"] = sheets
+        return 200, {"replies": [{} for _ in body.get("requests", [])]}, {}
+
+    def rows(self, title):
+        # Data rows per tab of the spreadsheet with this name
+        for entry in self.files.values():
+            if entry["name"] == title and entry.get("sheets"):
+                return {sheet["title"]: len(sheet["rows"]) for sheet in entry["sheets"].values()}
+        return {}
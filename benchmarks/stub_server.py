@@ -0,0 +1,175 @@
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+AMAZON_SEARCH_PAGES = 5
+FLIPKART_SEARCH_PAGES = 5
+SEND_CHUNK_SIZE = 8192
+AMAZON_DP_FIXTURES = ["amazon_dp_bullets.html", "amazon_dp_table.html", "amazon_dp_unavailable.html"]
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), "rb") as f:
+        return f.read()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.stats_lock:
+            self.server.connection_count += 1
+        if self.server.handshake:
+            # Stands in for the TCP + TLS round trips of a new connection
+            time.sleep(self.server.handshake)
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+
+        with server.stats_lock:
+            server.request_count += 1
+
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+
+        body = self.route(parts.path, query)
+        if body is not None and server.block_rate and random.random() < server.block_rate:
+            body = self.blocked_page(parts.path)
+        if body is None:
+            self.send_error(404)
+            return
+
+        headers = {"Content-Type": "text/html; charset=utf-8"}
+        if server.gzip and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip_bytes(body)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        sent = 0
+        try:
+            # With a bandwidth cap the body trickles out in chunks, so a client
+            # that hangs up early really does stop the transfer.
+            chunk_size = SEND_CHUNK_SIZE if server.bandwidth else len(body)
+            for offset in range(0, len(body), chunk_size):
+                chunk = body[offset:offset + chunk_size]
+                self.wfile.write(chunk)
+                self.wfile.flush()
+                sent += len(chunk)
+                if server.bandwidth:
+                    time.sleep(len(chunk) / server.bandwidth)
+        except (BrokenPipeError, ConnectionResetError):
+            # Clients are allowed to hang up early once they have what they need
+            self.close_connection = True
+        with server.stats_lock:
+            server.bytes_sent += sent
+
+    def route(self, path, query):
+        return route_fixture(self.server.fixtures, path, query)
+
+    def blocked_page(self, path):
+        if path == "/search" or "/p/" in path:
+            return self.server.fixtures["flipkart_blocked.html"]
+        return self.server.fixtures["amazon_captcha.html"]
+
+    def log_message(self, format, *args):
+        pass
+
+
+def route_fixture(fixtures, path, query):
+    if path == "/s":
+        page = int(query.get("page", ["1"])[0])
+        if 1 <= page <= AMAZON_SEARCH_PAGES:
+            return fixtures[f"amazon_search_p{page}.html"]
+    elif path.startswith("/dp/") or path.startswith("/gp/product/"):
+        asin = path.rstrip("/").split("/")[-1]
+        return fixtures[AMAZON_DP_FIXTURES[zlib.crc32(asin.encode()) % len(AMAZON_DP_FIXTURES)]]
+    elif path == "/search":
+        page = int(query.get("page", ["1"])[0])
+        if 1 <= page <= FLIPKART_SEARCH_PAGES:
+            return fixtures[f"flipkart_search_p{page}.html"]
+    elif "/p/" in path:
+        return fixtures["flipkart_product.html"]
+    return None
+
+
+def gzip_bytes(body):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, jitter=0.0, gzip=True, block_rate=0.0, bandwidth=0,
+                 handshake=0.0):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.handshake = handshake
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.block_rate = block_rate
+        self.gzip = gzip
+        self.fixtures = {name: load_fixture(name) for name in os.listdir(FIXTURES_DIR) if name.endswith(".html")}
+        self.stats_lock = threading.Lock()
+        self.request_count = 0
+        self.bytes_sent = 0
+        self.connection_count = 0
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # Streaming clients close connections mid-response on purpose
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.request_count = 0
+            self.bytes_sent = 0
+            self.connection_count = 0
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay recorded Amazon/Flipkart pages over HTTP")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, 0..jitter seconds")
+    parser.add_argument("--block-rate", type=float, default=0.0, help="fraction of responses replaced by a captcha page")
+    parser.add_argument("--bandwidth", type=int, default=0, help="bytes per second per response (0 = unlimited)")
+    args = parser.parse_args()
+
+    server = StubServer(("127.0.0.1", args.port), latency=args.latency, jitter=args.jitter, block_rate=args.block_rate,
+                        bandwidth=args.bandwidth)
+    print(f"Serving fixtures on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Status codes Amazon/Flipkart use when throttling or blocking a client
+BLOCK_STATUS_CODES = {403, 429, 503, 529}
+
+# Markers of robot-check / captcha interstitials. They sit near the top of
+# those (small) pages, so only the first BLOCK_SCAN_BYTES of a body are scanned.
+BLOCK_SIGNATURES = [
+    b"/errors/validateCaptcha",
+    b"Enter the characters you see below",
+    b"To discuss automated access to Amazon data",
+    b"api-services-support@amazon.com",
+    b"www.google.com/recaptcha",
+    b"Are you a human?",
+    b"Site is overloaded",
+]
+BLOCK_SCAN_BYTES = 65536
+
+class BlockedPageError(Exception):
+    pass
+
+class CircuitOpenError(BlockedPageError):
+    pass
+
+def detect_block(status_code, body):
+    if status_code in BLOCK_STATUS_CODES:
+        return f"HTTP {status_code}"
+    head = body[:BLOCK_SCAN_BYTES] if body else b""
+    for signature in BLOCK_SIGNATURES:
+        if signature in head:
+            return f"block page marker {signature.decode()!r}"
+    return None
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, host, window=20, min_requests=4, slow_threshold=0.2, open_threshold=0.5,
+                 slow_delay=5.0, cooldown=60.0, max_cooldown=900.0, max_wait=120.0):
+        self.host = host
+        self.window = deque(maxlen=window)
+        self.min_requests = min_requests
+        self.slow_threshold = slow_threshold
+        self.open_threshold = open_threshold
+        self.slow_delay = slow_delay
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_wait = max_wait
+        self.state = self.CLOSED
+        self.open_until = 0.0
+        self.probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def block_rate(self):
+        if len(self.window) < self.min_requests:
+            return 0.0
+        return sum(self.window) / len(self.window)
+
+    def before_request(self):
+        # Blocks the calling worker while the host is cooling down. Waits longer
+        # than max_wait fail fast instead of stalling the whole run.
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self.state == self.OPEN and now >= self.open_until:
+                    self.state = self.HALF_OPEN
+                    self.probe_in_flight = False
+
+                if self.state == self.CLOSED:
+                    wait = self.slow_delay if self.block_rate() >= self.slow_threshold else 0.0
+                    if not wait:
+                        return
+                    logger.warning(f"{self.host}: block rate {self.block_rate():.0%}, slowing requests by {wait}s")
+                    break
+                elif self.state == self.HALF_OPEN:
+                    if not self.probe_in_flight:
+                        self.probe_in_flight = True
+                        logger.info(f"{self.host}: cooldown over, sending a probe request")
+                        return
+                    wait = 1.0
+                else:
+                    wait = self.open_until - now
+                    if wait > self.max_wait:
+                        raise CircuitOpenError(f"{self.host} is blocking requests, paused for another {wait:.0f}s")
+            time.sleep(wait)
+        time.sleep(wait)
+
+    def record(self, blocked):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if blocked:
+                    self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                    self._open()
+                else:
+                    logger.info(f"{self.host}: probe succeeded, resuming normal requests")
+                    self.state = self.CLOSED
+                    self.cooldown = self.base_cooldown
+                    self.window.clear()
+                return
+
+            self.window.append(1 if blocked else 0)
+            if self.state == self.CLOSED and self.block_rate() >= self.open_threshold:
+                self._open()
+
+    def abort_probe(self):
+        # A probe that failed for unrelated reasons (timeout, DNS...) lets the next request try
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.probe_in_flight = False
+
+    def _open(self):
+        self.state = self.OPEN
+        self.open_until = time.monotonic() + self.cooldown
+        self.probe_in_flight = False
+        logger.warning(f"{self.host}: too many blocked responses, pausing all requests for {self.cooldown:.0f}s")
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(host):
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host)
+        return breaker
+
+def reset_circuit_breakers():
+    with _breakers_lock:
+        _breakers.clear()
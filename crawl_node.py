@@ -0,0 +1,217 @@
+import argparse
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import amazon_scraper
+import flipkart_scraper
+import http_client
+import page_archive
+from export_utils import export_to_excel
+from identifiers import canonicalize
+from input_files import iter_file_values, unique_values
+from log_setup import setup_logging
+from product_info_fetcher import FETCH_PROFILES, fetch_amazon_product_info, fetch_flipkart_product_info
+from work_queue import DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS, WorkQueue
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 1  # longest an idle worker waits before asking the queue again
+PLATFORM_NAMES = {"amazon": "Amazon", "flipkart": "Flipkart"}
+
+def run_search(payload):
+    scraper = amazon_scraper if payload["platform"] == "amazon" else flipkart_scraper
+    if payload.get("targets"):
+        return scraper.find_target_ranks(payload["keyword"], payload["targets"], payload["ranking"])
+    return scraper.search(payload["keyword"], payload["ranking"])
+
+def run_product(payload):
+    if payload["platform"] == "amazon":
+        result = fetch_amazon_product_info(payload["product"], payload["profile"])
+    else:
+        result = fetch_flipkart_product_info(payload["product"], payload["profile"])
+    if result is None:
+        # The fetchers log and return None on failure; surface it so the task is retried
+        raise Exception(f"No product info for {payload['product']}")
+    return result
+
+TASK_HANDLERS = {
+    "search": run_search,
+    "product": run_product,
+}
+
+def enqueue_keywords(queue, platform, keywords, ranking, targets=None):
+    payloads = [{"platform": platform, "keyword": keyword, "ranking": ranking, "targets": targets or []}
+                for keyword in unique_values(keywords)]
+    return queue.enqueue("search", payloads)
+
+def enqueue_products(queue, platform, identifiers, profile="full"):
+    # Canonicalized first, so the same product pasted twice is one task
+    unique, _, stats = canonicalize(identifiers, PLATFORM_NAMES[platform])
+    if stats["invalid"]:
+        logger.warning(f"Skipped {stats['invalid']} lines that are not {PLATFORM_NAMES[platform]} products")
+    payloads = [{"platform": platform, "product": product, "profile": profile} for product in unique.values()]
+    return queue.enqueue("product", payloads)
+
+def run_worker(queue, worker_id, wait=False, kinds=None):
+    # Leases one task at a time until the queue is drained (or forever with
+    # wait=True). Returns the number of tasks completed.
+    completed = 0
+    while True:
+        tasks = queue.lease(worker_id, 1, kinds)
+        if not tasks:
+            ready_at = queue.next_ready_at()
+            if ready_at is None and not wait:
+                return completed
+            # Other nodes' tasks may still finish (or their leases expire):
+            # check back soon, or right when the next one is due
+            delay = POLL_INTERVAL if ready_at is None else ready_at - time.time()
+            time.sleep(min(max(delay, 0.05), POLL_INTERVAL))
+            continue
+
+        task = tasks[0]
+        logger.info(f"[{worker_id}] {task.kind} task {task.id} (attempt {task.attempts}): {task.payload}")
+        try:
+            with lease_heartbeat(queue, task.id, worker_id):
+                result = TASK_HANDLERS[task.kind](task.payload)
+        except Exception as e:
+            logger.error(f"[{worker_id}] Task {task.id} failed: {str(e)}")
+            queue.fail(task.id, worker_id, e)
+            continue
+        if queue.complete(task.id, worker_id, result):
+            completed += 1
+
+@contextmanager
+def lease_heartbeat(queue, task_id, worker_id):
+    # Renews the lease every third of its length while the task runs: a
+    # search held up by a circuit breaker cooldown and many pages can outlast
+    # one lease, and would otherwise be handed to a second worker
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(queue.lease_seconds / 3):
+                if not queue.renew(task_id, worker_id):
+                    logger.warning(f"[{worker_id}] Lost the lease on task {task_id}")
+                    return
+        except Exception as e:
+            logger.error(f"[{worker_id}] Error renewing the lease on task {task_id}: {str(e)}")
+        finally:
+            queue.close()  # the heartbeat thread's own connection
+
+    heartbeat = threading.Thread(target=beat, name=f"lease-{task_id}", daemon=True)
+    heartbeat.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        heartbeat.join()
+
+def run_workers(queue_path, threads=1, worker_name=None, wait=False, kinds=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+    # Several workers in one process share http_client's per-host throttle;
+    # more throughput comes from more nodes (separate machines / IPs).
+    worker_name = worker_name or f"{socket.gethostname()}-{os.getpid()}"
+    queue = WorkQueue(queue_path, lease_seconds=lease_seconds)
+    completed = []
+
+    def work(index):
+        completed.append(run_worker(WorkQueue(queue_path, lease_seconds=lease_seconds), f"{worker_name}-{index}", wait, kinds))
+
+    workers = [threading.Thread(target=work, args=(i,), daemon=True) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    logger.info(f"Worker {worker_name} finished {sum(completed)} tasks; queue: {queue.counts()}")
+    return sum(completed)
+
+def collect_results(queue, platform, kind):
+    # Rebuilds the dict shapes save_results / export_to_excel expect. Target
+    # rank searches go under 'target_ranks'; plain searches of the same queue
+    # stay keyword results beside them.
+    if kind == "product":
+        return {'product': [result for payload, result in queue.results("product") if payload["platform"] == platform]}
+
+    results = {}
+    target_results = {}
+    for payload, result in queue.results("search"):
+        if payload["platform"] == platform:
+            (target_results if payload.get("targets") else results)[payload["keyword"]] = result
+    if target_results:
+        results['target_ranks'] = target_results
+    return results
+
+def print_status(queue):
+    counts = queue.counts()
+    print("  ".join(f"{status}={count}" for status, count in counts.items()))
+    for kind, payload, error in queue.failures():
+        print(f"failed {kind}: {payload.get('keyword') or payload.get('product')}: {error}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Coordinator/worker mode: share scraping work between machines through one queue file")
+    parser.add_argument("--queue", default="crawl_queue.db", help="SQLite queue file every node opens")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="add keyword or product tasks (coordinator)")
+    enqueue.add_argument("platform", choices=sorted(PLATFORM_NAMES))
+    enqueue.add_argument("--keywords", help="txt/csv/xlsx file of keywords to rank")
+    enqueue.add_argument("--products", help="txt/csv/xlsx file of ASINs or product links")
+    enqueue.add_argument("--ranking", type=int, default=30, help="results per keyword")
+    enqueue.add_argument("--targets", help="comma separated ASINs/product IDs to find ranks for")
+    enqueue.add_argument("--profile", choices=list(FETCH_PROFILES), default="full", help="product fields to fetch")
+
+    work = commands.add_parser("work", help="lease and run tasks until the queue is drained (worker)")
+    work.add_argument("--threads", type=int, default=1)
+    work.add_argument("--name", help="worker name shown in the queue (default: host-pid)")
+    work.add_argument("--kinds", nargs="*", choices=sorted(TASK_HANDLERS))
+    work.add_argument("--lease", type=int, default=DEFAULT_LEASE_SECONDS, help="seconds before an unfinished task is handed out again")
+    work.add_argument("--wait", action="store_true", help="keep polling for new tasks instead of exiting")
+    work.add_argument("--archive", metavar="DIR", help="keep every fetched page here for offline re-extraction")
+    work.add_argument("--http2", action="store_true", help='fetch over HTTP/2, one connection per site (needs httpx[http2])')
+
+    commands.add_parser("status", help="show task counts and failures")
+
+    retry = commands.add_parser("retry", help=f"re-queue tasks that failed {DEFAULT_MAX_ATTEMPTS} times")
+    retry.add_argument("--kind", choices=sorted(TASK_HANDLERS))
+
+    export = commands.add_parser("export", help="write finished results to Excel (coordinator)")
+    export.add_argument("platform", choices=sorted(PLATFORM_NAMES))
+    export.add_argument("kind", choices=sorted(TASK_HANDLERS))
+    export.add_argument("output", help="path of the .xlsx file")
+
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    if args.command == "work":
+        if args.archive:
+            page_archive.enable(args.archive)
+        if args.http2:
+            http_client.set_transport("http2")
+        run_workers(args.queue, args.threads, args.name, args.wait, args.kinds, args.lease)
+        return 0
+
+    queue = WorkQueue(args.queue)
+    if args.command == "enqueue":
+        if not args.keywords and not args.products:
+            parser.error("enqueue needs --keywords and/or --products")
+        if args.keywords:
+            targets = [target.strip() for target in args.targets.split(",") if target.strip()] if args.targets else None
+            enqueue_keywords(queue, args.platform, iter_file_values(args.keywords), args.ranking, targets)
+        if args.products:
+            enqueue_products(queue, args.platform, iter_file_values(args.products), args.profile)
+        print_status(queue)
+    elif args.command == "status":
+        print_status(queue)
+    elif args.command == "retry":
+        print(f"Re-queued {queue.retry_failed(args.kind)} failed tasks")
+    elif args.command == "export":
+        results = collect_results(queue, args.platform, args.kind)
+        export_to_excel(results, args.output, PLATFORM_NAMES[args.platform])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
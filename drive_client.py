@@ -0,0 +1,165 @@
+import datetime
+import json
+import logging
+import os
+import pickle
+import threading
+import webbrowser
+
+import requests
+from google_auth_oauthlib.flow import Flow
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build_from_document
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ['https://www.googleapis.com/auth/drive.file']
+TOKEN_FILE = 'token.pickle'
+CLIENT_SECRETS_FILE = 'client_secret.json'
+DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/{api}/{version}/rest'
+REFRESH_MARGIN = 300  # seconds before expiry at which the token is refreshed in the background
+REFRESH_RETRY = 60  # seconds to wait before retrying a failed background refresh
+
+class DriveClientCache:
+    def __init__(self, token_file=TOKEN_FILE, client_secrets_file=CLIENT_SECRETS_FILE, scopes=SCOPES):
+        self.token_file = token_file
+        self.client_secrets_file = client_secrets_file
+        self.scopes = scopes
+        self._lock = threading.RLock()
+        self._creds = None
+        self._creds_generation = 0
+        self._documents = {}
+        self._local = threading.local()
+        self._refresh_timer = None
+
+    def get_service(self, get_authorization_code=None, api='drive', version='v3'):
+        creds = self.get_credentials(get_authorization_code)
+
+        # httplib2 connections are not thread-safe, so every thread gets its own
+        # client; they all share the credentials and the parsed discovery document.
+        services = getattr(self._local, 'services', None)
+        if services is None or self._local.generation != self._creds_generation:
+            services = self._local.services = {}
+            self._local.generation = self._creds_generation
+
+        service = services.get((api, version))
+        if service is None:
+            service = build_from_document(self.discovery_document(api, version), credentials=creds)
+            services[(api, version)] = service
+        return service
+
+    def get_credentials(self, get_authorization_code=None):
+        with self._lock:
+            if self._creds and self._creds.valid:
+                return self._creds
+
+            creds = self._creds or self._load_token()
+            if creds and creds.expired and creds.refresh_token:
+                creds.refresh(Request())
+            elif not creds or not creds.valid:
+                if get_authorization_code is None:
+                    raise RuntimeError("Google Drive authorization required")
+                creds = self._authorize(get_authorization_code)
+
+            self._set_credentials(creds)
+            self._save_token(creds)
+            return creds
+
+    def discovery_document(self, api, version):
+        with self._lock:
+            document = self._documents.get((api, version))
+            if document is None:
+                document = self._load_discovery_document(api, version)
+                self._documents[(api, version)] = document
+            return document
+
+    def warm_up(self):
+        # Load a saved token and parse the discovery document ahead of the first
+        # save; never prompts, so it is safe to call at start-up.
+        try:
+            with self._lock:
+                if self._creds is None:
+                    creds = self._load_token()
+                    if creds and creds.expired and creds.refresh_token:
+                        creds.refresh(Request())
+                        self._save_token(creds)
+                    if creds and creds.valid:
+                        self._set_credentials(creds)
+            self.discovery_document('drive', 'v3')
+        except Exception as e:
+            logger.warning(f"Google Drive warm-up failed: {str(e)}")
+
+    def _set_credentials(self, creds):
+        if creds is not self._creds:
+            self._creds = creds
+            self._creds_generation += 1
+        self._schedule_refresh()
+
+    def _schedule_refresh(self):
+        if self._refresh_timer:
+            self._refresh_timer.cancel()
+        if not self._creds or not self._creds.refresh_token or not self._creds.expiry:
+            return
+        # google-auth keeps expiry as a naive UTC time
+        expiry = self._creds.expiry.replace(tzinfo=datetime.timezone.utc)
+        delay = (expiry - datetime.datetime.now(datetime.timezone.utc)).total_seconds() - REFRESH_MARGIN
+        self._refresh_timer = threading.Timer(max(delay, 0), self._refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def _refresh(self):
+        with self._lock:
+            try:
+                self._creds.refresh(Request())
+                self._save_token(self._creds)
+                logger.info("Google Drive token refreshed in the background")
+                self._schedule_refresh()
+            except Exception as e:
+                logger.warning(f"Background token refresh failed, retrying in {REFRESH_RETRY}s: {str(e)}")
+                self._refresh_timer = threading.Timer(REFRESH_RETRY, self._refresh)
+                self._refresh_timer.daemon = True
+                self._refresh_timer.start()
+
+    def _authorize(self, get_authorization_code):
+        flow = Flow.from_client_secrets_file(self.client_secrets_file, self.scopes)
+        flow.redirect_uri = 'urn:ietf:wg:oauth:2.0:oob'
+
+        auth_url, _ = flow.authorization_url(prompt='consent')
+        webbrowser.open(auth_url)
+
+        code = get_authorization_code()
+        flow.fetch_token(code=code)
+        return flow.credentials
+
+    def _load_token(self):
+        if os.path.exists(self.token_file):
+            with open(self.token_file, 'rb') as token:
+                return pickle.load(token)
+        return None
+
+    def _save_token(self, creds):
+        with open(self.token_file, 'wb') as token:
+            pickle.dump(creds, token)
+
+    def _load_discovery_document(self, api, version):
+        try:
+            # Discovery documents bundled with google-api-python-client 2.x
+            from googleapiclient import discovery_cache
+            document = discovery_cache.get_static_doc(api, version)
+            if document:
+                return json.loads(document)
+        except (ImportError, AttributeError):
+            pass
+        logger.info(f"No bundled discovery document for {api} {version}, fetching it once")
+        response = requests.get(DISCOVERY_URL.format(api=api, version=version), timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+drive_client_cache = DriveClientCache()
+
+def get_drive_service(get_authorization_code=None):
+    return drive_client_cache.get_service(get_authorization_code)
+
+def get_sheets_service(get_authorization_code=None):
+    # The drive.file scope covers the spreadsheets this app creates
+    return drive_client_cache.get_service(get_authorization_code, 'sheets', 'v4')
@@ -1,19 +1,50 @@
 import pandas as pd
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill
+import io
 import logging
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from xml.sax.saxutils import escape
 
 logger = logging.getLogger(__name__)
 
-def export_to_excel(results, file_path, platform):
+# Rank exports with at least this many keywords build their sheets in worker processes
+PARALLEL_EXPORT_MIN_KEYWORDS = 20
+
+RANK_DETAIL_FIELDS = ["BestSeller", "In Stock"]
+
+SPREADSHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+def export_to_excel(results, file_path, platform, max_workers=None, per_keyword_files=False):
     try:
         logger.info(f"Starting export to Excel: {file_path}")
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        is_product_results = isinstance(results, dict) and 'product' in results
+        is_target_results = isinstance(results, dict) and 'target_ranks' in results
+        is_rank_results = not (is_product_results or is_target_results)
+
+        if is_rank_results and per_keyword_files:
+            return export_rank_files(results, file_path, platform, timestamp, max_workers)
+
+        if is_rank_results and use_parallel_export(results, max_workers):
+            try:
+                export_rank_parallel(results, file_path, platform, timestamp, max_workers)
+                logger.info(f"Results exported successfully to {file_path}")
+                return file_path
+            except (BrokenProcessPool, OSError) as e:
+                logger.warning(f"Parallel export failed, falling back to a single process: {str(e)}")
+
         workbook = Workbook()
         workbook.remove(workbook.active)  # Remove default sheet
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        if isinstance(results, dict) and 'product' in results:
+        if is_product_results:
             # Product Info Fetcher results
             sheet = workbook.create_sheet(title=f"{platform} Product Info")
             products = [p for p in results['product'] if p is not None]
@@ -21,9 +52,16 @@ def export_to_excel(results, file_path, platform):
                 export_product_info(sheet, products, platform, timestamp)
             else:
                 sheet.cell(row=1, column=1, value="No valid product information found")
-        else:
-            # Rank Fetcher results
+        elif is_target_results:
+            # Target rank lookups: one row per keyword and tracked product
+            sheet = workbook.create_sheet(title=f"{platform} Target Ranks")
+            export_target_ranks(sheet, results['target_ranks'], platform, timestamp)
+
+        if not is_product_results:
+            # Rank Fetcher results, also next to target ranks when a crawl had both kinds of search
             for keyword, products in results.items():
+                if is_target_results and keyword == 'target_ranks':
+                    continue
                 sheet = workbook.create_sheet(title=keyword[:31])  # Excel sheet names limited to 31 characters
                 if products:
                     export_rank_fetcher_results(sheet, products, platform, timestamp)
@@ -33,50 +71,165 @@ def export_to_excel(results, file_path, platform):
         logger.info(f"Saving workbook to: {file_path}")
         workbook.save(file_path)
         logger.info(f"Results exported successfully to {file_path}")
+        return file_path
     except Exception as e:
         logger.error(f"Error exporting results to Excel: {str(e)}")
         raise
     finally:
         logger.info("Excel export operation completed")
 
-def export_product_info(sheet, products, platform, timestamp):
+def use_parallel_export(results, max_workers):
+    if max_workers is None:
+        return len(results) >= PARALLEL_EXPORT_MIN_KEYWORDS and (os.cpu_count() or 1) > 1
+    return max_workers > 1 and len(results) > 1
+
+def export_rank_parallel(results, file_path, platform, timestamp, max_workers=None):
+    # Each worker renders one keyword's sheet XML; the parent only stitches the
+    # parts into a workbook skeleton, so openpyxl's per-cell cost runs on every core.
+    jobs = [(keyword, products, platform, timestamp) for keyword, products in results.items()]
+    workers = max_workers or min(len(jobs), os.cpu_count() or 1)
+    logger.info(f"Rendering {len(jobs)} keyword sheets in {workers} worker processes")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rendered = list(pool.map(render_keyword_sheet, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+    skeleton = Workbook()
+    skeleton.remove(skeleton.active)
+    for keyword in results:
+        skeleton.create_sheet(title=keyword[:31])  # Same naming as the serial export
+    skeleton_buffer = io.BytesIO()
+    skeleton.save(skeleton_buffer)
+
+    # Every rendered sheet carries the same style table; take it from one that has data
+    styles = next((styles for _, styles, has_data in rendered if has_data), rendered[0][1])
+
+    logger.info(f"Saving workbook to: {file_path}")
+    with zipfile.ZipFile(skeleton_buffer) as source, zipfile.ZipFile(file_path, "w", zipfile.ZIP_DEFLATED) as target:
+        for item in source.infolist():
+            sheet_match = re.fullmatch(r"xl/worksheets/sheet(\d+)\.xml", item.filename)
+            if sheet_match:
+                data = rendered[int(sheet_match.group(1)) - 1][0]
+            elif item.filename == "xl/styles.xml":
+                data = styles
+            else:
+                data = source.read(item.filename)
+            target.writestr(item, data)
+
+def render_keyword_sheet(job):
+    keyword, products, platform, timestamp = job
+    workbook = build_keyword_workbook(keyword, products, platform, timestamp)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    with zipfile.ZipFile(buffer) as package:
+        sheet_xml = package.read("xl/worksheets/sheet1.xml")
+        styles = package.read("xl/styles.xml")
+        if "xl/sharedStrings.xml" in package.namelist():
+            # Older openpyxl releases write a shared string table; it can't be
+            # merged across workbooks, so inline the strings into the sheet.
+            sheet_xml = inline_shared_strings(sheet_xml, package.read("xl/sharedStrings.xml"))
+    return sheet_xml, styles, bool(products)
+
+def build_keyword_workbook(keyword, products, platform, timestamp):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = keyword[:31]
+    if products:
+        export_rank_fetcher_results(sheet, products, platform, timestamp)
+    else:
+        sheet.cell(row=1, column=1, value=f"No products found for '{keyword}'")
+    return workbook
+
+def inline_shared_strings(sheet_xml, shared_strings_xml):
+    strings = ["".join(t.text or "" for t in si.iter(f"{SPREADSHEET_NS}t"))
+               for si in ET.fromstring(shared_strings_xml).iter(f"{SPREADSHEET_NS}si")]
+
+    def replace(match):
+        value = escape(strings[int(match.group(3))])
+        return f'<c{match.group(1)}t="inlineStr"{match.group(2)}><is><t xml:space="preserve">{value}</t></is></c>'
+
+    return re.sub(r'<c([^>]*?)t="s"([^>]*)><v>(\d+)</v></c>', replace, sheet_xml.decode("utf-8")).encode("utf-8")
+
+def export_rank_files(results, file_path, platform, timestamp, max_workers=None):
+    output_dir = os.path.splitext(file_path)[0]
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(keyword, products, platform, timestamp, os.path.join(output_dir, f"{safe_file_name(keyword)}.xlsx"))
+            for keyword, products in results.items()]
+    workers = max_workers or min(len(jobs), os.cpu_count() or 1)
+    logger.info(f"Writing {len(jobs)} keyword files to {output_dir}")
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            paths = list(pool.map(save_keyword_file, jobs))
+    else:
+        paths = [save_keyword_file(job) for job in jobs]
+    logger.info(f"Results exported successfully to {output_dir}")
+    return paths
+
+def save_keyword_file(job):
+    keyword, products, platform, timestamp, path = job
+    build_keyword_workbook(keyword, products, platform, timestamp).save(path)
+    return path
+
+def safe_file_name(name):
+    return re.sub(r'[\\/:*?"<>|]+', "_", name).strip() or "keyword"
+
+def product_info_headers(platform):
+    if platform == "Amazon":
+        return ["S.No", "ASIN", "Link", "Title", "Price", "Rating", "Reviews", "BestSeller", "In Stock", "Timestamp"]
+    return ["S.No", "Product ID", "Link", "Title", "Price", "Rating", "Reviews", "In Stock", "Timestamp"]  # Flipkart
+
+def product_info_values(number, product, platform, timestamp):
     if platform == "Amazon":
-        headers = ["S.No", "ASIN", "Link", "Title", "Price", "Rating", "Reviews", "BestSeller", "In Stock", "Timestamp"]
+        fields = ["ASIN", "link", "title", "price", "rating", "reviews", "BestSeller", "In Stock"]
     else:  # Flipkart
-        headers = ["S.No", "Product ID", "Link", "Title", "Price", "Rating", "Reviews", "Timestamp"]
+        fields = ["product_id", "link", "title", "price", "rating", "reviews", "In Stock"]
+    return [number] + [product.get(field, "N/A") for field in fields] + [timestamp]
 
-    for col, header in enumerate(headers, start=1):
+def export_product_info(sheet, products, platform, timestamp):
+    for col, header in enumerate(product_info_headers(platform), start=1):
         cell = sheet.cell(row=1, column=col, value=header)
         cell.font = Font(bold=True)
         cell.fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
         cell.alignment = Alignment(horizontal="center", vertical="center")
 
     for row, product in enumerate(products, start=2):
-        sheet.cell(row=row, column=1, value=row-1)  # S.No
-        if platform == "Amazon":
-            sheet.cell(row=row, column=2, value=product.get("ASIN", "N/A"))
-            sheet.cell(row=row, column=3, value=product.get("link", "N/A"))
-            sheet.cell(row=row, column=4, value=product.get("title", "N/A"))
-            sheet.cell(row=row, column=5, value=product.get("price", "N/A"))
-            sheet.cell(row=row, column=6, value=product.get("rating", "N/A"))
-            sheet.cell(row=row, column=7, value=product.get("reviews", "N/A"))
-            sheet.cell(row=row, column=8, value=product.get("BestSeller", "N/A"))
-            sheet.cell(row=row, column=9, value=product.get("In Stock", "N/A"))
-            sheet.cell(row=row, column=10, value=timestamp)
-        else:  # Flipkart
-            sheet.cell(row=row, column=2, value=product.get("product_id", "N/A"))
-            sheet.cell(row=row, column=3, value=product.get("link", "N/A"))
-            sheet.cell(row=row, column=4, value=product.get("title", "N/A"))
-            sheet.cell(row=row, column=5, value=product.get("price", "N/A"))
-            sheet.cell(row=row, column=6, value=product.get("rating", "N/A"))
-            sheet.cell(row=row, column=7, value=product.get("reviews", "N/A"))
-            sheet.cell(row=row, column=8, value=timestamp)
+        for col, value in enumerate(product_info_values(row - 1, product, platform, timestamp), start=1):
+            sheet.cell(row=row, column=col, value=value)
+
+def export_product_info_stream(products, file_path, platform):
+    # The same sheet as export_product_info from an iterable of products,
+    # through a write-only workbook: rows go to disk as they come, so memory
+    # stays flat however many products there are. Returns the row count.
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=f"{platform} Product Info")
+    header = []
+    for value in product_info_headers(platform):
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.font = Font(bold=True)
+        cell.fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
+        cell.alignment = Alignment(horizontal="center", vertical="center")
+        header.append(cell)
+    sheet.append(header)
+
+    count = 0
+    for product in products:
+        if product is not None:
+            count += 1
+            sheet.append(product_info_values(count, product, platform, timestamp))
+    if not count:
+        sheet.append(["No valid product information found"])
+    logger.info(f"Saving {count} products to: {file_path}")
+    workbook.save(file_path)
+    return count
 
 def export_rank_fetcher_results(sheet, products, platform, timestamp):
     if platform == "Amazon":
-        headers = ["Rank", "ASIN", "Link", "Title", "Price", "Rating", "Reviews", "Type", "Timestamp"]
+        headers = ["Rank", "ASIN", "Link", "Title", "Price", "Rating", "Reviews", "Type"]
     else:  # Flipkart
-        headers = ["Rank", "Product ID", "Link", "Title", "Price", "Rating", "Reviews", "Timestamp"]
+        headers = ["Rank", "Product ID", "Link", "Title", "Price", "Rating", "Reviews"]
+
+    # Columns added by product detail enrichment, only when the run was enriched
+    detail_fields = [field for field in RANK_DETAIL_FIELDS if any(field in product for product in products)]
+    headers += detail_fields + ["Timestamp"]
 
     for col, header in enumerate(headers, start=1):
         cell = sheet.cell(row=1, column=col, value=header)
@@ -96,5 +249,30 @@ def export_rank_fetcher_results(sheet, products, platform, timestamp):
         
         if platform == "Amazon":
             sheet.cell(row=row, column=col, value=product.get("type", "N/A")); col += 1
+
+        for field in detail_fields:
+            sheet.cell(row=row, column=col, value=product.get(field, "N/A")); col += 1
         
-        sheet.cell(row=row, column=col, value=timestamp)
\ No newline at end of file
+        sheet.cell(row=row, column=col, value=timestamp)
+
+def export_target_ranks(sheet, results, platform, timestamp):
+    if platform == "Amazon":
+        headers = ["Keyword", "ASIN", "Title", "Organic Rank", "Organic Position", "Page", "Sponsored Rank", "Sponsored Page", "Timestamp"]
+        fields = ["keyword", "asin", "title", "organic_rank", "organic_position", "page", "sponsored_rank", "sponsored_page"]
+    else:  # Flipkart
+        headers = ["Keyword", "Product ID", "Title", "Rank", "Page", "Timestamp"]
+        fields = ["keyword", "product_id", "title", "rank", "page"]
+
+    for col, header in enumerate(headers, start=1):
+        cell = sheet.cell(row=1, column=col, value=header)
+        cell.font = Font(bold=True)
+        cell.fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
+        cell.alignment = Alignment(horizontal="center", vertical="center")
+
+    row = 2
+    for entries in results.values():
+        for entry in entries:
+            for col, field in enumerate(fields, start=1):
+                sheet.cell(row=row, column=col, value=entry.get(field, "N/A"))
+            sheet.cell(row=row, column=len(fields) + 1, value=timestamp)
+            row += 1
\ No newline at end of file
@@ -1,16 +1,49 @@
-import requests
 from bs4 import BeautifulSoup
 import time
 import random
 import logging
-from urllib.parse import urljoin
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote_plus, urljoin
 from requests.exceptions import RequestException
 
+import http_client
+import stream_parser
+from block_detection import BlockedPageError
+
 logger = logging.getLogger(__name__)
 
+BASE_URL = "https://www.flipkart.com"
+PAGE_DELAY = (4, 6)  # seconds slept between result pages when following next-page links
+RESULTS_PER_PAGE = 24
+PARALLEL_PAGES = 2  # result pages fetched at once; the per-host budget lives in http_client
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": http_client.ACCEPT_ENCODING,
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+}
+
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+def _reset_after_fork():
+    # A forked worker process inherits the pool but none of its threads
+    global _page_pool, _page_pool_lock
+    _page_pool = None
+    _page_pool_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
 def search(keywords, num_products=30):
     try:
-        all_data = fetch_flipkart_data(keywords, num_products)
+        with http_client.page_context(search="keyword", wanted=num_products):
+            all_data = fetch_flipkart_data(keywords, num_products)
         products = process_flipkart_data(all_data, num_products)
         if not products:
             error_msg = f"No products found for '{keywords}'"
@@ -23,38 +56,193 @@ def search(keywords, num_products=30):
         raise Exception(error_msg)
 
 def fetch_flipkart_data(keyword, num_products):
-    all_data = []
-    url = f"https://www.flipkart.com/search?q={keyword.replace(' ', '+')}&otracker=search&otracker1=search&marketplace=FLIPKART&as-show=off&as=off"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-    }
+    pages_needed = max(1, -(-num_products // RESULTS_PER_PAGE))
 
-    page = 1
-    while len(all_data) * 24 < num_products:  # Assuming 24 products per page
-        try:
-            logger.info(f"Fetching page {page} for '{keyword}'")
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, "lxml")
+    try:
+        logger.info(f"Fetching page 1 for '{keyword}'")
+        first_page = fetch_search_page(search_url(keyword), max_results=num_products)
+    except RequestException as e:
+        logger.error(f"An error occurred while fetching results for '{keyword}' on page 1: {e}")
+        return []
+
+    all_data = [first_page]
+    found = count_results(first_page)
+    if found >= num_products or pages_needed == 1 or not find_next_link(first_page):
+        return all_data
+
+    # Page N is addressable directly, so the remaining pages go out together
+    # instead of one next-link hop (plus sleep) at a time.
+    last_page = last_page_number(first_page)
+    page_numbers = list(range(2, min(pages_needed, last_page or pages_needed) + 1))
+    pages, blocked = fetch_pages_direct(keyword, page_numbers, num_products - found)
+    all_data.extend(pages)
+    found += sum(count_results(soup) for soup in pages)
+
+    if len(all_data) < len(page_numbers) + 1 and found < num_products and not blocked:
+        logger.warning(f"Direct page URLs failed for '{keyword}' after page {len(all_data)}, following next-page links instead")
+        for soup in iter_flipkart_pages(keyword, start_soup=all_data[-1], start_page=len(all_data)):
             all_data.append(soup)
-            
-            next_page = soup.find("a", class_="_9QVEpD")
-            if next_page and "href" in next_page.attrs:
-                url = urljoin("https://www.flipkart.com", next_page["href"])
-                page += 1
-                time.sleep(random.uniform(4,6))
-            else:
-                logger.info(f"No more pages found for '{keyword}'")
+            if len(all_data) >= len(page_numbers) + 1:
                 break
+    return all_data
+
+def search_url(keyword, page=1):
+    url = f"{BASE_URL}/search?q={quote_plus(keyword)}&otracker=search&otracker1=search&marketplace=FLIPKART&as-show=off&as=off"
+    return url if page == 1 else f"{url}&page={page}"
+
+def is_search_result(element):
+    return element.tag == "div" and element.get("data-id") is not None
+
+def is_pagination(element):
+    if element.tag == "a":
+        return stream_parser.has_class(element, "_9QVEpD")
+    return element.tag == "span" and bool(re.match(r"Page \d+ of", element.text or ""))
+
+def fetch_search_page(url, max_results=None):
+    # Parses the page while it downloads and keeps only the result blocks and
+    # the pagination controls. With max_results, the transfer is cut off as
+    # soon as that many results have been parsed.
+    with http_client.stream(url, headers=HEADERS, timeout=10) as body:
+        return parse_search_page(body.iter_chunks(), max_results, body.encoding)
+
+def parse_search_page(chunks, max_results=None, encoding=None):
+    fragments = []
+    results = 0
+    elements = stream_parser.iter_closed_elements(
+        chunks, lambda el: is_search_result(el) or is_pagination(el), tags=("div", "span", "a"), encoding=encoding)
+    for element in elements:
+        fragments.append(stream_parser.to_html(element))
+        if is_search_result(element):
+            element.clear()
+            results += 1
+            if max_results and results >= max_results:
+                break
+    return BeautifulSoup("".join(fragments), "lxml")
+
+def count_results(soup):
+    return len(soup.find_all("div", attrs={"data-id": True}))
+
+def page_pool():
+    # Shared by every search; searches started from two threads at once
+    # must not each make one
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            _page_pool = ThreadPoolExecutor(max_workers=PARALLEL_PAGES, thread_name_prefix="flipkart-pages")
+        return _page_pool
+
+def fetch_pages_direct(keyword, page_numbers, max_results=None):
+    # Returns the pages fetched in order up to the first failure, and whether
+    # that failure was a block (in which case falling back is pointless).
+    logger.info(f"Fetching pages {page_numbers[0]}-{page_numbers[-1]} for '{keyword}' in parallel")
+    context = http_client.get_page_context()
+    futures = [page_pool().submit(http_client.run_in_page_context, context, fetch_search_page, search_url(keyword, page), max_results)
+               for page in page_numbers]
+    pages = []
+    try:
+        for page, future in zip(page_numbers, futures):
+            try:
+                soup = future.result()
+            except BlockedPageError as e:
+                logger.warning(f"Blocked on page {page} for '{keyword}', keeping the {len(pages) + 1} pages already fetched: {e}")
+                return pages, True
+            except RequestException as e:
+                logger.error(f"An error occurred while fetching results for '{keyword}' on page {page}: {e}")
+                return pages, False
+            if not soup.find("div", attrs={"data-id": True}):
+                logger.warning(f"Page {page} for '{keyword}' has no results")
+                return pages, False
+            pages.append(soup)
+    finally:
+        # Pages after the first failure are never used: don't spend the
+        # host's request budget on the ones not started yet
+        for future in futures:
+            future.cancel()
+    return pages, False
+
+def find_next_link(soup):
+    # "Previous" and "Next" share the _9QVEpD class from page 2 onwards
+    for link in soup.find_all("a", class_="_9QVEpD"):
+        if "Next" in link.get_text() and "href" in link.attrs:
+            return link
+    return None
+
+def last_page_number(soup):
+    page_info = soup.find(string=re.compile(r"Page \d+ of [\d,]+"))
+    if not page_info:
+        return None
+    return int(re.search(r"of ([\d,]+)", page_info).group(1).replace(",", ""))
+
+def iter_flipkart_pages(keyword, start_soup=None, start_page=1):
+    # Yields result pages lazily by following next-page links, so callers can
+    # stop paginating (and skip the inter-page sleep) as soon as they have
+    # what they need. With start_soup, continues after an already fetched page.
+    url = search_url(keyword)
+    page = start_page
+    if start_soup is not None:
+        next_page = find_next_link(start_soup)
+        if not next_page:
+            return
+        url = urljoin(BASE_URL, next_page["href"])
+        page += 1
+
+    while True:
+        try:
+            logger.info(f"Fetching page {page} for '{keyword}'")
+            soup = fetch_search_page(url)
+        except BlockedPageError as e:
+            # Fail fast: no point paging further (and sleeping) once Flipkart blocks us
+            if page == 1:
+                raise
+            logger.warning(f"Blocked on page {page} for '{keyword}', keeping the {page - 1} pages already fetched: {e}")
+            return
         except RequestException as e:
             logger.error(f"An error occurred while fetching results for '{keyword}' on page {page}: {e}")
-            break
+            return
 
-    return all_data
+        yield soup
+            
+        next_page = find_next_link(soup)
+        if next_page:
+            url = urljoin(BASE_URL, next_page["href"])
+            page += 1
+            time.sleep(random.uniform(*PAGE_DELAY))
+        else:
+            logger.info(f"No more pages found for '{keyword}'")
+            return
+
+def find_target_ranks(keyword, target_ids, max_rank=100):
+    # Rank lookup for a handful of product ids (the data-id of a result):
+    # stops paginating as soon as every target has been located.
+    targets = list(dict.fromkeys(target_ids))
+    found = {}
+    products = []
+    pages = 0
+
+    # Target lookups archive like keyword searches that asked for max_rank results
+    with http_client.page_context(search="keyword", wanted=max_rank):
+        for soup in iter_flipkart_pages(keyword):
+            pages += 1
+            for product in process_flipkart_data([soup], max_rank - len(products)):
+                product["rank"] = len(products) + 1
+                products.append(product)
+                if product["product_id"] in targets and product["product_id"] not in found:
+                    found[product["product_id"]] = new_target_entry(keyword, product["product_id"], product["title"], product["rank"], pages)
+
+            if len(found) == len(targets) or len(products) >= max_rank:
+                break
+
+    logger.info(f"Located {len(found)}/{len(targets)} targets for '{keyword}' in {pages} pages ({len(products)} results)")
+    return [found.get(product_id) or new_target_entry(keyword, product_id, "Not found") for product_id in targets]
+
+def new_target_entry(keyword, product_id, title, rank="N/A", page="N/A"):
+    return {
+        "keyword": keyword,
+        "product_id": product_id,
+        "title": title,
+        "rank": rank,
+        "page": page,
+    }
 
 def process_flipkart_data(all_data, num_products=30):
     products = []
@@ -80,7 +268,7 @@ def process_flipkart_data(all_data, num_products=30):
                 reviews_elem = container.find("span", class_="Wphh3N")
                 
                 price = price_elem.get_text(strip=True) if price_elem else "N/A"
-                link = f"https://www.flipkart.com{link_elem['href']}" if link_elem and 'href' in link_elem.attrs else "N/A"
+                link = f"{BASE_URL}{link_elem['href']}" if link_elem and 'href' in link_elem.attrs else "N/A"
                 rating = rating_elem.get_text(strip=True) if rating_elem else "N/A"
                 
                 # Extract only the number of ratings
@@ -98,11 +286,12 @@ def process_flipkart_data(all_data, num_products=30):
                     "reviews": reviews
                 }
                 
-                logger.info(f"Processed product: {product}")
+                logger.debug("Processed product: %s", product)
                 products.append(product)
             except Exception as e:
-                logger.error(f"Error processing product: {str(e)}")
-                logger.error(f"Product HTML: {container}")
+                logger.error("Error processing product %s: %s", container.get("data-id"), e)
+                # Only rendered (and cut short) when debugging
+                logger.debug("Product HTML: %.2000s", container)
 
-    logger.info(f"Processed {len(products)} products")
+    logger.info("Processed %d products", len(products))
     return products[:num_products]
\ No newline at end of file
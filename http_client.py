@@ -0,0 +1,468 @@
+import asyncio
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+
+try:
+    import httpx
+    import h2  # noqa: F401 - httpx only speaks HTTP/2 with it
+except ImportError:  # optional: the HTTP/2 transport (pip install "httpx[http2]")
+    httpx = None
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:  # optional: br responses can't be decoded without it
+        brotli = None
+
+from block_detection import BLOCK_SCAN_BYTES, BlockedPageError, detect_block, get_circuit_breaker
+from proxy_pool import load_proxy_pool
+
+logger = logging.getLogger(__name__)
+
+# Per-host request budget: (max concurrent requests, min seconds between request starts)
+DEFAULT_HOST_LIMITS = {
+    "www.amazon.in": (3, 0.5),
+    "www.flipkart.com": (2, 1.0),
+}
+DEFAULT_LIMIT = (4, 0.0)
+STREAM_CHUNK_SIZE = 16384
+PROXY_ATTEMPTS = 3  # proxies tried for one request when they can't be reached
+PROXY_FAILURE_CODES = {502, 504}  # the proxy itself failed, not the site
+# Only encodings both transports can decode: advertising br without brotli
+# installed would hand the parsers compressed bytes
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli else "gzip, deflate"
+TRANSPORTS = ("http1", "http2")
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-connection", "transfer-encoding", "upgrade"}  # not allowed in HTTP/2
+HTTP2_CLEARTEXT = False  # HTTP/2 to plain http:// hosts without negotiation; only the stand-in servers need it
+
+class HostThrottle:
+    def __init__(self, max_concurrent, min_interval, semaphore=None):
+        # semaphore: the max_concurrent slots, when they are shared with other
+        # processes (see sharded_runner)
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self._semaphore = semaphore or threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        if self.min_interval:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_start)
+                # Jittered spacing so parallel workers don't fire in lockstep
+                self._next_start = start + self.min_interval * random.uniform(0.8, 1.2)
+            if start > now:
+                time.sleep(start - now)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._semaphore.release()
+
+_throttles = {}
+_throttles_lock = threading.Lock()
+_host_limits = {}  # set_host_limit overrides of DEFAULT_HOST_LIMITS
+_default_limit = None  # set_default_limit override of DEFAULT_LIMIT
+_local = threading.local()
+_proxy_pool = None
+_proxy_pool_loaded = False
+_proxy_pool_lock = threading.Lock()
+_page_recorder = None
+_transport = "http1"
+_http2_transport = None
+_http2_lock = threading.Lock()
+
+def route_key(host, proxy=None):
+    # Throttle and circuit breaker state is per host, or per host and proxy
+    # IP behind a proxy pool: one blocked proxy doesn't pause the others
+    return host if proxy is None else f"{host} via {proxy.name}"
+
+def get_throttle(host, proxy=None):
+    key = route_key(host, proxy)
+    with _throttles_lock:
+        throttle = _throttles.get(key)
+        if throttle is None:
+            throttle = _throttles[key] = HostThrottle(*host_limit(host))
+        return throttle
+
+def host_limit(host):
+    return _host_limits.get(host) or DEFAULT_HOST_LIMITS.get(host) or _default_limit or DEFAULT_LIMIT
+
+def set_host_limit(host, max_concurrent, min_interval, semaphore=None):
+    # Applies to every route to the host, direct and through each proxy:
+    # their throttles are made again, with the new limit, on next use
+    with _throttles_lock:
+        _host_limits[host] = (max_concurrent, min_interval, semaphore)
+        for key in [key for key in _throttles if key == host or key.startswith(f"{host} via ")]:
+            del _throttles[key]
+
+def set_default_limit(max_concurrent, min_interval, semaphore=None):
+    # The limit of hosts without one of their own. A semaphore given here is
+    # shared by all of those hosts.
+    global _default_limit
+    with _throttles_lock:
+        _default_limit = (max_concurrent, min_interval, semaphore)
+        limited = set(_host_limits) | set(DEFAULT_HOST_LIMITS)
+        for key in [key for key in _throttles if key.split(" via ")[0] not in limited]:
+            del _throttles[key]
+
+def get_session():
+    # One keep-alive session per thread: connections get reused across pages
+    # and products without sharing a requests.Session between threads.
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+def set_transport(name):
+    # "http1": requests, a keep-alive connection per thread and host.
+    # "http2": httpx, one connection per host (and proxy) that every thread's
+    # requests are multiplexed over.
+    global _transport, _http2_transport
+    if name not in TRANSPORTS:
+        raise ValueError(f"Unknown transport {name!r}, expected one of {', '.join(TRANSPORTS)}")
+    if name == "http2" and httpx is None:
+        raise RuntimeError('The HTTP/2 transport needs httpx with HTTP/2 support: pip install "httpx[http2]"')
+    with _http2_lock:
+        _transport = name
+        if name == "http2" and _http2_transport is None:
+            _http2_transport = Http2Transport()
+        elif name != "http2" and _http2_transport is not None:
+            _http2_transport.close()
+            _http2_transport = None
+    logger.info(f"Using the {name} transport")
+
+def _reset_after_fork():
+    # A forked worker process opens its own sessions and connections and
+    # keeps its own throttles: the parent's sockets and HTTP/2 loop thread
+    # aren't usable there. The transport goes back to http1 until set again.
+    global _local, _throttles, _throttles_lock, _transport, _http2_transport, _http2_lock
+    _local = threading.local()
+    _throttles = {}
+    _throttles_lock = threading.Lock()
+    _transport = "http1"
+    _http2_transport = None
+    _http2_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):  # not on Windows, where workers are spawned fresh
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def get_transport():
+    return _transport
+
+def as_requests_error(error):
+    # Callers handle requests' exceptions whichever transport is in use
+    if isinstance(error, httpx.TimeoutException):
+        return requests.exceptions.Timeout(str(error))
+    if isinstance(error, httpx.TransportError):
+        return requests.exceptions.ConnectionError(str(error))
+    return requests.exceptions.RequestException(str(error))
+
+class Http2Transport:
+    # httpx's synchronous HTTP/2 connections can't be shared between threads
+    # (their h2 state isn't locked), so all HTTP/2 traffic runs on one event
+    # loop thread, with an AsyncClient per route, and fetch threads hand their
+    # requests and chunk reads over to it.
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._clients = {}
+        self._thread = threading.Thread(target=self._loop.run_forever, name="http2-transport", daemon=True)
+        self._thread.start()
+
+    def call(self, coroutine):
+        try:
+            return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+        except httpx.HTTPError as e:
+            raise as_requests_error(e) from e
+
+    def get(self, url, headers=None, timeout=10, stream=False, proxy=None):
+        headers = {name: value for name, value in (headers or {}).items() if name.lower() not in HOP_BY_HOP_HEADERS}
+        response, chunks, pump = self.call(self._get(url, headers, timeout, stream, proxy.url if proxy else None))
+        return Http2Response(response, chunks, pump, self._loop)
+
+    async def _get(self, url, headers, timeout, stream, proxy_url):
+        client = self._clients.get(proxy_url)
+        if client is None:
+            client = self._clients[proxy_url] = httpx.AsyncClient(http2=True, http1=not HTTP2_CLEARTEXT,
+                                                                  proxy=proxy_url, follow_redirects=True)
+        response = await client.send(client.build_request("GET", url, headers=headers, timeout=timeout), stream=True)
+        if not stream:
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+            return response, None, None
+        # The body is read ahead into a queue as it arrives, so the fetch
+        # thread only waits when it has caught up with the network
+        chunks = queue.SimpleQueue()
+        return response, chunks, asyncio.ensure_future(self._pump(response, chunks))
+
+    async def _pump(self, response, chunks):
+        try:
+            async for chunk in response.aiter_bytes():
+                chunks.put(chunk)
+            chunks.put(None)
+        except httpx.HTTPError as e:
+            chunks.put(as_requests_error(e))
+        finally:
+            await response.aclose()
+
+    def close(self):
+        async def close_clients():
+            for client in self._clients.values():
+                await client.aclose()
+        try:
+            self.call(close_clients())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+class Http2Response:
+    # The parts of requests.Response the fetchers use, over an httpx response.
+    # Bodies come out decoded (gzip, deflate, and br with brotli installed).
+    def __init__(self, response, chunks=None, pump=None, loop=None):
+        self._response = response
+        self._chunks = chunks
+        self._pump = pump
+        self._loop = loop
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = str(response.url)
+        self._content = None if chunks is not None else response.content
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = b"".join(self.iter_content())
+        return self._content
+
+    def iter_content(self, chunk_size=None):
+        # Chunks as they arrived off the connection, whatever chunk_size says
+        if self._chunks is None:
+            yield self._content
+            return
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+    def close(self):
+        # A body not read to the end has its stream reset; the connection stays up
+        if self._pump is not None:
+            self._loop.call_soon_threadsafe(self._pump.cancel)
+
+def send_get(url, headers=None, timeout=10, stream=False, proxy=None):
+    transport = _http2_transport
+    if transport is not None:
+        return transport.get(url, headers, timeout, stream, proxy)
+    return get_session().get(url, headers=headers, timeout=timeout, stream=stream,
+                             proxies={"http": proxy.url, "https": proxy.url} if proxy else None)
+
+def get_proxy_pool():
+    # Loaded from proxies.txt on first use; None means requests go out directly
+    global _proxy_pool, _proxy_pool_loaded
+    with _proxy_pool_lock:
+        if not _proxy_pool_loaded:
+            _proxy_pool = load_proxy_pool()
+            _proxy_pool_loaded = True
+        return _proxy_pool
+
+def set_page_recorder(recorder):
+    # recorder(url, body, encoding, context) is handed every complete,
+    # non-blocked page, with the page_context it was fetched under; None
+    # turns recording off
+    global _page_recorder
+    _page_recorder = recorder
+
+@contextmanager
+def page_context(**context):
+    # What the pages this thread fetches inside the block are for (a keyword
+    # search and the results it asked for, an ASIN batch search, ...), for
+    # the page recorder: the URL alone doesn't say
+    previous = getattr(_local, "page_context", None)
+    _local.page_context = dict(previous or {}, **context)
+    try:
+        yield
+    finally:
+        _local.page_context = previous
+
+def get_page_context():
+    return dict(getattr(_local, "page_context", None) or {})
+
+def run_in_page_context(context, func, *args):
+    # For fetches handed to a pool thread: runs func under the submitter's context
+    with page_context(**context):
+        return func(*args)
+
+def response_charset(response):
+    # Only a charset the server actually sent; otherwise the parser sniffs <meta charset>
+    match = re.search(r"charset=([\w.:-]+)", response.headers.get("Content-Type", ""), re.IGNORECASE)
+    return match.group(1) if match else None
+
+def set_proxy_pool(pool):
+    global _proxy_pool, _proxy_pool_loaded
+    with _proxy_pool_lock:
+        _proxy_pool = pool
+        _proxy_pool_loaded = True
+
+@contextmanager
+def open_request(host, url, headers=None, timeout=10, stream=False):
+    # Sends the GET directly, or through a proxy picked from the pool, after
+    # the route's circuit breaker lets it through, and holds the throttle slot
+    # until the with block exits. A proxy that can't be reached is marked down
+    # and the request moves on to another one.
+    # Yields (proxy, breaker, response, seconds until the response arrived).
+    pool = get_proxy_pool()
+    tried = []
+    while True:
+        proxy = pool.choose(exclude=tried) if pool else None
+        breaker = get_circuit_breaker(route_key(host, proxy))
+        breaker.before_request()
+        if proxy is not None:
+            headers = dict(headers or {}, **{"User-Agent": proxy.user_agent})
+        with get_throttle(host, proxy):
+            started = time.monotonic()
+            try:
+                response = send_get(url, headers, timeout, stream, proxy)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                breaker.abort_probe()
+                if proxy is None:
+                    raise
+                pool.record_failure(proxy, type(e).__name__)
+                tried.append(proxy)
+                if len(tried) >= min(PROXY_ATTEMPTS, len(pool)):
+                    raise
+                logger.warning(f"Proxy {proxy.name} failed for {url}, retrying through another proxy")
+                continue
+            except Exception:
+                breaker.abort_probe()
+                raise
+            yield proxy, breaker, response, time.monotonic() - started
+            return
+
+def record_proxy_result(proxy, status_code, reason, elapsed):
+    if proxy is None:
+        return
+    pool = get_proxy_pool()
+    if reason:
+        pool.record_block(proxy, reason)
+    elif status_code in PROXY_FAILURE_CODES:
+        pool.record_failure(proxy, f"HTTP {status_code}")
+    else:
+        pool.record_success(proxy, elapsed)
+
+def get(url, headers=None, timeout=10):
+    with open_request(urlsplit(url).netloc, url, headers, timeout) as (proxy, breaker, response, elapsed):
+        pass
+
+    reason = detect_block(response.status_code, response.content)
+    record_proxy_result(proxy, response.status_code, reason, elapsed)
+    record_block_check(breaker, url, reason)
+    response.raise_for_status()
+    recorder = _page_recorder
+    if recorder is not None:
+        recorder(url, response.content, response_charset(response), get_page_context())
+    return response
+
+def record_block_check(breaker, url, reason):
+    breaker.record(blocked=bool(reason))
+    if reason:
+        logger.warning(f"Blocked by {breaker.host} ({reason}): {url}")
+        raise BlockedPageError(f"Blocked by {breaker.host} ({reason})")
+
+class StreamedResponse:
+    # Body of a streamed GET, read chunk by chunk. Block-page markers are looked
+    # for in the first BLOCK_SCAN_BYTES as they arrive, so a captcha page still
+    # raises BlockedPageError before a parser gets far into it.
+    def __init__(self, response, breaker, url, proxy=None, elapsed=0.0):
+        self.response = response
+        self.breaker = breaker
+        self.url = url
+        self.proxy = proxy
+        self.elapsed = elapsed
+        self.checked = False
+        self.bytes_read = 0
+        self._head = b""
+        self._chunks = response.iter_content(STREAM_CHUNK_SIZE)
+        self.recorded = [] if _page_recorder is not None else None
+
+    @property
+    def encoding(self):
+        return response_charset(self.response)
+
+    def record(self, reason):
+        self.checked = True
+        record_proxy_result(self.proxy, self.response.status_code, reason, self.elapsed)
+        record_block_check(self.breaker, self.url, reason)
+
+    def check_status(self):
+        if self.response.status_code >= 400:
+            self.record(detect_block(self.response.status_code, b""))
+        self.response.raise_for_status()
+
+    def iter_chunks(self):
+        for chunk in self._chunks:
+            self.bytes_read += len(chunk)
+            if self.recorded is not None:
+                self.recorded.append(chunk)
+            if not self.checked:
+                self._head += chunk
+                reason = detect_block(self.response.status_code, self._head)
+                if reason or len(self._head) >= BLOCK_SCAN_BYTES:
+                    self._head = b""
+                    self.record(reason)
+            yield chunk
+
+@contextmanager
+def stream(url, headers=None, timeout=10):
+    # Like get(), but hands the body over as it downloads. Leaving the with
+    # block closes the connection, so a caller that has parsed everything it
+    # needs stops the transfer there. The throttle slot is held until then.
+    body = None
+    try:
+        with open_request(urlsplit(url).netloc, url, headers, timeout, stream=True) as (proxy, breaker, response, elapsed):
+            body = StreamedResponse(response, breaker, url, proxy, elapsed)
+            try:
+                body.check_status()
+                yield body
+                if body.recorded is not None:
+                    # Archived pages have to be complete, so the early stop
+                    # is given up while recording
+                    for _ in body.iter_chunks():
+                        pass
+            finally:
+                response.close()
+            # Stopped (or the page ended) before the whole scan window arrived;
+            # every chunk read so far has already been scanned.
+            if not body.checked:
+                if body.bytes_read:
+                    body.record(None)
+                else:
+                    body.checked = True
+                    breaker.abort_probe()
+            recorder = _page_recorder
+            if body.recorded is not None and recorder is not None:
+                recorder(url, b"".join(body.recorded), body.encoding, get_page_context())
+    except BaseException:
+        if body is not None and not body.checked:
+            body.breaker.abort_probe()
+        raise
@@ -0,0 +1,87 @@
+import logging
+import re
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+ASIN_PATTERN = re.compile(r"[A-Z0-9]{10}")
+# Path shapes Amazon uses for a product: /dp/X, /Some-Title/dp/X/ref=..., /gp/product/X,
+# /gp/aw/d/X (mobile), /exec/obidos/ASIN/X, /o/ASIN/X, /product-reviews/X
+AMAZON_PATH_PATTERN = re.compile(
+    r"/(?:dp|gp/product|gp/aw/d|exec/obidos/(?:tg/detail/-|asin)|o/asin|product-reviews)/([A-Za-z0-9]{10})(?:[/?#]|$)",
+    re.IGNORECASE)
+FLIPKART_ITEM_PATTERN = re.compile(r"/p/(itm[0-9a-z]+)", re.IGNORECASE)
+
+def amazon_asin(identifier):
+    # A bare token counts only in upper case, so ten-letter words such as
+    # "headphones" aren't taken for ASINs; inside a product URL's path the
+    # ASIN is matched in any case
+    identifier = identifier.strip()
+    if ASIN_PATTERN.fullmatch(identifier):
+        return identifier
+    parts = urlsplit(identifier if "//" in identifier else f"//{identifier}")
+    if "amazon." not in parts.netloc.lower():
+        return None
+    match = AMAZON_PATH_PATTERN.search(parts.path)
+    if match:
+        return match.group(1).upper()
+    asin = parse_qs(parts.query).get("asin", [""])[0]
+    return asin if ASIN_PATTERN.fullmatch(asin) else None
+
+def flipkart_product(identifier):
+    # Returns (key, url): the item id (or the pid when the link has no item
+    # id) and the product URL without tracking parameters, or None for
+    # non-product links. Links to one product with and without ?pid= share
+    # the item id, so they get one key.
+    identifier = identifier.strip()
+    parts = urlsplit(identifier if "//" in identifier else f"//{identifier}")
+    if "flipkart.com" not in parts.netloc.lower():
+        return None
+    item = FLIPKART_ITEM_PATTERN.search(parts.path)
+    pid = flipkart_pid(identifier)
+    if not item and not pid:
+        return None
+    path = parts.path[:item.end()] if item else parts.path
+    url = f"https://{parts.netloc}{path}" + (f"?pid={pid}" if pid else "")
+    return item.group(1).lower() if item else pid, url
+
+def flipkart_pid(identifier):
+    # The ?pid= of a Flipkart link (what search results call the product id), or None
+    parts = urlsplit(identifier.strip())
+    return parse_qs(parts.query).get("pid", [""])[0].upper() or None
+
+def canonicalize(identifiers, platform):
+    # Normalizes raw input lines for one platform. Returns the unique products
+    # to fetch ({key: what to fetch}, in first-seen order), the key of every
+    # input line (None for blank or unrecognised lines) and stats.
+    unique = {}
+    keys = []
+    invalid = 0
+    for identifier in identifiers:
+        identifier = identifier.strip()
+        if not identifier:
+            continue
+        if platform == "Amazon":
+            asin = amazon_asin(identifier)
+            key, target = asin, asin
+        else:
+            product = flipkart_product(identifier)
+            key, target = product if product else (None, None)
+        if key is None:
+            logger.warning(f"Not a recognised {platform} product: {identifier}")
+            invalid += 1
+        else:
+            unique.setdefault(key, target)
+        keys.append(key)
+
+    stats = {
+        "inputs": len(keys),
+        "unique": len(unique),
+        "invalid": invalid,
+        "fetches_saved": len(keys) - invalid - len(unique),
+    }
+    return unique, keys, stats
+
+def fan_out(keys, results):
+    # One result per input line, in input order; duplicates share a result
+    return [results.get(key) if key is not None else None for key in keys]
@@ -0,0 +1,100 @@
+import csv
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+KEYWORD_GROUPS_FILE = 'keyword_groups.json'
+SUPPORTED_EXTENSIONS = (".txt", ".csv", ".xlsx")
+# Header cells recognised (and skipped) in the first row of a CSV/XLSX file
+HEADER_NAMES = {"keyword", "keywords", "asin", "asins", "link", "links", "url", "urls", "product", "products", "pid"}
+
+# Used for any platform/group missing from keyword_groups.json
+DEFAULT_KEYWORD_GROUPS = {
+    "amazon": {
+        "Generic": ["perfume", "perfume for men", "perfume for women", "unisex perfumes", "long lasting perfumes"],
+        "Branded": ["bellavita perfumes", "bella vita luxury perfume for men", "bella vita perfume for women", "bella vita perfume for men"],
+        "Competition": ["park avenue perfume for men", "wild stone perfume for men", "renee perfume"],
+    },
+    "flipkart": {
+        "Generic": ["perfume", "perfume for men", "perfume for women", "unisex perfumes", "long lasting perfumes"],
+        "Branded": ["bellavita perfumes", "bella vita luxury perfume for men", "bella vita perfume for women", "bella vita perfume for men"],
+        "Competition": ["park avenue perfume for men", "wild stone perfume for men", "renee perfume"],
+    },
+}
+
+def iter_file_values(path, column=None):
+    # Yields one stripped value per line/row without loading the whole file:
+    # text files line by line, CSV through csv.reader, XLSX in openpyxl's
+    # read-only mode. For tables, column is a header name or index (default:
+    # the first column). Blank values and '#' comments are skipped.
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".txt":
+        rows = iter_text_rows(path)
+    elif extension == ".csv":
+        rows = iter_csv_rows(path)
+    elif extension == ".xlsx":
+        rows = iter_xlsx_rows(path)
+    else:
+        raise ValueError(f"Unsupported file type '{extension}', expected one of {', '.join(SUPPORTED_EXTENSIONS)}")
+
+    index = column if isinstance(column, int) else 0
+    for row_number, row in enumerate(rows):
+        if row_number == 0 and extension != ".txt":
+            headers = [str(cell).strip().lower() if cell is not None else "" for cell in row]
+            if isinstance(column, str) and column.lower() in headers:
+                index = headers.index(column.lower())
+                continue
+            if index < len(headers) and headers[index] in HEADER_NAMES:
+                continue
+        value = row[index] if index < len(row) else None
+        value = str(value).strip() if value is not None else ""
+        if value and not value.startswith("#"):
+            yield value
+
+def iter_text_rows(path):
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        for line in f:
+            yield [line]
+
+def iter_csv_rows(path):
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        yield from csv.reader(f)
+
+def iter_xlsx_rows(path):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def unique_values(values):
+    # Order-preserving de-duplication that still consumes the input lazily
+    seen = set()
+    for value in values:
+        if value not in seen:
+            seen.add(value)
+            yield value
+
+def load_keyword_groups(platform, path=KEYWORD_GROUPS_FILE):
+    # keyword_groups.json: {"amazon": {"Generic": [...] or "generic.txt", ...}, "flipkart": {...}}.
+    # A group given as a file name is read with iter_file_values.
+    groups = dict(DEFAULT_KEYWORD_GROUPS[platform])
+    if not os.path.exists(path):
+        return groups
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            configured = json.load(f).get(platform, {})
+        base_dir = os.path.dirname(os.path.abspath(path))
+        for title, keywords in configured.items():
+            if isinstance(keywords, str):
+                keywords = iter_file_values(os.path.join(base_dir, keywords))
+            groups[title] = list(unique_values(keyword.strip() for keyword in keywords if keyword.strip()))
+    except Exception as e:
+        logger.error(f"Error reading keyword groups from {path}, using the defaults: {str(e)}")
+        return dict(DEFAULT_KEYWORD_GROUPS[platform])
+    return groups
@@ -0,0 +1,98 @@
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_RATE = 20.0  # repeats per second let through for one INFO/DEBUG call site
+DEFAULT_BURST = 50  # repeats let through at once before the rate applies
+MAX_CALL_SITES = 10000  # rate buckets kept before starting over
+
+class RateLimitFilter(logging.Filter):
+    # Token bucket per call site (logger name + unformatted message) for
+    # records at or below max_level; warnings and errors always pass. This
+    # relies on hot-path calls passing %-style arguments: the template is then
+    # the same for every product, where an f-string makes each line unique.
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_level=logging.INFO):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_level = max_level
+        self.suppressed = 0
+        self._buckets = {}  # call site -> [tokens, last refill, suppressed since last emitted]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_CALL_SITES:
+                    self._buckets.clear()
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                self.suppressed += 1
+                return False
+            bucket[0] = tokens - 1
+            skipped, bucket[2] = bucket[2], 0
+        if skipped:
+            record.msg = f"{record.msg} [{skipped} similar messages suppressed]"
+        return True
+
+class LazyQueueHandler(QueueHandler):
+    # The stock prepare() formats every record on the logging thread so it can
+    # be pickled. These records never leave the process, so formatting is left
+    # to the listener thread; arguments are rendered when the line is written.
+    def prepare(self, record):
+        return record
+
+_listener = None
+_handler = None
+_lock = threading.Lock()
+
+def setup_logging(level=None, stream=None, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+    # Root logging for the app and the CLIs. Logging calls only put the record
+    # on a queue; a background listener formats and writes it, so scraper
+    # threads never wait on stdout. The level defaults to $LOG_LEVEL or INFO.
+    global _listener, _handler
+    level = level or os.environ.get("LOG_LEVEL", "INFO").upper()
+    with _lock:
+        _stop()
+        log_queue = queue.SimpleQueue()
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(logging.Formatter(LOG_FORMAT))
+        _handler = LazyQueueHandler(log_queue)
+        _handler.addFilter(RateLimitFilter(rate, burst))
+        _listener = QueueListener(log_queue, output)
+        _listener.start()
+
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        root.setLevel(level)
+    return _handler.filters[0]
+
+def stop_logging():
+    # Writes out whatever is still queued; registered to run at exit
+    with _lock:
+        _stop()
+
+def _stop():
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+        logging.getLogger().removeHandler(_handler)
+        _listener = None
+        _handler = None
+
+atexit.register(stop_logging)
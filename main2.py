@@ -1,28 +1,35 @@
 import sys
 import customtkinter as ctk
-from tkinter import filedialog, messagebox, BooleanVar, simpledialog
+from tkinter import filedialog, messagebox, BooleanVar, simpledialog, Menu
 import logging
 import os
 import threading
+import multiprocessing
 import datetime
-import pickle
-import webbrowser
 import time
 import tempfile
 import csv
-from google_auth_oauthlib.flow import Flow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
 
 # Import the required modules
-from amazon_scraper import search as amazon_search
-from flipkart_scraper import search as flipkart_search
-from product_info_fetcher import fetch_amazon_product_info, fetch_flipkart_product_info
+from amazon_scraper import search as amazon_search, find_target_ranks as amazon_find_target_ranks
+from flipkart_scraper import search as flipkart_search, find_target_ranks as flipkart_find_target_ranks
+from product_info_fetcher import fetch_flipkart_product_info, FETCH_PROFILES
+from product_lookup import lookup_amazon_products
+from identifiers import canonicalize, fan_out
+from input_files import iter_file_values, load_keyword_groups, unique_values
 from export_utils import export_to_excel
+from rank_enrichment import enrich_rank_results
+from drive_client import drive_client_cache, get_drive_service, get_sheets_service
+from results_viewer import ResultsViewer
+import http_client
+import log_setup
+import page_archive
+import profiling
+from sheets_sync import SheetsSync, has_target_ranks
 
 class ProductInfoFetcherApp(ctk.CTk):
-    def __init__(self):
+    def __init__(self, profile_runs=False):
         super().__init__()
 
         ctk.set_appearance_mode("System")
@@ -31,20 +38,51 @@ class ProductInfoFetcherApp(ctk.CTk):
         self.title("Product Info Fetcher")
         self.geometry("800x700")
 
+        # Tools > Profile runs: each fetch or cloud save is sampled and its profile
+        # written next to the saved results (or under profiles/)
+        self.profile_runs_var = ctk.BooleanVar(value=profile_runs)
+        self.last_results_path = None
+        menubar = Menu(self)
+        tools_menu = Menu(menubar, tearoff=0)
+        tools_menu.add_checkbutton(label="Profile runs", variable=self.profile_runs_var)
+        menubar.add_cascade(label="Tools", menu=tools_menu)
+        self.configure(menu=menubar)
+
         self.tabview = ctk.CTkTabview(self)
-        self.tabview.pack(expand=True, fill="both", padx=15, pady=15)
+        self.tabview.pack(expand=True, fill="both", padx=15, pady=(15, 5))
+
+        # Applies to every fetch: raw pages are kept so results can be re-extracted offline
+        self.archive_pages_var = ctk.BooleanVar()
+        ctk.CTkCheckBox(self, text=f"Archive raw pages (in '{page_archive.ARCHIVE_DIR}')", variable=self.archive_pages_var,
+                        command=self.toggle_page_archive).pack(anchor="w", padx=20, pady=(0, 10))
+
+        # HTTP/2 multiplexes every fetch to a site over one connection; needs httpx[http2]
+        self.http2_var = ctk.BooleanVar()
+        ctk.CTkCheckBox(self, text="Use HTTP/2 (one connection per site)", variable=self.http2_var, command=self.toggle_http2,
+                        state="normal" if http_client.httpx else "disabled").pack(anchor="w", padx=20, pady=(0, 10))
+
+        # Cloud saves append to one spreadsheet per keyword group instead of uploading a CSV per keyword
+        self.sheets_append_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(self, text="Append cloud saves to Google Sheets", variable=self.sheets_append_var).pack(
+            anchor="w", padx=20, pady=(0, 10))
+        self.sheets_sync = SheetsSync()
 
         # Create tabs
         self.amazon_rank_tab = self.tabview.add("Amazon Keyword Rank")
         self.flipkart_rank_tab = self.tabview.add("Flipkart Keyword Rank")
         self.amazon_product_tab = self.tabview.add("Amazon Product Info")
         self.flipkart_product_tab = self.tabview.add("Flipkart Product Info")
+        self.results_tab = self.tabview.add("Results")
 
         self.create_amazon_rank_fetcher_tab(self.amazon_rank_tab)
         self.create_flipkart_rank_fetcher_tab(self.flipkart_rank_tab)
         self.create_amazon_product_info_tab(self.amazon_product_tab)
         self.create_flipkart_product_info_tab(self.flipkart_product_tab)
 
+        # Rows are pushed here from the worker threads as they are fetched
+        self.results_viewer = ResultsViewer(self.results_tab)
+        self.results_viewer.pack(expand=True, fill="both")
+
         # Initialize result dictionaries
         self.amazon_rank_results_checkbox = {}
         self.amazon_rank_results_other = {}
@@ -63,6 +101,9 @@ class ProductInfoFetcherApp(ctk.CTk):
         # Set up logging
         self.setup_logging()
 
+        # Load the saved Drive token and discovery document before the first save
+        threading.Thread(target=drive_client_cache.warm_up, daemon=True).start()
+
         # Google Drive folder IDs configuration
         self.folder_ids = {
             'amazon': {
@@ -80,17 +121,26 @@ class ProductInfoFetcherApp(ctk.CTk):
         }
 
     def setup_logging(self):
+        # Everything, scraper modules included, goes to stdout through the
+        # background listener
+        log_setup.setup_logging()
         self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(logging.INFO)
-        handler = logging.StreamHandler(sys.stdout)
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
 
     def create_amazon_rank_fetcher_tab(self, parent):
         main_frame = ctk.CTkScrollableFrame(parent)
         main_frame.pack(expand=True, fill="both", padx=10, pady=10)
 
+        # Fetch product pages once per unique ASIN across all keywords of a run
+        self.amazon_rank_enrich_var = ctk.BooleanVar()
+        ctk.CTkCheckBox(main_frame, text="Add product details (BestSeller rank, stock)", variable=self.amazon_rank_enrich_var).pack(anchor="w", padx=5, pady=5)
+
+        # Target ASINs: only report where these land, stopping as soon as all are found
+        target_frame = ctk.CTkFrame(main_frame)
+        target_frame.pack(fill="x", padx=5, pady=5)
+        ctk.CTkLabel(target_frame, text="Only find these ASINs (optional):").pack(side="left", padx=(0, 5))
+        self.amazon_rank_targets_entry = ctk.CTkEntry(target_frame, placeholder_text="B0XXXXXXXX, B0YYYYYYYY")
+        self.amazon_rank_targets_entry.pack(side="left", expand=True, fill="x")
+
         # Checkbox section
         checkbox_frame = ctk.CTkFrame(main_frame)
         checkbox_frame.pack(fill="x", padx=5, pady=5)
@@ -99,10 +149,12 @@ class ProductInfoFetcherApp(ctk.CTk):
         self.amazon_generic_vars = {}
         self.amazon_branded_vars = {}
         self.amazon_competition_vars = {}
+        # Keyword lists come from keyword_groups.json when present
+        groups = load_keyword_groups("amazon")
         for i, (title, vars_dict, keywords) in enumerate([
-            ("Generic", self.amazon_generic_vars, ["perfume", "perfume for men", "perfume for women", "unisex perfumes", "long lasting perfumes"]),
-            ("Branded", self.amazon_branded_vars, ["bellavita perfumes", "bella vita luxury perfume for men", "bella vita perfume for women", "bella vita perfume for men"]),
-            ("Competition", self.amazon_competition_vars, ["park avenue perfume for men", "wild stone perfume for men", "renee perfume"])
+            ("Generic", self.amazon_generic_vars, groups.get("Generic", [])),
+            ("Branded", self.amazon_branded_vars, groups.get("Branded", [])),
+            ("Competition", self.amazon_competition_vars, groups.get("Competition", []))
         ]):
             column_frame = ctk.CTkFrame(checkbox_frame)
             column_frame.grid(row=0, column=i, padx=5, pady=5, sticky="nsew")
@@ -154,6 +206,7 @@ class ProductInfoFetcherApp(ctk.CTk):
         other_button_frame.pack(fill="x", padx=5, pady=5)
         self.amazon_rank_other_button = ctk.CTkButton(other_button_frame, text="Fetch Other Keywords", command=self.process_amazon_rank_fetcher_other)
         self.amazon_rank_other_button.pack(side="left", padx=(0, 5), expand=True, fill="x")
+        ctk.CTkButton(other_button_frame, text="Fetch from File...", command=self.process_amazon_rank_fetcher_file).pack(side="left", padx=(0, 5), expand=True, fill="x")
         self.amazon_rank_save_cloud_button_other = ctk.CTkButton(other_button_frame, text="Save to Cloud", command=self.save_amazon_rank_to_cloud_other)
         self.amazon_rank_save_cloud_button_other.pack(side="left", expand=True, fill="x")
         self.amazon_rank_save_cloud_button_other.configure(state="disabled")
@@ -166,6 +219,17 @@ class ProductInfoFetcherApp(ctk.CTk):
         main_frame = ctk.CTkScrollableFrame(parent)
         main_frame.pack(expand=True, fill="both", padx=10, pady=10)
 
+        # Fetch product pages once per unique product id across all keywords of a run
+        self.flipkart_rank_enrich_var = ctk.BooleanVar()
+        ctk.CTkCheckBox(main_frame, text="Add product details (stock)", variable=self.flipkart_rank_enrich_var).pack(anchor="w", padx=5, pady=5)
+
+        # Target product ids: only report where these land, stopping as soon as all are found
+        target_frame = ctk.CTkFrame(main_frame)
+        target_frame.pack(fill="x", padx=5, pady=5)
+        ctk.CTkLabel(target_frame, text="Only find these product IDs (optional):").pack(side="left", padx=(0, 5))
+        self.flipkart_rank_targets_entry = ctk.CTkEntry(target_frame, placeholder_text="PRFXXXXXXXXXXXXX, PRFYYYYYYYYYYYYY")
+        self.flipkart_rank_targets_entry.pack(side="left", expand=True, fill="x")
+
         # Checkbox section
         checkbox_frame = ctk.CTkFrame(main_frame)
         checkbox_frame.pack(fill="x", padx=5, pady=5)
@@ -174,10 +238,12 @@ class ProductInfoFetcherApp(ctk.CTk):
         self.flipkart_generic_vars = {}
         self.flipkart_branded_vars = {}
         self.flipkart_competition_vars = {}
+        # Keyword lists come from keyword_groups.json when present
+        groups = load_keyword_groups("flipkart")
         for i, (title, vars_dict, keywords) in enumerate([
-            ("Generic", self.flipkart_generic_vars, ["perfume", "perfume for men", "perfume for women", "unisex perfumes", "long lasting perfumes"]),
-            ("Branded", self.flipkart_branded_vars, ["bellavita perfumes", "bella vita luxury perfume for men", "bella vita perfume for women", "bella vita perfume for men"]),
-            ("Competition", self.flipkart_competition_vars, ["park avenue perfume for men", "wild stone perfume for men", "renee perfume"])
+            ("Generic", self.flipkart_generic_vars, groups.get("Generic", [])),
+            ("Branded", self.flipkart_branded_vars, groups.get("Branded", [])),
+            ("Competition", self.flipkart_competition_vars, groups.get("Competition", []))
         ]):
             column_frame = ctk.CTkFrame(checkbox_frame)
             column_frame.grid(row=0, column=i, padx=5, pady=5, sticky="nsew")
@@ -229,6 +295,7 @@ class ProductInfoFetcherApp(ctk.CTk):
         other_button_frame.pack(fill="x", padx=5, pady=5)
         self.flipkart_rank_other_button = ctk.CTkButton(other_button_frame, text="Fetch Other Keywords", command=self.process_flipkart_rank_fetcher_other)
         self.flipkart_rank_other_button.pack(side="left", padx=(0, 5), expand=True, fill="x")
+        ctk.CTkButton(other_button_frame, text="Fetch from File...", command=self.process_flipkart_rank_fetcher_file).pack(side="left", padx=(0, 5), expand=True, fill="x")
         self.flipkart_rank_save_cloud_button_other = ctk.CTkButton(other_button_frame, text="Save to Cloud", command=self.save_flipkart_rank_to_cloud_other)
         self.flipkart_rank_save_cloud_button_other.pack(side="left", expand=True, fill="x")
         self.flipkart_rank_save_cloud_button_other.configure(state="disabled")
@@ -245,8 +312,12 @@ class ProductInfoFetcherApp(ctk.CTk):
         self.amazon_product_links = ctk.CTkTextbox(frame, height=100)
         self.amazon_product_links.pack(padx=10, pady=5, fill="x")
 
+        # "listing" needs no product page, so it is looked up through search pages
+        self.amazon_product_profile = self.create_profile_menu(frame)
+
         self.amazon_product_button = ctk.CTkButton(frame, text="Fetch Amazon Product Info", command=self.process_amazon_product_info)
         self.amazon_product_button.pack(padx=10, pady=10)
+        ctk.CTkButton(frame, text="Fetch from File...", command=self.process_amazon_product_info_file).pack(padx=10, pady=(0, 10))
 
         self.amazon_product_status = ctk.CTkLabel(frame, text="Status: Ready", text_color="white")
         self.amazon_product_status.pack(padx=10, pady=5)
@@ -259,12 +330,24 @@ class ProductInfoFetcherApp(ctk.CTk):
         self.flipkart_product_links = ctk.CTkTextbox(frame, height=100)
         self.flipkart_product_links.pack(padx=10, pady=5, fill="x")
 
+        self.flipkart_product_profile = self.create_profile_menu(frame)
+
         self.flipkart_product_button = ctk.CTkButton(frame, text="Fetch Flipkart Product Info", command=self.process_flipkart_product_info)
         self.flipkart_product_button.pack(padx=10, pady=10)
+        ctk.CTkButton(frame, text="Fetch from File...", command=self.process_flipkart_product_info_file).pack(padx=10, pady=(0, 10))
 
         self.flipkart_product_status = ctk.CTkLabel(frame, text="Status: Ready", text_color="white")
         self.flipkart_product_status.pack(padx=10, pady=5)
 
+    def create_profile_menu(self, parent):
+        profile_frame = ctk.CTkFrame(parent)
+        profile_frame.pack(padx=10, pady=5)
+        ctk.CTkLabel(profile_frame, text="Fields:").pack(side="left", padx=(0, 5))
+        menu = ctk.CTkOptionMenu(profile_frame, values=list(FETCH_PROFILES))
+        menu.set("full")
+        menu.pack(side="left")
+        return menu
+
     def process_amazon_rank_fetcher_checkboxes(self):
         if self.search_in_progress:
             messagebox.showerror("Error", "A search is already in progress.")
@@ -289,7 +372,8 @@ class ProductInfoFetcherApp(ctk.CTk):
         self.amazon_rank_checkbox_button.configure(state="disabled")
         self.amazon_rank_other_button.configure(state="disabled")
 
-        threading.Thread(target=self._process_amazon_rank_fetcher, args=(selected_keywords, int(ranking), "checkbox")).start()
+        targets = self.get_target_ids(self.amazon_rank_targets_entry)
+        self.start_run(self._process_amazon_rank_fetcher, selected_keywords, int(ranking), "checkbox", targets)
 
     def process_amazon_rank_fetcher_other(self):
         if self.search_in_progress:
@@ -309,18 +393,54 @@ class ProductInfoFetcherApp(ctk.CTk):
         self.amazon_rank_checkbox_button.configure(state="disabled")
         self.amazon_rank_other_button.configure(state="disabled")
 
-        threading.Thread(target=self._process_amazon_rank_fetcher, args=(keywords, int(ranking), "other")).start()
+        targets = self.get_target_ids(self.amazon_rank_targets_entry)
+        self.start_run(self._process_amazon_rank_fetcher, keywords, int(ranking), "other", targets)
+
+    def process_amazon_rank_fetcher_file(self):
+        if self.search_in_progress:
+            messagebox.showerror("Error", "A search is already in progress.")
+            return
+
+        ranking = self.amazon_rank_entry_other.get()
+        if not ranking.isdigit() or int(ranking) > 100:
+            messagebox.showerror("Invalid Input", "Please enter a ranking number up to 100.")
+            return
+
+        file_path = self.ask_input_file()
+        if not file_path:
+            return
+
+        self.search_in_progress = True
+        self.amazon_rank_results_other = {}  # Clear previous results
+        self.amazon_rank_status_other.configure(text=f"Status: Reading {os.path.basename(file_path)}", text_color="white")
+        self.amazon_rank_checkbox_button.configure(state="disabled")
+        self.amazon_rank_other_button.configure(state="disabled")
+
+        # The file is read on the worker thread and never goes through the textbox
+        targets = self.get_target_ids(self.amazon_rank_targets_entry)
+        keywords = unique_values(iter_file_values(file_path))
+        self.start_run(self._process_amazon_rank_fetcher, keywords, int(ranking), "other", targets)
 
-    def _process_amazon_rank_fetcher(self, keywords, ranking, section):
+    def _process_amazon_rank_fetcher(self, keywords, ranking, section, targets=None):
         try:
+            keywords = list(keywords)
+            if not keywords:
+                raise ValueError("No keywords to fetch")
             results = {}
             for i, keyword in enumerate(keywords, 1):
-                result = amazon_search(keyword, ranking)
+                if targets:
+                    result = amazon_find_target_ranks(keyword, targets, ranking)
+                else:
+                    result = amazon_search(keyword, ranking)
                 results[keyword] = result
+                self.results_viewer.add_results({keyword: result}, "Amazon Target Ranks" if targets else "Amazon Rank")
                 if section == "checkbox":
                     self.amazon_rank_status_checkbox.configure(text=f"Status: Processing ({i}/{len(keywords)})", text_color="white")
                 else:
                     self.amazon_rank_status_other.configure(text=f"Status: Processing ({i}/{len(keywords)})", text_color="white")
+
+            if self.amazon_rank_enrich_var.get() and not targets:
+                self._enrich_rank_results(results, "Amazon", self.amazon_rank_status_checkbox if section == "checkbox" else self.amazon_rank_status_other)
             
             if section == "checkbox":
                 self.amazon_rank_results_checkbox = results
@@ -333,7 +453,7 @@ class ProductInfoFetcherApp(ctk.CTk):
                 self.amazon_other_search_completed = True
                 self.amazon_rank_status_other.configure(text="Status: Completed", text_color="green")
             
-            self.save_results(results, 'Amazon Rank Fetcher')
+            self.save_results({'target_ranks': results} if targets else results, 'Amazon Rank Fetcher')
         except Exception as e:
             self.logger.error(f"Error in Amazon Rank Fetcher: {str(e)}")
             if section == "checkbox":
@@ -369,7 +489,8 @@ class ProductInfoFetcherApp(ctk.CTk):
         self.flipkart_rank_checkbox_button.configure(state="disabled")
         self.flipkart_rank_other_button.configure(state="disabled")
 
-        threading.Thread(target=self._process_flipkart_rank_fetcher, args=(selected_keywords, int(ranking), "checkbox")).start()
+        targets = self.get_target_ids(self.flipkart_rank_targets_entry)
+        self.start_run(self._process_flipkart_rank_fetcher, selected_keywords, int(ranking), "checkbox", targets)
 
     def process_flipkart_rank_fetcher_other(self):
         if self.search_in_progress:
@@ -389,18 +510,54 @@ class ProductInfoFetcherApp(ctk.CTk):
         self.flipkart_rank_checkbox_button.configure(state="disabled")
         self.flipkart_rank_other_button.configure(state="disabled")
 
-        threading.Thread(target=self._process_flipkart_rank_fetcher, args=(keywords, int(ranking), "other")).start()
+        targets = self.get_target_ids(self.flipkart_rank_targets_entry)
+        self.start_run(self._process_flipkart_rank_fetcher, keywords, int(ranking), "other", targets)
+
+    def process_flipkart_rank_fetcher_file(self):
+        if self.search_in_progress:
+            messagebox.showerror("Error", "A search is already in progress.")
+            return
+
+        ranking = self.flipkart_rank_entry_other.get()
+        if not ranking.isdigit() or int(ranking) > 100:
+            messagebox.showerror("Invalid Input", "Please enter a ranking number up to 100.")
+            return
+
+        file_path = self.ask_input_file()
+        if not file_path:
+            return
+
+        self.search_in_progress = True
+        self.flipkart_rank_results_other = {}  # Clear previous results
+        self.flipkart_rank_status_other.configure(text=f"Status: Reading {os.path.basename(file_path)}", text_color="white")
+        self.flipkart_rank_checkbox_button.configure(state="disabled")
+        self.flipkart_rank_other_button.configure(state="disabled")
+
+        # The file is read on the worker thread and never goes through the textbox
+        targets = self.get_target_ids(self.flipkart_rank_targets_entry)
+        keywords = unique_values(iter_file_values(file_path))
+        self.start_run(self._process_flipkart_rank_fetcher, keywords, int(ranking), "other", targets)
 
-    def _process_flipkart_rank_fetcher(self, keywords, ranking, section):
+    def _process_flipkart_rank_fetcher(self, keywords, ranking, section, targets=None):
         try:
+            keywords = list(keywords)
+            if not keywords:
+                raise ValueError("No keywords to fetch")
             results = {}
             for i, keyword in enumerate(keywords, 1):
-                result = flipkart_search(keyword, ranking)
+                if targets:
+                    result = flipkart_find_target_ranks(keyword, targets, ranking)
+                else:
+                    result = flipkart_search(keyword, ranking)
                 results[keyword] = result
+                self.results_viewer.add_results({keyword: result}, "Flipkart Target Ranks" if targets else "Flipkart Rank")
                 if section == "checkbox":
                     self.flipkart_rank_status_checkbox.configure(text=f"Status: Processing ({i}/{len(keywords)})", text_color="white")
                 else:
                     self.flipkart_rank_status_other.configure(text=f"Status: Processing ({i}/{len(keywords)})", text_color="white")
+
+            if self.flipkart_rank_enrich_var.get() and not targets:
+                self._enrich_rank_results(results, "Flipkart", self.flipkart_rank_status_checkbox if section == "checkbox" else self.flipkart_rank_status_other)
             
             if section == "checkbox":
                 self.flipkart_rank_results_checkbox = results
@@ -413,7 +570,7 @@ class ProductInfoFetcherApp(ctk.CTk):
                 self.flipkart_other_search_completed = True
                 self.flipkart_rank_status_other.configure(text="Status: Completed", text_color="green")
             
-            self.save_results(results, 'Flipkart Rank Fetcher')
+            self.save_results({'target_ranks': results} if targets else results, 'Flipkart Rank Fetcher')
         except Exception as e:
             self.logger.error(f"Error in Flipkart Rank Fetcher: {str(e)}")
             if section == "checkbox":
@@ -425,6 +582,53 @@ class ProductInfoFetcherApp(ctk.CTk):
             self.flipkart_rank_checkbox_button.configure(state="normal")
             self.flipkart_rank_other_button.configure(state="normal")
 
+    def start_run(self, target, *args):
+        if self.profile_runs_var.get():
+            threading.Thread(target=self.profile_run, args=(target, args), name=target.__name__.strip("_")).start()
+        else:
+            threading.Thread(target=target, args=args).start()
+
+    def profile_run(self, target, args):
+        self.last_results_path = None
+        profiler = profiling.SamplingProfiler().start()
+        try:
+            target(*args)
+        finally:
+            profiler.stop()
+            name = target.__name__.strip("_")
+            try:
+                collapsed_path, summary_path = profiler.write(profiling.profile_prefix(self.last_results_path, name), name)
+                self.logger.info(f"Run profile written to {summary_path} (flamegraph input: {collapsed_path})")
+            except Exception as e:
+                self.logger.error(f"Error writing run profile: {str(e)}")
+
+    def toggle_http2(self):
+        try:
+            http_client.set_transport("http2" if self.http2_var.get() else "http1")
+        except Exception as e:
+            self.http2_var.set(False)
+            self.logger.error(f"Error switching to HTTP/2: {str(e)}")
+            messagebox.showerror("HTTP/2", str(e))
+
+    def toggle_page_archive(self):
+        if self.archive_pages_var.get():
+            page_archive.enable()
+        else:
+            page_archive.disable()
+
+    def ask_input_file(self):
+        return filedialog.askopenfilename(filetypes=[("Keyword / product lists", "*.txt *.csv *.xlsx"), ("All files", "*.*")])
+
+    def get_target_ids(self, entry):
+        return [target for target in entry.get().replace(",", " ").split() if target]
+
+    def _enrich_rank_results(self, results, platform, status_label):
+        def progress(done, total):
+            status_label.configure(text=f"Status: Fetching product details ({done}/{total})", text_color="white")
+
+        stats = enrich_rank_results(results, platform, progress_callback=progress)
+        self.logger.info(f"{platform} enrichment: {stats['unique_products']} unique products for {stats['rows']} rows, {stats['fetches_saved']} fetches saved")
+
     def process_amazon_product_info(self):
         links = self.amazon_product_links.get("1.0", "end-1c").splitlines()
 
@@ -441,18 +645,44 @@ class ProductInfoFetcherApp(ctk.CTk):
         self.amazon_product_status.configure(text=f"Status: Processing (0/{len(links)})", text_color="white")
         self.amazon_product_button.configure(state="disabled")
 
-        threading.Thread(target=self._process_amazon_product_info, args=(links,)).start()
+        self.start_run(self._process_amazon_product_info, links)
+
+    def process_amazon_product_info_file(self):
+        if self.search_in_progress:
+            messagebox.showerror("Error", "A search is already in progress.")
+            return
+
+        file_path = self.ask_input_file()
+        if not file_path:
+            return
+
+        self.search_in_progress = True
+        self.amazon_product_info_results = []  # Clear previous results
+        self.amazon_product_status.configure(text=f"Status: Reading {os.path.basename(file_path)}", text_color="white")
+        self.amazon_product_button.configure(state="disabled")
+
+        self.start_run(self._process_amazon_product_info, iter_file_values(file_path))
 
     def _process_amazon_product_info(self, links):
         try:
-            for i, link in enumerate(links, 1):
-                result = fetch_amazon_product_info(link)
-                if result:
-                    self.amazon_product_info_results.append(result)
-                self.amazon_product_status.configure(text=f"Status: Processing ({i}/{len(links)})", text_color="white")
-            
+            def progress(done, total):
+                self.amazon_product_status.configure(text=f"Status: Processing ({done}/{total})", text_color="white")
+
+            # Products already on screen from a rank run may need no request at all
+            known_products = [product for results in (self.amazon_rank_results_checkbox, self.amazon_rank_results_other)
+                              for products in results.values() for product in products or []]
+            fields = FETCH_PROFILES[self.amazon_product_profile.get()]
+            def show(product):
+                self.results_viewer.add_results({'product': [product]}, "Amazon Product Info")
+
+            results, stats = lookup_amazon_products(links, fields, known_products, progress_callback=progress,
+                                                    result_callback=show)
+            self.amazon_product_info_results = [result for result in results if result]
+            self.logger.info(f"Amazon product lookup: {stats['inputs']} lines, {stats['unique']} products ({stats['fetches_saved']} duplicates skipped), "
+                             f"{stats['search_requests']} search pages, {stats['detail_fetches']} product pages")
+
             self.save_results({'product': self.amazon_product_info_results}, 'Amazon Product Info')
-            self.amazon_product_status.configure(text="Status: Completed", text_color="green")
+            self.amazon_product_status.configure(text=f"Status: Completed ({stats['fetches_saved']} duplicate fetches saved)", text_color="green")
         except Exception as e:
             self.logger.error(f"Error in Amazon Product Info: {str(e)}")
             self.amazon_product_status.configure(text="Status: Error occurred", text_color="red")
@@ -476,18 +706,40 @@ class ProductInfoFetcherApp(ctk.CTk):
         self.flipkart_product_status.configure(text=f"Status: Processing (0/{len(links)})", text_color="white")
         self.flipkart_product_button.configure(state="disabled")
 
-        threading.Thread(target=self._process_flipkart_product_info, args=(links,)).start()
+        self.start_run(self._process_flipkart_product_info, links)
     
+    def process_flipkart_product_info_file(self):
+        if self.search_in_progress:
+            messagebox.showerror("Error", "A search is already in progress.")
+            return
+
+        file_path = self.ask_input_file()
+        if not file_path:
+            return
+
+        self.search_in_progress = True
+        self.flipkart_product_info_results = []  # Clear previous results
+        self.flipkart_product_status.configure(text=f"Status: Reading {os.path.basename(file_path)}", text_color="white")
+        self.flipkart_product_button.configure(state="disabled")
+
+        self.start_run(self._process_flipkart_product_info, iter_file_values(file_path))
+
     def _process_flipkart_product_info(self, links):
         try:
-            for i, link in enumerate(links, 1):
-                result = fetch_flipkart_product_info(link)
-                if result:
-                    self.flipkart_product_info_results.append(result)
-                self.flipkart_product_status.configure(text=f"Status: Processing ({i}/{len(links)})", text_color="white")
+            profile = self.flipkart_product_profile.get()
+            # Each product is fetched once however many of its URLs were pasted
+            unique, keys, stats = canonicalize(links, "Flipkart")
+            results = {}
+            for i, (pid, url) in enumerate(unique.items(), 1):
+                results[pid] = fetch_flipkart_product_info(url, profile)
+                if results[pid]:
+                    self.results_viewer.add_results({'product': [results[pid]]}, "Flipkart Product Info")
+                self.flipkart_product_status.configure(text=f"Status: Processing ({i}/{len(unique)})", text_color="white")
+            self.flipkart_product_info_results = [result for result in fan_out(keys, results) if result]
+            self.logger.info(f"Flipkart product lookup: {stats['inputs']} lines, {stats['unique']} products ({stats['fetches_saved']} duplicates skipped)")
             
             self.save_results({'product': self.flipkart_product_info_results}, 'Flipkart Product Info')
-            self.flipkart_product_status.configure(text="Status: Completed", text_color="green")
+            self.flipkart_product_status.configure(text=f"Status: Completed ({stats['fetches_saved']} duplicate fetches saved)", text_color="green")
         except Exception as e:
             self.logger.error(f"Error in Flipkart Product Info: {str(e)}")
             self.flipkart_product_status.configure(text="Status: Error occurred", text_color="red")
@@ -530,6 +782,12 @@ class ProductInfoFetcherApp(ctk.CTk):
                 if not drive_service:
                     return
 
+                if self.sheets_append_var.get() and not has_target_ranks(results):
+                    self.save_to_sheets(drive_service, results, platform, section)
+                    messagebox.showinfo("Success", f"Results appended to Google Sheets for {platform}")
+                    self.mark_saved_to_cloud(platform, section)
+                    return
+
                 total_keywords = len(results)
                 for i, (keyword, keyword_results) in enumerate(results.items(), 1):
                     folder_id = self.get_folder_id_for_keyword(keyword, platform)
@@ -548,47 +806,63 @@ class ProductInfoFetcherApp(ctk.CTk):
                             self.flipkart_rank_status_other.configure(text=f"Saving to cloud: {i}/{total_keywords}", text_color="blue")
 
                 messagebox.showinfo("Success", f"Results saved successfully to Google Drive for {platform}")
-                
-                if section == "checkbox":
-                    if platform == "Amazon":
-                        self.amazon_checkbox_search_completed = False
-                        self.amazon_rank_status_checkbox.configure(text="Status: Saved to cloud", text_color="green")
-                    else:
-                        self.flipkart_checkbox_search_completed = False
-                        self.flipkart_rank_status_checkbox.configure(text="Status: Saved to cloud", text_color="green")
-                else:
-                    if platform == "Amazon":
-                        self.amazon_other_search_completed = False
-                        self.amazon_rank_status_other.configure(text="Status: Saved to cloud", text_color="green")
-                    else:
-                        self.flipkart_other_search_completed = False
-                        self.flipkart_rank_status_other.configure(text="Status: Saved to cloud", text_color="green")
+                self.mark_saved_to_cloud(platform, section)
 
             except Exception as e:
                 self.logger.error(f"Error saving results to Google Drive: {str(e)}")
                 messagebox.showerror("Error", f"Error saving results to Google Drive: {str(e)}")
 
-        threading.Thread(target=save_thread).start()
-
-    def get_folder_id_for_keyword(self, keyword, platform):
-        if platform == "Amazon":
-            if keyword in self.amazon_generic_vars:
-                return self.folder_ids['amazon']['generic']
-            elif keyword in self.amazon_branded_vars:
-                return self.folder_ids['amazon']['branded']
-            elif keyword in self.amazon_competition_vars:
-                return self.folder_ids['amazon']['competition']
+        self.start_run(save_thread)
+
+    def save_to_sheets(self, drive_service, results, platform, section):
+        # One batched append per keyword group, into that group's spreadsheet
+        # Clients from this thread's cache, fetched per save: httplib2 isn't
+        # thread-safe and a new sign-in replaces them
+        sheets_service = get_sheets_service(self.get_authorization_code)
+        groups = {}
+        for keyword, keyword_results in results.items():
+            groups.setdefault(self.get_group_for_keyword(keyword, platform), {})[keyword] = keyword_results
+
+        status = self.rank_status_label(platform, section)
+        for i, (group, group_results) in enumerate(groups.items(), 1):
+            folder_id = self.folder_ids[platform.lower()][group]
+            title = f"{platform} {group.replace('_', ' ')} ranks"
+            self.sheets_sync.append_results(sheets_service, drive_service, group_results, platform, folder_id, title)
+            status.configure(text=f"Saving to cloud: {i}/{len(groups)} keyword groups", text_color="blue")
+
+    def rank_status_label(self, platform, section):
+        if section == "checkbox":
+            return self.amazon_rank_status_checkbox if platform == "Amazon" else self.flipkart_rank_status_checkbox
+        return self.amazon_rank_status_other if platform == "Amazon" else self.flipkart_rank_status_other
+
+    def mark_saved_to_cloud(self, platform, section):
+        if section == "checkbox":
+            if platform == "Amazon":
+                self.amazon_checkbox_search_completed = False
             else:
-                return self.folder_ids['amazon']['rank_fetcher']
-        elif platform == "Flipkart":
-            if keyword in self.flipkart_generic_vars:
-                return self.folder_ids['flipkart']['generic']
-            elif keyword in self.flipkart_branded_vars:
-                return self.folder_ids['flipkart']['branded']
-            elif keyword in self.flipkart_competition_vars:
-                return self.folder_ids['flipkart']['competition']
+                self.flipkart_checkbox_search_completed = False
+        else:
+            if platform == "Amazon":
+                self.amazon_other_search_completed = False
             else:
-                return self.folder_ids['flipkart']['rank_fetcher']
+                self.flipkart_other_search_completed = False
+        self.rank_status_label(platform, section).configure(text="Status: Saved to cloud", text_color="green")
+
+    def get_group_for_keyword(self, keyword, platform):
+        if platform == "Amazon":
+            generic, branded, competition = self.amazon_generic_vars, self.amazon_branded_vars, self.amazon_competition_vars
+        else:
+            generic, branded, competition = self.flipkart_generic_vars, self.flipkart_branded_vars, self.flipkart_competition_vars
+        if keyword in generic:
+            return 'generic'
+        elif keyword in branded:
+            return 'branded'
+        elif keyword in competition:
+            return 'competition'
+        return 'rank_fetcher'
+
+    def get_folder_id_for_keyword(self, keyword, platform):
+        return self.folder_ids[platform.lower()][self.get_group_for_keyword(keyword, platform)]
 
     def save_to_drive_csv(self, service, results, file_name, folder_id):
         temp_file_name = None
@@ -632,6 +906,7 @@ class ProductInfoFetcherApp(ctk.CTk):
         )
 
         if file_path:
+            self.last_results_path = file_path
             try:
                 export_to_excel(results, file_path, title.split()[0])
                 messagebox.showinfo("Success", f"Results saved successfully to {file_path}")
@@ -640,34 +915,8 @@ class ProductInfoFetcherApp(ctk.CTk):
                 messagebox.showerror("Error", f"Error saving results: {str(e)}")
 
     def get_google_drive_service(self):
-        creds = None
-        SCOPES = ['https://www.googleapis.com/auth/drive.file']
-
         try:
-            if os.path.exists('token.pickle'):
-                with open('token.pickle', 'rb') as token:
-                    creds = pickle.load(token)
-            
-            if not creds or not creds.valid:
-                if creds and creds.expired and creds.refresh_token:
-                    creds.refresh(Request())
-                else:
-                    flow = Flow.from_client_secrets_file(
-                        'client_secret.json', SCOPES)
-                    flow.redirect_uri = 'urn:ietf:wg:oauth:2.0:oob'
-
-                    auth_url, _ = flow.authorization_url(prompt='consent')
-                    
-                    webbrowser.open(auth_url)
-                    
-                    code = self.get_authorization_code()
-                    flow.fetch_token(code=code)
-                    creds = flow.credentials
-
-                with open('token.pickle', 'wb') as token:
-                    pickle.dump(creds, token)
-
-            return build('drive', 'v3', credentials=creds)
+            return get_drive_service(self.get_authorization_code)
 
         except Exception as e:
             self.logger.error(f"Error in Google Drive authentication: {str(e)}")
@@ -678,5 +927,7 @@ class ProductInfoFetcherApp(ctk.CTk):
         return simpledialog.askstring("Authorization Code", "Enter the authorization code:")
 
 if __name__ == "__main__":
-    app = ProductInfoFetcherApp()
+    # Needed by the frozen .app so export worker processes start cleanly
+    multiprocessing.freeze_support()
+    app = ProductInfoFetcherApp(profile_runs="--profile" in sys.argv[1:])
     app.mainloop()
\ No newline at end of file
@@ -0,0 +1,283 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    import zstandard
+except ImportError:  # optional: pages are gzipped without it
+    zstandard = None
+
+import amazon_scraper
+import flipkart_scraper
+import http_client
+import product_info_fetcher
+import product_lookup
+from export_utils import export_to_excel
+from identifiers import AMAZON_PATH_PATTERN, ASIN_PATTERN
+from log_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = 'page_archive'
+INDEX_FILE = 'index.jsonl'
+ZSTD_LEVEL = 9
+GZIP_LEVEL = 6
+PLATFORM_NAMES = {"amazon": "Amazon", "flipkart": "Flipkart"}
+
+def classify(url):
+    # What an archived page is, from its URL: (platform, kind, key, page number),
+    # or None for pages re-extraction has no use for
+    parts = urlsplit(url)
+    query = parse_qs(parts.query)
+    page_number = query.get("page", ["1"])[0]
+    page = int(page_number) if page_number.isdigit() else 1
+    if parts.path == "/s" and "k" in query:
+        return "amazon", "search", query["k"][0], page
+    if parts.path == "/search" and "q" in query:
+        return "flipkart", "search", query["q"][0], page
+    match = AMAZON_PATH_PATTERN.search(parts.path)
+    if match and "flipkart" not in parts.netloc:
+        return "amazon", "product", match.group(1).upper(), None
+    if "/p/" in parts.path:
+        return "flipkart", "product", url, None
+    return None
+
+def search_kind(platform, key):
+    # For pages archived without a context: product_lookup's batch searches
+    # are ASINs joined by ASIN_SEPARATOR
+    terms = key.split(product_lookup.ASIN_SEPARATOR)
+    if platform == "amazon" and len(terms) > 1 and all(ASIN_PATTERN.fullmatch(term) for term in terms):
+        return "asin_batch"
+    return "keyword"
+
+class PageArchive:
+    # Pages are stored once per day directory under their SHA-256
+    # (objects/ab/abcd....html.zst, or .gz without zstandard), so a page
+    # fetched again unchanged costs one index line. index.jsonl records every
+    # fetch: time, url, platform, kind, key, page, sha256, bytes, encoding,
+    # and for search pages what the search was ("keyword" or "asin_batch")
+    # and how many results it asked for ("wanted").
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self.suffix = ".html.zst" if zstandard else ".html.gz"
+
+    def day_dir(self, day=None):
+        return os.path.join(self.root, day or date.today().isoformat())
+
+    def save(self, url, body, encoding=None, context=None):
+        try:
+            page = classify(url)
+            if page is None:
+                return None
+            platform, kind, key, page_number = page
+            digest = hashlib.sha256(body).hexdigest()
+            day_dir = self.day_dir()
+            if find_object(day_dir, digest) is None:
+                write_object(os.path.join(day_dir, "objects", digest[:2], digest + self.suffix), body)
+
+            entry = {"time": datetime.now().isoformat(timespec="seconds"), "url": url, "platform": platform,
+                     "kind": kind, "key": key, "page": page_number, "sha256": digest, "bytes": len(body),
+                     "encoding": encoding}
+            if kind == "search":
+                context = context or {}
+                entry["search"] = context.get("search") or search_kind(platform, key)
+                entry["wanted"] = context.get("wanted")
+            with self._lock:
+                with open(os.path.join(day_dir, INDEX_FILE), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+            return digest
+        except Exception as e:
+            # Archiving must never cost the run its results
+            logger.error(f"Error archiving {url}: {str(e)}")
+            return None
+
+def write_object(path, body):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if path.endswith(".zst"):
+        data = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    else:
+        data = gzip.compress(body, GZIP_LEVEL)
+    # Written under a temporary name first: concurrent writers of the same
+    # page (threads or crawl nodes) can't leave a half-written object behind
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def find_object(day_dir, digest):
+    for suffix in (".html.zst", ".html.gz"):
+        path = os.path.join(day_dir, "objects", digest[:2], digest + suffix)
+        if os.path.exists(path):
+            return path
+    return None
+
+def load_page(day_dir, digest):
+    path = find_object(day_dir, digest)
+    if path is None:
+        raise FileNotFoundError(f"Archived page {digest} missing from {day_dir}")
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError("zstandard is needed to read .zst pages (pip install zstandard)")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def iter_index(day_dir):
+    with open(os.path.join(day_dir, INDEX_FILE), encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def enable(root=ARCHIVE_DIR):
+    archive = PageArchive(root)
+    http_client.set_page_recorder(archive.save)
+    logger.info(f"Archiving fetched pages under {archive.day_dir()}")
+    return archive
+
+def disable():
+    http_client.set_page_recorder(None)
+
+def build_jobs(day_dir):
+    # One job per search keyword (its pages in page order, and the results
+    # the search asked for), per product and per ASIN batch search. A page
+    # or product fetched more than once that day uses its latest copy.
+    searches = {}
+    wanted = {}
+    products = {}
+    batches = {}
+    for entry in iter_index(day_dir):
+        page = (entry["sha256"], entry.get("encoding"))
+        key = (entry["platform"], entry["key"])
+        if entry["kind"] != "search":
+            products[key] = page
+        elif (entry.get("search") or search_kind(*key)) == "asin_batch":
+            batches[key] = page
+        else:
+            searches.setdefault(key, {})[entry["page"]] = page
+            if entry.get("wanted"):
+                wanted[key] = entry["wanted"]
+
+    jobs = [(day_dir, platform, "search", key, [pages[number] for number in sorted(pages)], wanted.get((platform, key)))
+            for (platform, key), pages in searches.items()]
+    jobs += [(day_dir, platform, "product", key, [page], None) for (platform, key), page in products.items()]
+    jobs += [(day_dir, platform, "asin_batch", key, [page], None) for (platform, key), page in batches.items()]
+    return jobs
+
+def extract_job(job):
+    # Runs in a worker process: the same parse/process functions the live
+    # fetchers use, fed from the archive instead of the network
+    day_dir, platform, kind, key, pages, wanted = job
+    try:
+        bodies = [(load_page(day_dir, digest), encoding) for digest, encoding in pages]
+        if kind == "search":
+            scraper = amazon_scraper if platform == "amazon" else flipkart_scraper
+            process = amazon_scraper.process_amazon_data if platform == "amazon" else flipkart_scraper.process_flipkart_data
+            soups = [scraper.parse_search_page([body], encoding=encoding) for body, encoding in bodies]
+            # As many results as the search asked for; older archives didn't record it
+            return job, process(soups, wanted or sum(scraper.count_results(soup) for soup in soups))
+
+        body, encoding = bodies[0]
+        if kind == "asin_batch":
+            # product_lookup's product info for the batch's ASINs the search returned
+            soup = amazon_scraper.parse_search_page([body], encoding=encoding)
+            found = product_lookup.batch_matches(soup, key.split(product_lookup.ASIN_SEPARATOR))
+            return job, [product_lookup.search_result_info(product, product_lookup.SEARCH_RESULT_FIELDS)
+                         for product in found.values()]
+        if platform == "amazon":
+            soup = product_info_fetcher.parse_amazon_page([body], "full", encoding)
+            return job, product_info_fetcher.process_amazon_data(soup, key, "full")
+        soup = product_info_fetcher.parse_flipkart_page(body, "full")
+        return job, product_info_fetcher.process_flipkart_data(soup, key, "full")
+    except Exception as e:
+        logger.error(f"Error re-extracting {platform} {kind} '{key}': {str(e)}")
+        return job, None
+
+def reextract(day_dir, max_workers=None):
+    # Regenerates the day's results from its archive, without any requests.
+    # Returns {platform: {"search": {keyword: products}, "product": [info, ...]}}.
+    jobs = build_jobs(day_dir)
+    logger.info(f"Re-extracting {len(jobs)} keywords/products from {day_dir}")
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    extracted = None
+    if max_workers > 1 and len(jobs) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                extracted = list(pool.map(extract_job, jobs, chunksize=max(1, len(jobs) // (max_workers * 4))))
+        except (BrokenProcessPool, OSError) as e:
+            logger.warning(f"Parallel re-extraction failed, falling back to a single process: {str(e)}")
+    if extracted is None:
+        extracted = [extract_job(job) for job in jobs]
+
+    results = {}
+    batch_products = {}
+    for (_, platform, kind, key, _, _), result in extracted:
+        platform_results = results.setdefault(platform, {"search": {}, "product": []})
+        if kind == "search":
+            platform_results["search"][key] = result or []
+        elif kind == "asin_batch":
+            for product in result or []:
+                batch_products.setdefault(product["ASIN"], product)
+        elif result:
+            platform_results["product"].append(result)
+    if batch_products:
+        # Products a batch search found, unless their own page was fetched too
+        amazon = results["amazon"]["product"]
+        fetched = {product.get("ASIN") for product in amazon}
+        amazon.extend(product for asin, product in batch_products.items() if asin not in fetched)
+    return results
+
+def export_results(results, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for platform, platform_results in results.items():
+        if platform_results["search"]:
+            paths.append(export_to_excel(platform_results["search"], os.path.join(output_dir, f"{platform}_rank.xlsx"),
+                                         PLATFORM_NAMES[platform]))
+        if platform_results["product"]:
+            paths.append(export_to_excel({'product': platform_results["product"]},
+                                         os.path.join(output_dir, f"{platform}_product.xlsx"), PLATFORM_NAMES[platform]))
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-run extraction over archived pages, with no network requests")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    extract = commands.add_parser("reextract", help="regenerate a day's results from its archive")
+    extract.add_argument("day_dir", help=f"archive directory of one day, e.g. {ARCHIVE_DIR}/2024-05-01")
+    extract.add_argument("--output", help="directory for the regenerated Excel files (default: <day_dir>/reextracted)")
+    extract.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+
+    stats = commands.add_parser("stats", help="pages, unique pages and sizes in a day's archive")
+    stats.add_argument("day_dir")
+
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    if args.command == "reextract":
+        results = reextract(args.day_dir, args.workers)
+        for path in export_results(results, args.output or os.path.join(args.day_dir, "reextracted")):
+            print(path)
+    elif args.command == "stats":
+        entries = list(iter_index(args.day_dir))
+        unique = {entry["sha256"]: entry["bytes"] for entry in entries}
+        stored = sum(os.path.getsize(find_object(args.day_dir, digest)) for digest in unique)
+        print(f"{len(entries)} pages fetched, {len(unique)} unique, "
+              f"{sum(unique.values()) / 1024:.0f} KB raw, {stored / 1024:.0f} KB on disk")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
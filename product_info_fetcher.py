@@ -1,146 +1,230 @@
-import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import logging
 import re
 from requests.exceptions import RequestException
 
+import http_client
+import stream_parser
+from identifiers import amazon_asin, flipkart_pid, flipkart_product
+
 logger = logging.getLogger(__name__)
 
-def fetch_amazon_product_info(identifier):
+AMAZON_BASE_URL = "https://www.amazon.in"
+
+# Named field sets for product fetches, smallest first. A profile limits both
+# which elements are captured from the page (so the download can stop sooner)
+# and which fields are extracted from them.
+FETCH_PROFILES = {
+    "price_stock": ["price", "In Stock"],
+    "details": ["BestSeller", "In Stock"],
+    "listing": ["title", "price", "rating", "reviews"],
+    "full": ["title", "price", "rating", "reviews", "BestSeller", "In Stock"],
+}
+
+# Elements process_amazon_data reads, in the order soup.find() would pick them
+AMAZON_PAGE_ELEMENTS = {
+    "title": lambda el: el.tag == "span" and el.get("id") == "productTitle",
+    "price": lambda el: el.tag == "span" and stream_parser.has_class(el, "a-price-whole"),
+    "rating": lambda el: el.tag == "span" and stream_parser.has_class(el, "a-icon-alt"),
+    "reviews": lambda el: el.tag == "span" and el.get("id") == "acrCustomerReviewText",
+    "stock": lambda el: el.tag == "span" and stream_parser.has_class(el, "a-size-medium a-color-success"),
+    "rank_bullets": lambda el: el.tag == "div" and el.get("id") == "detailBulletsWrapper_feature_div",
+    "rank_table": lambda el: el.tag == "table" and el.get("id") == "productDetails_detailBullets_sections1",
+}
+AMAZON_FIELD_ELEMENTS = {
+    "title": ["title"],
+    "price": ["price"],
+    "rating": ["rating"],
+    "reviews": ["reviews"],
+    "In Stock": ["stock"],
+    "BestSeller": ["rank_bullets", "rank_table"],
+}
+
+# Classes the Flipkart fields are read from, for parsing only those elements
+FLIPKART_FIELD_CLASSES = {
+    "title": "VU-ZEz",
+    "price": "Nx9bqj",
+    "rating": "XQDdHH",
+    "reviews": "Wphh3N",
+}
+
+def profile_for_fields(fields):
+    for name, profile_fields in FETCH_PROFILES.items():
+        if all(field in profile_fields for field in fields):
+            return name
+    return "full"
+
+def fetch_amazon_product_info(identifier, profile="full"):
     try:
-        soup = fetch_amazon_data(identifier)
-        return process_amazon_data(soup, identifier)
+        soup = fetch_amazon_data(identifier, profile)
+        return process_amazon_data(soup, identifier, profile)
     except Exception as e:
         logger.error(f"Error fetching Amazon product info: {str(e)}")
         return None
 
-def fetch_amazon_data(identifier):
+def fetch_amazon_data(identifier, profile="full"):
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
         "Accept-Language": "en-US,en;q=0.9",
-        "Accept-Encoding": "gzip, deflate, br",
+        "Accept-Encoding": http_client.ACCEPT_ENCODING,
         "Connection": "keep-alive",
     }
 
-    if re.match(r'^[A-Z0-9]{10}$', identifier):
-        url = f"https://www.amazon.in/dp/{identifier}"
-    elif 'amazon.in' in identifier:
-        url = identifier
-    else:
+    # Every product URL shape (and its tracking parameters) maps to one /dp/ page
+    asin = amazon_asin(identifier)
+    if not asin:
         raise ValueError(f"Invalid Amazon URL or ASIN: {identifier}")
+    url = f"{AMAZON_BASE_URL}/dp/{asin}"
 
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        return BeautifulSoup(response.content, 'html.parser')
+        # Product pages run to well over a megabyte, mostly after the detail
+        # bullets; only the elements the profile needs are kept, and the
+        # download stops once they have all gone past.
+        with http_client.stream(url, headers=headers, timeout=10) as body:
+            return parse_amazon_page(body.iter_chunks(), profile, body.encoding)
     except RequestException as e:
         logger.error(f"Error fetching Amazon product data: {str(e)}")
         raise
 
-def process_amazon_data(soup, identifier):
+def parse_amazon_page(chunks, profile="full", encoding=None):
+    fields = FETCH_PROFILES[profile]
+    targets = {name: AMAZON_PAGE_ELEMENTS[name] for field in fields for name in AMAZON_FIELD_ELEMENTS[field]}
+    captured = stream_parser.capture_first(
+        chunks, targets, is_complete=lambda captured: has_amazon_page_elements(captured, fields),
+        tags=("span", "div", "table"), encoding=encoding)
+    return BeautifulSoup("".join(captured.values()), 'html.parser')
+
+def has_amazon_page_elements(captured, fields):
+    for field in fields:
+        if field == "BestSeller":
+            # The rank table is only consulted when the bullets carry no rank
+            if "Best Sellers Rank" not in captured.get("rank_bullets", "") and "rank_table" not in captured:
+                return False
+        elif AMAZON_FIELD_ELEMENTS[field][0] not in captured:
+            return False
+    return True
+
+def process_amazon_data(soup, identifier, profile="full"):
     try:
-        title_elem = soup.find("span", {"id": "productTitle"})
-        title = title_elem.text.strip() if title_elem else "N/A"
-        
-        price_elem = soup.find("span", {"class": "a-price-whole"})
-        price = price_elem.text.strip() if price_elem else "N/A"
-        
-        rating_elem = soup.find("span", {"class": "a-icon-alt"})
-        rating = rating_elem.text.split()[0] if rating_elem else "N/A"
-        
-        reviews_elem = soup.find("span", {"id": "acrCustomerReviewText"})
-        reviews = reviews_elem.text.split()[0] if reviews_elem else "N/A"
-
-        # Check stock availability
-        stock_status = check_stock_availability(soup)
-
-        # Updated bestseller rank logic
-        bestseller_ranks = []
-        rank_elem = soup.find("div", {"id": "detailBulletsWrapper_feature_div"})
-        if rank_elem:
-            rank_items = rank_elem.find_all("span", {"class": "a-list-item"})
-            for item in rank_items:
-                if "Best Sellers Rank" in item.text:
-                    rank_text = item.text.strip()
-                    ranks = re.findall(r'#([\d,]+) in ([^(#]+)', rank_text)
-                    for rank, category in ranks:
-                        bestseller_ranks.append(f"#{rank.replace(',', '')} in {category.strip()}")
+        fields = FETCH_PROFILES[profile]
+        asin = amazon_asin(identifier)
+        info = {"ASIN": asin}
+
+        if "title" in fields:
+            title_elem = soup.find("span", {"id": "productTitle"})
+            info["title"] = title_elem.text.strip() if title_elem else "N/A"
+
+        if "price" in fields:
+            price_elem = soup.find("span", {"class": "a-price-whole"})
+            info["price"] = price_elem.text.strip() if price_elem else "N/A"
+
+        if "rating" in fields:
+            rating_elem = soup.find("span", {"class": "a-icon-alt"})
+            info["rating"] = rating_elem.text.split()[0] if rating_elem else "N/A"
+
+        if "reviews" in fields:
+            reviews_elem = soup.find("span", {"id": "acrCustomerReviewText"})
+            info["reviews"] = reviews_elem.text.split()[0] if reviews_elem else "N/A"
 
-        # If the above method doesn't work, try an alternative approach
-        if not bestseller_ranks:
-            rank_table = soup.find("table", {"id": "productDetails_detailBullets_sections1"})
-            if rank_table:
-                rank_rows = rank_table.find_all("tr")
-                for row in rank_rows:
-                    if "Best Sellers Rank" in row.text:
-                        rank_text = row.find("td", {"class": "a-size-base"}).text.strip()
-                        ranks = re.findall(r'#([\d,]+) in ([^(#]+)', rank_text)
-                        for rank, category in ranks:
-                            bestseller_ranks.append(f"#{rank.replace(',', '')} in {category.strip()}")
-
-        asin = identifier if not identifier.startswith('http') else re.search(r'/dp/([A-Z0-9]{10})', identifier).group(1)
-
-        return {
-            "ASIN": asin,
-            "title": title,
-            "price": price,
-            "rating": rating,
-            "reviews": reviews,
-            "link": f"https://www.amazon.in/dp/{asin}",
-            "BestSeller": " | ".join(bestseller_ranks) if bestseller_ranks else "N/A",
-            "In Stock": stock_status
-        }
+        info["link"] = f"https://www.amazon.in/dp/{asin}"
+
+        if "BestSeller" in fields:
+            bestseller_ranks = extract_bestseller_ranks(soup)
+            info["BestSeller"] = " | ".join(bestseller_ranks) if bestseller_ranks else "N/A"
+
+        if "In Stock" in fields:
+            info["In Stock"] = check_stock_availability(soup)
+
+        return info
     except Exception as e:
         logger.error(f"Error processing Amazon product data: {str(e)}")
         return None
 
-def fetch_flipkart_product_info(url):
+def extract_bestseller_ranks(soup):
+    bestseller_ranks = []
+    rank_elem = soup.find("div", {"id": "detailBulletsWrapper_feature_div"})
+    if rank_elem:
+        rank_items = rank_elem.find_all("span", {"class": "a-list-item"})
+        for item in rank_items:
+            if "Best Sellers Rank" in item.text:
+                rank_text = item.text.strip()
+                ranks = re.findall(r'#([\d,]+) in ([^(#]+)', rank_text)
+                for rank, category in ranks:
+                    bestseller_ranks.append(f"#{rank.replace(',', '')} in {category.strip()}")
+
+    # If the above method doesn't work, try an alternative approach
+    if not bestseller_ranks:
+        rank_table = soup.find("table", {"id": "productDetails_detailBullets_sections1"})
+        if rank_table:
+            rank_rows = rank_table.find_all("tr")
+            for row in rank_rows:
+                if "Best Sellers Rank" in row.text:
+                    rank_text = row.find("td", {"class": "a-size-base"}).text.strip()
+                    ranks = re.findall(r'#([\d,]+) in ([^(#]+)', rank_text)
+                    for rank, category in ranks:
+                        bestseller_ranks.append(f"#{rank.replace(',', '')} in {category.strip()}")
+    return bestseller_ranks
+
+def fetch_flipkart_product_info(url, profile="full"):
     try:
-        soup = fetch_flipkart_data(url)
-        return process_flipkart_data(soup, url)
+        soup = fetch_flipkart_data(url, profile)
+        return process_flipkart_data(soup, url, profile)
     except Exception as e:
         logger.error(f"Error fetching Flipkart product info: {str(e)}")
 
-def fetch_flipkart_data(url):
+def fetch_flipkart_data(url, profile="full"):
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3",
         "Accept-Language": "en-US,en;q=0.5",
-        "Accept-Encoding": "gzip, deflate, br",
+        "Accept-Encoding": http_client.ACCEPT_ENCODING,
         "Connection": "keep-alive",
         "Upgrade-Insecure-Requests": "1",
     }
 
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        return BeautifulSoup(response.content, 'lxml')
+        response = http_client.get(url, headers=headers, timeout=10)
+        return parse_flipkart_page(response.content, profile)
     except RequestException as e:
         logger.error(f"Error fetching Flipkart product data: {str(e)}")
 
+def parse_flipkart_page(content, profile="full"):
+    fields = FETCH_PROFILES[profile]
+    # The stock check looks for its phrases anywhere on the page; without it
+    # only the elements holding the requested fields are built into the tree.
+    if "In Stock" in fields:
+        return BeautifulSoup(content, 'lxml')
+    classes = {FLIPKART_FIELD_CLASSES[field] for field in fields if field in FLIPKART_FIELD_CLASSES}
+    strainer = SoupStrainer(class_=lambda value: value is not None and not classes.isdisjoint(value.split()))
+    return BeautifulSoup(content, 'lxml', parse_only=strainer)
 
-
-def process_flipkart_data(soup, url):
+def process_flipkart_data(soup, url, profile="full"):
     try:
-        title_elem = soup.find('span', class_='VU-ZEz')
-        title = title_elem.text.strip() if title_elem else 'N/A'
-        price_elem = soup.find('div', class_='Nx9bqj CxhGGd')
-        price = price_elem.text.strip() if price_elem else 'N/A'
-        rating_elem = soup.find('div', class_='XQDdHH')
-        rating = rating_elem.text.strip() if rating_elem else 'N/A'
-        reviews_elem = soup.find('span', class_='Wphh3N')
-        reviews = reviews_elem.text.strip() if reviews_elem else 'N/A'
-
-        # Extract only the number of ratings
-        if reviews != 'N/A':
-            reviews = reviews.split()[0]
-
-        return {
-            "link": url,
-            "title": title,
-            "price": price,
-            "rating": rating,
-            "reviews": reviews,
-        }
+        fields = FETCH_PROFILES[profile]
+        product = flipkart_product(url)
+        info = {"link": url, "product_id": (flipkart_pid(url) or product[0]) if product else "N/A"}
+
+        if "title" in fields:
+            title_elem = soup.find('span', class_='VU-ZEz')
+            info["title"] = title_elem.text.strip() if title_elem else 'N/A'
+
+        if "price" in fields:
+            price_elem = soup.find('div', class_='Nx9bqj CxhGGd')
+            info["price"] = price_elem.text.strip() if price_elem else 'N/A'
+
+        if "rating" in fields:
+            rating_elem = soup.find('div', class_='XQDdHH')
+            info["rating"] = rating_elem.text.strip() if rating_elem else 'N/A'
+
+        if "reviews" in fields:
+            reviews_elem = soup.find('span', class_='Wphh3N')
+            reviews = reviews_elem.text.strip() if reviews_elem else 'N/A'
+            # Extract only the number of ratings
+            info["reviews"] = reviews.split()[0] if reviews != 'N/A' else reviews
+
+        if "In Stock" in fields:
+            info["In Stock"] = check_flipkart_stock_availability(soup)
+
+        return info
     except Exception as e:
         logger.error(f"Error processing Flipkart product data: {str(e)}")
 def check_stock_availability(soup):
@@ -157,4 +241,16 @@ def check_stock_availability(soup):
         return "Unknown"
     except Exception as e:
         logger.error(f"Error checking stock availability: {str(e)}")
+        return "Unknown"
+
+def check_flipkart_stock_availability(soup):
+    try:
+        if soup.find(string=re.compile(r"Sold Out|Currently Unavailable|Coming Soon", re.IGNORECASE)):
+            return "No"
+        if soup.find("button", string=re.compile(r"ADD TO CART|BUY NOW", re.IGNORECASE)):
+            return "Yes"
+
+        return "Unknown"
+    except Exception as e:
+        logger.error(f"Error checking Flipkart stock availability: {str(e)}")
         return "Unknown"
\ No newline at end of file
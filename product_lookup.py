@@ -0,0 +1,121 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.exceptions import RequestException
+
+import amazon_scraper
+import http_client
+from block_detection import BlockedPageError
+from identifiers import canonicalize, fan_out
+from product_info_fetcher import fetch_amazon_product_info, profile_for_fields
+
+logger = logging.getLogger(__name__)
+
+# Fields a search result already carries, and the ones only the product page has
+SEARCH_RESULT_FIELDS = ["title", "price", "rating", "reviews"]
+DETAIL_PAGE_FIELDS = ["BestSeller", "In Stock"]
+ASINS_PER_SEARCH = 10  # ASINs OR-ed together into one search query
+# Amazon's search treats "|" between terms as OR (k=B0AAAAAAAA|B0BBBBBBBB
+# lists both products). That is observed behavior, not a documented API, so
+# results never depend on it: an ASIN a batch search doesn't return is
+# fetched from its /dp/ page, and stats["search_misses"] shows how often.
+ASIN_SEPARATOR = "|"
+
+def lookup_amazon_products(identifiers, fields=None, known_products=None, max_workers=2, progress_callback=None,
+                           result_callback=None):
+    # Resolves a list of ASINs/links in as few requests as possible: products
+    # already seen in rank results (known_products) are reused, the rest are
+    # looked up ASINS_PER_SEARCH at a time through search pages, and only
+    # ASINs that don't show up there (or requests for BestSeller / In Stock)
+    # cost a /dp/ page each. Inputs are canonicalized first, so every product
+    # is looked up once; results come back one per input line, plus stats.
+    # result_callback gets each product's info as soon as it is resolved.
+    fields = fields or SEARCH_RESULT_FIELDS + DETAIL_PAGE_FIELDS
+    needs_detail_page = any(field in DETAIL_PAGE_FIELDS for field in fields)
+
+    unique, keys, stats = canonicalize(identifiers, "Amazon")
+    asins = list(unique)
+
+    resolved = {}
+    stats.update({"from_known": 0, "from_search": 0, "search_requests": 0, "search_misses": 0, "detail_fetches": 0,
+                  "failed": 0})
+
+    def report():
+        if progress_callback:
+            progress_callback(len(resolved), len(asins))
+
+    def resolve(asin, info):
+        resolved[asin] = info
+        if result_callback and info:
+            result_callback(info)
+
+    if not needs_detail_page:
+        for product in known_products or []:
+            asin = product.get("asin")
+            # Target-rank entries carry an ASIN but no listing fields
+            if asin in unique and asin not in resolved and "price" in product:
+                resolve(asin, search_result_info(product, fields))
+                stats["from_known"] += 1
+        report()
+
+        pending = [asin for asin in asins if asin not in resolved]
+        batches = [pending[i:i + ASINS_PER_SEARCH] for i in range(0, len(pending), ASINS_PER_SEARCH)]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(search_asins, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                found = future.result()
+                stats["search_requests"] += 1
+                stats["search_misses"] += len(futures[future]) - len(found)
+                for asin, product in found.items():
+                    resolve(asin, search_result_info(product, fields))
+                    stats["from_search"] += 1
+                report()
+
+    missing = [asin for asin in asins if asin not in resolved]
+    profile = profile_for_fields(fields)
+    if missing:
+        logger.info(f"Fetching {len(missing)} of {len(asins)} products from their product pages")
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fetch_amazon_product_info, asin, profile): asin for asin in missing}
+        for future in as_completed(futures):
+            asin = futures[future]
+            resolve(asin, future.result())
+            stats["detail_fetches"] += 1
+            if resolved[asin] is None:
+                stats["failed"] += 1
+            report()
+
+    # Against one /dp/ page per product; searches that miss can cost more than they save
+    stats["requests_saved"] = max(0, len(asins) - stats["search_requests"] - stats["detail_fetches"])
+    logger.info(f"Amazon product lookup finished: {stats}")
+    return fan_out(keys, resolved), stats
+
+def search_asins(batch):
+    # One search for several ASINs; returns the ones that came back, by ASIN.
+    # Any failure just leaves the batch to the product-page fallback.
+    url = amazon_scraper.search_url(ASIN_SEPARATOR.join(batch))  # the "|" goes out encoded, as %7C
+    try:
+        with http_client.page_context(search="asin_batch"):
+            soup = amazon_scraper.fetch_search_page(url)
+    except (BlockedPageError, RequestException) as e:
+        logger.error(f"Error looking up {len(batch)} ASINs through search: {str(e)}")
+        return {}
+
+    found = batch_matches(soup, batch)
+    logger.info(f"Found {len(found)}/{len(batch)} ASINs on the search page")
+    return found
+
+def batch_matches(soup, batch):
+    # The batch's ASINs on a search page, by ASIN (first listing of each)
+    found = {}
+    for product in amazon_scraper.process_amazon_data([soup], amazon_scraper.count_results(soup)):
+        if product["asin"] in batch and product["asin"] not in found:
+            found[product["asin"]] = product
+    return found
+
+def search_result_info(product, fields):
+    # Same shape as fetch_amazon_product_info; fields not looked up are left out
+    info = {"ASIN": product["asin"], "link": f"https://www.amazon.in/dp/{product['asin']}"}
+    for field in fields:
+        if field in SEARCH_RESULT_FIELDS:
+            info[field] = product.get(field, "N/A")
+    return info
@@ -0,0 +1,259 @@
+import argparse
+import datetime
+import logging
+import os
+import re
+import runpy
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from log_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = 'profiles'
+DEFAULT_INTERVAL = 0.005  # seconds between samples
+TOP_FUNCTIONS = 15
+
+STAGES = ["fetch", "parse", "extract", "export", "upload", "ui", "other"]
+
+# (path fragment, function name prefixes or None for any) -> stage. A sample
+# belongs to the stage of its innermost matching frame, so BeautifulSoup's
+# find() called from process_amazon_data counts as extract, while a streamed
+# parse that is waiting on the socket counts as fetch.
+STAGE_RULES = [
+    ("fetch", ["http_client.py", "proxy_pool.py", "/requests/", "/urllib3/", "/http/client.py", "/socket.py",
+               "/ssl.py", "/httpx/", "/httpcore/", "/h2/"], None),
+    ("parse", ["stream_parser.py", "/bs4/__init__.py", "/bs4/builder/", "/lxml/", "/html/parser.py",
+               "/html5lib/"], None),
+    ("parse", ["amazon_scraper.py", "flipkart_scraper.py", "product_info_fetcher.py"], ("parse_",)),
+    ("extract", ["amazon_scraper.py", "flipkart_scraper.py", "product_info_fetcher.py", "product_lookup.py"],
+     ("process_", "extract_", "check_", "has_", "count_results", "last_page_number", "find_next_link",
+      "new_target_entry", "search_result_info")),
+    ("export", ["export_utils.py", "/openpyxl/", "/xlsxwriter/", "/pandas/io/excel/"], None),
+    ("upload", ["drive_client.py", "sheets_sync.py", "/googleapiclient/", "/httplib2/", "/google/auth/"], None),
+    ("ui", ["/tkinter/", "/customtkinter/", "results_viewer.py"], None),
+]
+
+# Stages that make their own network calls: socket, ssl and http.client
+# frames under one of them (googleapiclient -> httplib2 -> ssl) count as
+# that stage rather than as a page fetch
+NETWORK_OWNER_STAGES = ("upload",)
+
+# Leaf frames of a thread with nothing to do: left out of the stage totals
+IDLE_RULES = [
+    ("/threading.py", ("wait", "join", "_wait_for_tstate_lock")),
+    ("/queue.py", ("get",)),
+    ("/concurrent/futures/", ("_worker", "result", "as_completed", "wait")),
+    ("/selectors.py", ("select",)),
+    ("/logging/handlers.py", ("dequeue",)),
+    ("/tkinter/__init__.py", ("mainloop",)),
+    ("/tkinter/filedialog.py", None),
+    ("/tkinter/simpledialog.py", None),
+    ("/tkinter/commondialog.py", None),
+    ("/tkinter/messagebox.py", None),
+]
+
+def _matches(path, name, fragments, names):
+    return any(fragment in path for fragment in fragments) and (names is None or name.startswith(names))
+
+class SamplingProfiler:
+    # Wall-clock sampling of every thread's Python stack from a background
+    # thread: nothing is hooked into the code being profiled, so the cost is
+    # one stack walk per thread per interval. Each sample is weighted by the
+    # time since the previous one, so late samples (the GIL was busy) still
+    # add up to the run's wall time. Threads whose target is in
+    # exclude_targets (e.g. a stand-in server's) are not sampled.
+    def __init__(self, interval=DEFAULT_INTERVAL, exclude_targets=()):
+        self.interval = interval
+        self.exclude_targets = set(exclude_targets)
+        self.samples = Counter()  # (thread name, code objects leaf first) -> seconds
+        self.sample_count = 0
+        self.started = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._code_stages = {}
+
+    def start(self):
+        self._stop.clear()
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _run(self):
+        own = threading.get_ident()
+        last = time.perf_counter()
+        names = {}
+        skipped = set()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = now - last, now
+            for ident, frame in sys._current_frames().items():
+                if ident == own or ident in skipped:
+                    continue
+                name = names.get(ident)
+                if name is None:
+                    names, skipped = self._thread_names()
+                    if ident in skipped:
+                        continue
+                    name = names.get(ident, "thread")
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                self.samples[name, tuple(codes)] += weight
+            self.sample_count += 1
+
+    def _thread_names(self):
+        names, skipped = {}, set()
+        for thread in threading.enumerate():
+            target = getattr(getattr(thread, "_target", None), "__name__", None)
+            if target in self.exclude_targets:
+                skipped.add(thread.ident)
+            else:
+                names[thread.ident] = thread_label(thread.name)
+        return names, skipped
+
+    def code_stage(self, code):
+        stage = self._code_stages.get(code, False)
+        if stage is False:
+            path = code.co_filename.replace("\\", "/")
+            stage = next((stage for stage, fragments, names in STAGE_RULES
+                          if _matches(path, code.co_name, fragments, names)), None)
+            self._code_stages[code] = stage
+        return stage
+
+    def stack_stage(self, codes):
+        leaf = codes[0]
+        path = leaf.co_filename.replace("\\", "/")
+        if any(_matches(path, leaf.co_name, (fragment,), names) for fragment, names in IDLE_RULES):
+            return "idle"
+        stage = None
+        for code in codes:
+            found = self.code_stage(code)
+            if stage is None:
+                stage = found
+                if stage and stage != "fetch":
+                    return stage
+            elif found in NETWORK_OWNER_STAGES:
+                return found
+        return stage or "other"
+
+    def stage_totals(self):
+        totals = defaultdict(float)
+        for (_, codes), seconds in self.samples.items():
+            totals[self.stack_stage(codes)] += seconds
+        return totals
+
+    def collapsed(self):
+        # "thread;outermost;...;innermost milliseconds" lines, as flamegraph.pl,
+        # speedscope and inferno read them
+        lines = Counter()
+        for (thread, codes), seconds in self.samples.items():
+            frames = ";".join([thread] + [frame_label(code) for code in reversed(codes)])
+            lines[frames] += seconds
+        return [f"{frames} {round(seconds * 1000)}" for frames, seconds in sorted(lines.items()) if seconds >= 0.0005]
+
+    def summary(self, title="run"):
+        totals = self.stage_totals()
+        busy = sum(seconds for stage, seconds in totals.items() if stage != "idle")
+        threads = len({thread for thread, _ in self.samples})
+        lines = [f"Profile of {title}: {self.elapsed:.2f}s wall, {self.sample_count} samples every "
+                 f"{self.interval * 1000:g} ms across {threads} threads",
+                 "",
+                 f"{'stage':<10} {'seconds':>9} {'share':>7}"]
+        for stage in STAGES:
+            share = totals.get(stage, 0.0) / busy * 100 if busy else 0.0
+            lines.append(f"{stage:<10} {totals.get(stage, 0.0):>9.2f} {share:>6.1f}%")
+        lines.append(f"{'(idle)':<10} {totals.get('idle', 0.0):>9.2f}")
+
+        own = Counter()
+        for (_, codes), seconds in self.samples.items():
+            stage = self.stack_stage(codes)
+            if stage != "idle":
+                own[frame_label(codes[0]), stage] += seconds
+        lines += ["", "Top functions by own time (busy threads):", f"{'seconds':>9}  {'stage':<8} function"]
+        for (label, stage), seconds in own.most_common(TOP_FUNCTIONS):
+            lines.append(f"{seconds:>9.2f}  {stage:<8} {label}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, prefix, title="run"):
+        # <prefix>.collapsed.txt (flamegraph input) and <prefix>.stages.txt
+        folder = os.path.dirname(prefix)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        collapsed_path = f"{prefix}.collapsed.txt"
+        summary_path = f"{prefix}.stages.txt"
+        with open(collapsed_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.collapsed()) + "\n")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(self.summary(title))
+        return collapsed_path, summary_path
+
+def thread_label(name):
+    # "Thread-7 (save_thread)" and "ThreadPoolExecutor-0_3" pool with their siblings
+    return re.sub(r"-\d+(_\d+)?", "", name).replace(";", ",").replace(" ", "_")
+
+def frame_label(code):
+    if code.co_filename.startswith("<frozen "):
+        module = code.co_filename[len("<frozen "):-1]
+    else:
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    if module == "__init__":
+        module = os.path.basename(os.path.dirname(code.co_filename))
+    return f"{module}.{getattr(code, 'co_qualname', code.co_name)}".replace(";", ",").replace(" ", "_")
+
+def profile_prefix(results_path=None, name="run"):
+    # Next to the results file when there is one, else in PROFILE_DIR
+    if results_path:
+        return f"{os.path.splitext(results_path)[0]}.profile"
+    return os.path.join(PROFILE_DIR, f"{name}-{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a script under the sampling profiler and write a flamegraph "
+                                                 "profile and a per-stage summary",
+                                     usage="%(prog)s [--output PREFIX] [--interval MS] script.py [args ...]")
+    parser.add_argument("--output", help=f"profile path prefix (default: {PROFILE_DIR}/<script>-<time>)")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL * 1000, help="milliseconds between samples")
+    parser.add_argument("script", help="e.g. crawl_node.py, page_archive.py, watchlist.py")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments for the script")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    name = os.path.splitext(os.path.basename(args.script))[0]
+    prefix = args.output or profile_prefix(name=name)
+    sys.argv = [args.script] + args.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    status = 0
+    profiler = SamplingProfiler(args.interval / 1000).start()
+    try:
+        runpy.run_path(args.script, run_name="__main__")
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    finally:
+        profiler.stop()
+        collapsed_path, summary_path = profiler.write(prefix, " ".join(sys.argv))
+        print(profiler.summary(" ".join(sys.argv)), file=sys.stderr)
+        print(f"Profile written to {collapsed_path} and {summary_path}", file=sys.stderr)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+import argparse
+import logging
+import os
+import sys
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from input_files import iter_file_values
+from log_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Results on a first search page: a rank at or above this counts as page one.
+# Amazon's is what a first page really shows, sponsored slots included; the
+# scraper's RESULTS_PER_PAGE (16) is deliberately lower, a floor it plans how
+# many pages to fetch with. Flipkart pages carry a fixed 24 either way.
+PAGE_ONE_SIZE = {"Amazon": 22, "Flipkart": 24}
+SPONSORED = {"Sponsored": 1, "Organic": 0}  # anything else (Flipkart has no type) is -1: unknown
+
+def build_frame(day, platform, keyword, product, rank, sponsored):
+    # One row per product per keyword per day, as columns: categorical
+    # day/platform/keyword/product, int16 rank, int8 sponsored (1, 0 or -1)
+    # and two int32 codes the metrics group on, worked out once here:
+    # "search" for a platform + keyword (platform code x keywords + keyword
+    # code) and "pair" for a search + product.
+    # Takes lists, NumPy arrays or pandas Categoricals of equal length.
+    platform = pd.Categorical(platform)
+    keyword = pd.Categorical(keyword)
+    product = pd.Categorical(product)
+    search = platform.codes.astype(np.int64) * len(keyword.categories) + keyword.codes
+    pair, _ = pd.factorize(search * len(product.categories) + product.codes)
+    return pd.DataFrame({
+        "day": pd.Categorical(day),
+        "platform": platform,
+        "keyword": keyword,
+        "product": product,
+        "rank": np.asarray(rank, dtype=np.int16),
+        "sponsored": np.asarray(sponsored, dtype=np.int8),
+        "search": search.astype(np.int32),
+        "pair": pair.astype(np.int32),
+    })
+
+def frame_from_records(records):
+    # records: (day, platform, keyword, product, rank, type) tuples
+    columns = list(zip(*records)) or [[]] * 6
+    day, platform, keyword, product, rank, kind = columns
+    return build_frame(day, platform, keyword, product, rank, [SPONSORED.get(value, -1) for value in kind])
+
+def results_records(results, platform, day=None):
+    # Rows from a Rank Fetcher results dict ({keyword: [product, ...]}) as
+    # the scrapers, crawl_node and page_archive return it
+    day = day or date.today()
+    for keyword, products in results.items():
+        for product in products or []:
+            product_id = product.get("asin") or product.get("product_id")
+            if product_id and isinstance(product.get("rank"), int):
+                yield day, platform, keyword, product_id, product["rank"], product.get("type")
+
+def workbook_records(path):
+    # Rows from an exported rank workbook: one sheet per keyword, or one
+    # keyword per file (export_rank_files). Product info and target rank
+    # sheets are skipped. The day comes from each row's Timestamp.
+    try:
+        sheets = pd.read_excel(path, sheet_name=None)
+    except Exception as e:
+        logger.error(f"Error reading {path}: {str(e)}")
+        return
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for title, sheet in sheets.items():
+        if "Rank" not in sheet.columns or "Timestamp" not in sheet.columns:
+            continue
+        platform = "Amazon" if "ASIN" in sheet.columns else "Flipkart"
+        # Sheet names stop at 31 characters; a per-keyword file has the whole keyword
+        keyword = stem if len(sheets) == 1 and stem.startswith(title) else title
+        ids = sheet["ASIN" if platform == "Amazon" else "Product ID"]
+        ranks = pd.to_numeric(sheet["Rank"], errors="coerce")
+        days = pd.to_datetime(sheet["Timestamp"], errors="coerce").dt.date
+        kinds = sheet["Type"] if "Type" in sheet.columns else [None] * len(sheet)
+        for day, product_id, rank, kind in zip(days, ids, ranks, kinds):
+            if pd.notna(rank) and pd.notna(day) and isinstance(product_id, str):
+                yield day, platform, keyword, product_id, int(rank), kind
+
+def workbook_paths(paths):
+    # Files as given, and every .xlsx under the directories given
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.endswith(".xlsx") and not name.startswith("~$"):
+                        yield os.path.join(folder, name)
+        else:
+            yield path
+
+def load_workbooks(paths):
+    paths = list(workbook_paths(paths))
+    records = []
+    for path in paths:
+        records.extend(workbook_records(path))
+    logger.info(f"Loaded {len(records)} rank rows from {len(paths)} workbooks")
+    return frame_from_records(records)
+
+def keyword_metrics(frame, products=None):
+    # Per keyword, over all listed products or only the given ones (e.g. our
+    # own ASINs): days with results, distinct products, appearances, average
+    # and best rank, share of appearances on page one, sponsored-to-organic
+    # ratio, and rank volatility (the products' rank standard deviation,
+    # averaged by appearances; products seen once are left out).
+    return _metrics(frame, products, by_pair=False)
+
+def pair_metrics(frame, products=None):
+    # The same per keyword and product, without days and products
+    return _metrics(frame, products, by_pair=True)
+
+def _metrics(frame, products, by_pair):
+    # One pass over the columns: count, page-one, sponsored and organic
+    # appearances come from a single bincount over the pair codes, ranks and
+    # squared ranks from two weighted ones, and keyword figures are bincounts
+    # of the pair figures. Rank deviation comes from those sums, so nothing
+    # is sorted.
+    platforms = frame["platform"].cat.categories
+    keywords = frame["keyword"].cat.categories
+    pair = frame["pair"].to_numpy()
+    search = frame["search"].to_numpy()
+    rank = frame["rank"].to_numpy()
+    sponsored = frame["sponsored"].to_numpy()
+    day = frame["day"].cat.codes.to_numpy()
+    product = frame["product"].cat.codes.to_numpy()
+    n_pairs = int(pair.max()) + 1 if len(pair) else 0
+    n_searches = len(platforms) * len(keywords)
+    n_days = len(frame["day"].cat.categories)
+
+    # The search (and product) each pair stands for
+    pair_search = np.zeros(n_pairs, dtype=np.int64)
+    pair_search[pair] = search
+    if by_pair:
+        pair_product = np.zeros(n_pairs, dtype=np.int64)
+        pair_product[pair] = product
+
+    page_size = np.array([PAGE_ONE_SIZE.get(name, 0) for name in platforms], dtype=np.int16)
+    if len(platforms) == 1:
+        page_size = page_size[0]
+    else:
+        page_size = page_size[frame["platform"].cat.codes.to_numpy()]
+    if products is not None:
+        mask = frame["product"].isin(products).to_numpy()
+        pair, search, rank, sponsored, day = (column[mask] for column in (pair, search, rank, sponsored, day))
+        if np.ndim(page_size):
+            page_size = page_size[mask]
+
+    # Six counters per pair: (off / on page one) x (organic / sponsored / unknown)
+    flags = (rank <= page_size) * 3 + (sponsored == 1) + (sponsored == -1) * 2
+    counters = np.bincount(pair.astype(np.int64) * 6 + flags, minlength=n_pairs * 6).reshape(n_pairs, 6)
+    count = counters.sum(axis=1)
+    page_one = counters[:, 3:].sum(axis=1)
+    organic_count = counters[:, 0] + counters[:, 3]
+    sponsored_count = counters[:, 1] + counters[:, 4]
+    rank_sum = np.bincount(pair, rank, n_pairs)
+    squares = np.bincount(pair, rank.astype(np.float64) ** 2, n_pairs)
+    best = np.full(n_pairs, np.iinfo(np.int16).max, dtype=np.int16)
+    np.minimum.at(best, pair, rank)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        deviation = np.sqrt(np.maximum(squares / count - (rank_sum / count) ** 2, 0))
+
+    if by_pair:
+        seen = np.flatnonzero(count)
+        searches = pair_search[seen]
+        metrics = {"product": frame["product"].cat.categories[pair_product[seen]]}
+        volatility = np.where(count > 1, deviation, np.nan)
+    else:
+        per_search = lambda values: np.bincount(pair_search, values, n_searches)
+        repeated = np.where(count > 1, count, 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            volatility = per_search(np.where(repeated, deviation, 0) * repeated) / per_search(repeated)
+        days_seen = np.bincount(search.astype(np.int64) * n_days + day, minlength=n_searches * n_days)
+        metrics = {"days": (days_seen.reshape(n_searches, n_days) > 0).sum(axis=1),
+                   "products": per_search(count > 0).astype(np.int64)}
+        search_best = np.full(n_searches, np.iinfo(np.int16).max, dtype=np.int16)
+        np.minimum.at(search_best, pair_search, best)
+        count, rank_sum, page_one, sponsored_count, organic_count = (
+            per_search(values) for values in (count, rank_sum, page_one, sponsored_count, organic_count))
+        best = search_best
+        seen = np.flatnonzero(count)
+        searches = seen
+        metrics = {name: values[seen] for name, values in metrics.items()}
+
+    count, rank_sum, page_one, sponsored_count, organic_count, best, volatility = (
+        values[seen] for values in (count, rank_sum, page_one, sponsored_count, organic_count, best, volatility))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        metrics.update({
+            "appearances": count.astype(np.int64),
+            "avg_rank": rank_sum / count,
+            "best_rank": best,
+            "page_one_share": page_one / count,
+            # Missing (not inf) without organic appearances: blank in Excel, null in JSON
+            "sponsored_ratio": np.where(organic_count > 0, sponsored_count / organic_count, np.nan),
+            "rank_volatility": volatility,
+        })
+    result = pd.DataFrame(metrics)
+    result.insert(0, "platform", platforms[searches // len(keywords)])
+    result.insert(1, "keyword", keywords[searches % len(keywords)])
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Average rank, page-one share, sponsored ratio and rank volatility per keyword")
+    parser.add_argument("paths", nargs="+", help="exported rank workbooks, or folders of them")
+    parser.add_argument("--products", help="comma separated ASINs/product IDs, or a txt/csv/xlsx file of them, to measure alone")
+    parser.add_argument("--output", help="write keyword and keyword x product metrics to this .xlsx instead of printing")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    products = None
+    if args.products:
+        products = (list(iter_file_values(args.products)) if os.path.exists(args.products)
+                    else [value.strip() for value in args.products.split(",") if value.strip()])
+    frame = load_workbooks(args.paths)
+    keywords = keyword_metrics(frame, products)
+    if args.output:
+        with pd.ExcelWriter(args.output) as writer:
+            keywords.to_excel(writer, sheet_name="Keywords", index=False)
+            pair_metrics(frame, products).to_excel(writer, sheet_name="Products", index=False)
+        print(args.output)
+    else:
+        with pd.option_context("display.max_rows", None, "display.width", 200):
+            print(keywords.round(2).to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from product_info_fetcher import fetch_amazon_product_info, fetch_flipkart_product_info, profile_for_fields
+
+logger = logging.getLogger(__name__)
+
+# Product-page fields joined back into every rank row of an enriched run
+ENRICHMENT_FIELDS = {
+    "Amazon": ["BestSeller", "In Stock"],
+    "Flipkart": ["In Stock"],
+}
+
+def product_key(product, platform):
+    if platform == "Amazon":
+        return product.get("asin")
+    return product.get("product_id")
+
+def collect_unique_products(results, platform):
+    # First occurrence wins, so the fetch order follows the keyword order of the run
+    unique = {}
+    for products in results.values():
+        for product in products or []:
+            key = product_key(product, platform)
+            if key and key not in unique:
+                unique[key] = product
+    return unique
+
+def fetch_product_details(unique_products, platform, max_workers=2, progress_callback=None):
+    # Only the enrichment fields are parsed, which also lets Amazon page downloads stop early
+    profile = profile_for_fields(ENRICHMENT_FIELDS[platform])
+
+    def fetch(key, product):
+        if platform == "Amazon":
+            return fetch_amazon_product_info(key, profile)
+        link = product.get("link")
+        return fetch_flipkart_product_info(link, profile) if link and link != "N/A" else None
+
+    details = {}
+    total = len(unique_products)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fetch, key, product): key for key, product in unique_products.items()}
+        for done, future in enumerate(as_completed(futures), 1):
+            key = futures[future]
+            try:
+                details[key] = future.result()
+            except Exception as e:
+                logger.error(f"Error fetching details for {key}: {str(e)}")
+                details[key] = None
+            if progress_callback:
+                progress_callback(done, total)
+    return details
+
+def enrich_rank_results(results, platform, max_workers=2, progress_callback=None):
+    unique_products = collect_unique_products(results, platform)
+    total_rows = sum(len(products or []) for products in results.values())
+    logger.info(f"Enriching {len(unique_products)} unique {platform} products found in {total_rows} rank rows")
+
+    details = fetch_product_details(unique_products, platform, max_workers, progress_callback)
+
+    fields = ENRICHMENT_FIELDS[platform]
+    for products in results.values():
+        for product in products or []:
+            info = details.get(product_key(product, platform))
+            for field in fields:
+                product[field] = info.get(field, "N/A") if info else "N/A"
+
+    stats = {
+        "rows": total_rows,
+        "unique_products": len(unique_products),
+        "fetched": sum(1 for info in details.values() if info),
+        "failed": sum(1 for info in details.values() if not info),
+    }
+    stats["fetches_saved"] = total_rows - stats["unique_products"]
+    logger.info(f"Enrichment finished: {stats}")
+    return stats
@@ -0,0 +1,292 @@
+import logging
+import queue
+import re
+
+import customtkinter as ctk
+
+logger = logging.getLogger(__name__)
+
+ROW_HEIGHT = 22
+HEADER_HEIGHT = 26
+CHAR_WIDTH = 7  # rough pixel width of one character, used to clip cell text
+DEFAULT_COLUMN_WIDTH = 110
+COLUMN_WIDTHS = {"title": 340, "link": 260, "keyword": 170, "source": 150, "BestSeller": 260}
+DRAIN_INTERVAL_MS = 100
+FILTER_DELAY_MS = 150
+MAX_RECORDS_PER_DRAIN = 5000  # keeps a burst of results from stalling the UI
+
+def flatten_results(results, source):
+    # Turns the dicts handed to save_results ({keyword: rows}, {'product': rows},
+    # {'target_ranks': {keyword: entries}}) into flat records for the viewer.
+    if "target_ranks" in results:
+        results = results["target_ranks"]
+    records = []
+    for keyword, rows in results.items():
+        for row in rows or []:
+            record = {"source": source}
+            if keyword != "product" and "keyword" not in row:
+                record["keyword"] = keyword
+            record.update(row)
+            records.append(record)
+    return records
+
+def sort_key(value):
+    # Numbers (prices like "1,299", ranks, ratings) sort numerically, text
+    # alphabetically after them, and missing values last in either direction.
+    if value is None or value in ("N/A", "", "Not found"):
+        return (2, 0, "")
+    if isinstance(value, (int, float)):
+        return (0, value, "")
+    text = str(value)
+    number = re.fullmatch(r"[₹$]?\s*([\d,]*\.?\d+)\.?", text.strip())
+    if number:
+        return (0, float(number.group(1).replace(",", "")), "")
+    return (1, 0, text.lower())
+
+class ResultsModel:
+    # In-memory records plus the filtered/sorted view the table draws from.
+    # Kept free of Tk so filtering and sorting can be reasoned about (and
+    # timed) on their own.
+    def __init__(self):
+        self.records = []
+        self.columns = []
+        self.view = []
+        self.filter_text = ""
+        self.sort_column = None
+        self.sort_descending = False
+        self._search_text = []
+
+    def add(self, records):
+        start = len(self.records)
+        for record in records:
+            for column in record:
+                if column not in self.columns:
+                    self.columns.append(column)
+            self.records.append(record)
+            self._search_text.append(" ".join(str(value) for value in record.values()).lower())
+
+        new_rows = [i for i in range(start, len(self.records)) if self._matches(i)]
+        if self.sort_column is None:
+            self.view.extend(new_rows)
+        elif new_rows:
+            self.view.extend(new_rows)
+            self._sort()
+
+    def clear(self):
+        self.records = []
+        self.columns = []
+        self.view = []
+        self._search_text = []
+
+    def set_filter(self, text):
+        self.filter_text = text.strip().lower()
+        self.view = [i for i in range(len(self.records)) if self._matches(i)]
+        if self.sort_column is not None:
+            self._sort()
+
+    def sort_by(self, column):
+        if self.sort_column == column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+        self._sort()
+
+    def row(self, position):
+        return self.records[self.view[position]]
+
+    def _matches(self, index):
+        # Every space-separated term has to appear somewhere in the record
+        return all(term in self._search_text[index] for term in self.filter_text.split())
+
+    def _sort(self):
+        column = self.sort_column
+        keys = {i: sort_key(self.records[i].get(column)) for i in self.view}
+        present = sorted((i for i in self.view if keys[i][0] != 2), key=keys.__getitem__, reverse=self.sort_descending)
+        missing = [i for i in self.view if keys[i][0] == 2]
+        self.view = present + missing
+
+class ResultsViewer(ctk.CTkFrame):
+    # Table that only ever creates canvas items for the rows on screen: they
+    # are re-labelled on scroll, so 10,000 rows cost the same as 30.
+    # add_records() may be called from worker threads; records are queued and
+    # drained on the Tk thread.
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.model = ResultsModel()
+        self.first_row = 0
+        self._queue = queue.Queue()
+        self._cells = []
+        self._pool_columns = None
+        self._filter_job = None
+
+        controls = ctk.CTkFrame(self)
+        controls.pack(fill="x", padx=5, pady=5)
+        ctk.CTkLabel(controls, text="Filter:").pack(side="left", padx=(0, 5))
+        self.filter_entry = ctk.CTkEntry(controls, placeholder_text="keyword, ASIN, title...")
+        self.filter_entry.pack(side="left", expand=True, fill="x")
+        self.filter_entry.bind("<KeyRelease>", self._schedule_filter)
+        ctk.CTkButton(controls, text="Clear", width=70, command=self.clear).pack(side="left", padx=5)
+        self.count_label = ctk.CTkLabel(controls, text="0 rows")
+        self.count_label.pack(side="left", padx=5)
+
+        table = ctk.CTkFrame(self)
+        table.pack(expand=True, fill="both", padx=5, pady=(0, 5))
+        table.grid_rowconfigure(1, weight=1)
+        table.grid_columnconfigure(0, weight=1)
+
+        background = self._apply_appearance_mode(ctk.ThemeManager.theme["CTkFrame"]["fg_color"])
+        self.text_color = self._apply_appearance_mode(ctk.ThemeManager.theme["CTkLabel"]["text_color"])
+        self.stripe_color = self._apply_appearance_mode(ctk.ThemeManager.theme["CTkFrame"]["top_fg_color"])
+        self.header = ctk.CTkCanvas(table, height=HEADER_HEIGHT, highlightthickness=0, bg=background)
+        self.header.grid(row=0, column=0, sticky="ew")
+        self.body = ctk.CTkCanvas(table, highlightthickness=0, bg=background)
+        self.body.grid(row=1, column=0, sticky="nsew")
+        self.vertical = ctk.CTkScrollbar(table, command=self._on_vertical_scroll)
+        self.vertical.grid(row=1, column=1, sticky="ns")
+        self.horizontal = ctk.CTkScrollbar(table, orientation="horizontal", command=self._on_horizontal_scroll)
+        self.horizontal.grid(row=2, column=0, sticky="ew")
+
+        self.header.bind("<Button-1>", self._on_header_click)
+        self.body.bind("<Configure>", lambda event: self.redraw())
+        for widget in (self.body, self.header):
+            widget.bind("<MouseWheel>", self._on_mousewheel)
+            widget.bind("<Button-4>", lambda event: self._scroll_rows(-3))
+            widget.bind("<Button-5>", lambda event: self._scroll_rows(3))
+
+        self.after(DRAIN_INTERVAL_MS, self._drain)
+
+    def add_records(self, records):
+        self._queue.put(list(records))
+
+    def add_results(self, results, source):
+        self.add_records(flatten_results(results, source))
+
+    def clear(self):
+        self.model.clear()
+        self.first_row = 0
+        self.redraw()
+
+    def _drain(self):
+        records = []
+        try:
+            while len(records) < MAX_RECORDS_PER_DRAIN:
+                records.extend(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        if records:
+            self.model.add(records)
+            self.redraw()
+        self.after(DRAIN_INTERVAL_MS, self._drain)
+
+    def _schedule_filter(self, event=None):
+        # Debounced, so typing into the box doesn't refilter on every key
+        if self._filter_job:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(FILTER_DELAY_MS, self._apply_filter)
+
+    def _apply_filter(self):
+        self._filter_job = None
+        self.model.set_filter(self.filter_entry.get())
+        self.first_row = 0
+        self.redraw()
+
+    def _column_widths(self):
+        return [COLUMN_WIDTHS.get(column, DEFAULT_COLUMN_WIDTH) for column in self.model.columns]
+
+    def _visible_rows(self):
+        return max(1, self.body.winfo_height() // ROW_HEIGHT + 1)
+
+    def _build_pool(self, rows):
+        # Canvas items for one screenful of rows; rebuilt only when the columns
+        # or the window height change.
+        self.body.delete("all")
+        self.header.delete("all")
+        widths = self._column_widths()
+        total_width = sum(widths)
+        x = 0
+        for column, width in zip(self.model.columns, widths):
+            self.header.create_text(x + 6, HEADER_HEIGHT // 2, anchor="w", fill=self.text_color,
+                                    font=("Arial", 11, "bold"), tags=("heading", column))
+            self.header.create_line(x + width, 0, x + width, HEADER_HEIGHT, fill="gray")
+            x += width
+
+        self._cells = []
+        for row in range(rows):
+            y = row * ROW_HEIGHT
+            stripe = self.body.create_rectangle(0, y, total_width, y + ROW_HEIGHT, width=0,
+                                                fill=self.stripe_color if row % 2 else "")
+            texts = []
+            x = 0
+            for width in widths:
+                texts.append(self.body.create_text(x + 6, y + ROW_HEIGHT // 2, anchor="w", fill=self.text_color, font=("Arial", 11)))
+                x += width
+            self._cells.append((stripe, texts))
+
+        for canvas in (self.header, self.body):
+            canvas.configure(scrollregion=(0, 0, total_width, rows * ROW_HEIGHT))
+        self._pool_columns = (tuple(self.model.columns), rows)
+
+    def redraw(self):
+        rows = self._visible_rows()
+        if self._pool_columns != (tuple(self.model.columns), rows):
+            self._build_pool(rows)
+
+        total = len(self.model.view)
+        self.first_row = max(0, min(self.first_row, total - rows + 1))
+        widths = self._column_widths()
+
+        for column, width in zip(self.model.columns, widths):
+            arrow = ""
+            if column == self.model.sort_column:
+                arrow = " ▼" if self.model.sort_descending else " ▲"
+            self.header.itemconfigure(column, text=clip(column + arrow, width))
+
+        for slot, (stripe, texts) in enumerate(self._cells):
+            position = self.first_row + slot
+            record = self.model.row(position) if position < total else None
+            for item, column, width in zip(texts, self.model.columns, widths):
+                value = record.get(column, "") if record else ""
+                self.body.itemconfigure(item, text=clip(value, width))
+
+        if total:
+            self.vertical.set(self.first_row / total, min(1.0, (self.first_row + rows) / total))
+        else:
+            self.vertical.set(0.0, 1.0)
+        self.count_label.configure(text=f"{total:,} of {len(self.model.records):,} rows")
+
+    def _scroll_rows(self, delta):
+        self.first_row += delta
+        self.redraw()
+
+    def _on_mousewheel(self, event):
+        self._scroll_rows(-3 if event.delta > 0 else 3)
+
+    def _on_vertical_scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self.first_row = int(float(amount) * len(self.model.view))
+            self.redraw()
+        else:
+            step = self._visible_rows() - 1 if unit == "pages" else 1
+            self._scroll_rows(int(amount) * step)
+
+    def _on_horizontal_scroll(self, *args):
+        self.header.xview(*args)
+        self.body.xview(*args)
+        first, last = self.body.xview()
+        self.horizontal.set(first, last)
+
+    def _on_header_click(self, event):
+        x = self.header.canvasx(event.x)
+        for column, width in zip(self.model.columns, self._column_widths()):
+            if x < width:
+                self.model.sort_by(column)
+                self.first_row = 0
+                self.redraw()
+                return
+            x -= width
+
+def clip(value, width):
+    text = str(value)
+    limit = max(1, (width - 10) // CHAR_WIDTH)
+    return text if len(text) <= limit else text[:limit - 1] + "…"
@@ -0,0 +1,232 @@
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import http_client
+from export_utils import export_product_info_stream
+from identifiers import canonicalize
+from input_files import iter_file_values
+from log_setup import setup_logging
+from product_info_fetcher import FETCH_PROFILES
+from product_lookup import lookup_amazon_products
+
+logger = logging.getLogger(__name__)
+
+SHARD_DIR = 'shards'
+MANIFEST_FILE = 'manifest.json'
+SPILL_CHUNK = 200  # ASINs looked up (and held in memory) at a time per shard
+PROGRESS_INTERVAL = 5.0  # seconds between progress reports
+
+_shared_slots = {}  # host (None: any other host) -> semaphore shared by every shard of the run
+
+def shard_asins(asins, shards):
+    # Round robin: shards stay within one ASIN of each other, and reading
+    # the spill files back in turn gives the canonical order again
+    return [asins[index::shards] for index in range(shards)]
+
+def rate_share(limit, shards):
+    # A shard's part of a host budget (max concurrent, min seconds between
+    # starts). The max_concurrent slots are one semaphore shared by all the
+    # shards, and each starts requests shards times further apart, so
+    # together they ask no more of a site than one process, however many
+    # shards there are.
+    max_concurrent, min_interval = limit[:2]
+    return max_concurrent, min_interval * shards
+
+def init_shard(slots):
+    # Pool worker start-up: semaphores can only reach a worker process here,
+    # not through the jobs
+    global _shared_slots
+    _shared_slots = slots
+    setup_logging()
+
+def spill_path(spill_dir, index, shards):
+    return os.path.join(spill_dir, f"shard-{index + 1:03d}-of-{shards:03d}.jsonl")
+
+def complete_lines(path):
+    # (lines, byte offset after the last one) of a spill file; a line cut
+    # off by a crash doesn't count
+    lines = offset = 0
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                lines += 1
+                offset += len(line)
+    return lines, offset
+
+def prepare_spill_dir(spill_dir, asins, shards, fields):
+    # Spill files of an interrupted run of the same ASINs, shards and fields
+    # are resumed; anything else in the folder is cleared
+    os.makedirs(spill_dir, exist_ok=True)
+    manifest = {
+        "asins": hashlib.sha256("\n".join(asins).encode()).hexdigest(),
+        "count": len(asins),
+        "shards": shards,
+        "fields": fields,
+    }
+    manifest_path = os.path.join(spill_dir, MANIFEST_FILE)
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            resumable = json.load(f) == manifest
+    except (OSError, ValueError):
+        resumable = False
+    if not resumable:
+        for name in os.listdir(spill_dir):
+            if name.startswith("shard-") and name.endswith(".jsonl"):
+                os.remove(os.path.join(spill_dir, name))
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+    return [spill_path(spill_dir, index, shards) for index in range(shards)]
+
+def run_shard(job):
+    # Runs in a worker process: its own sessions and throttles, with its
+    # rate share of every host. Looks its ASINs up SPILL_CHUNK at a time and
+    # appends one JSON line per ASIN (null when the lookup failed), in shard
+    # order, after whatever an earlier attempt already wrote.
+    index, asins, path, fields, limits, transport, threads = job
+    if limits:
+        # Set through http_client, so throttles left over from a job this
+        # worker ran before are made again with the shared slots
+        for host, limit in limits["hosts"].items():
+            http_client.set_host_limit(host, *limit, _shared_slots.get(host))
+        http_client.set_default_limit(*limits["default"], _shared_slots.get(None))
+    if transport != http_client.get_transport():
+        http_client.set_transport(transport)
+
+    done, offset = complete_lines(path)
+    stats = Counter(resumed=done)
+    if done:
+        logger.info(f"Shard {index + 1}: resuming after {done} of {len(asins)} ASINs")
+    with open(path, "ab") as spill:
+        spill.truncate(offset)
+        for start in range(done, len(asins), SPILL_CHUNK):
+            results, chunk_stats = lookup_amazon_products(asins[start:start + SPILL_CHUNK], fields, max_workers=threads)
+            spill.write("".join(json.dumps(result) + "\n" for result in results).encode())
+            spill.flush()
+            stats.update({key: value for key, value in chunk_stats.items() if isinstance(value, int)})
+    logger.info(f"Shard {index + 1}: {len(asins)} ASINs done")
+    return dict(stats)
+
+def iter_spilled(paths):
+    # Products from the spill files, one line from each in turn: the
+    # canonical order, holding one line per shard
+    files = [open(path, encoding="utf-8") for path in paths]
+    try:
+        while files:
+            for f in list(files):
+                line = f.readline()
+                if line:
+                    yield json.loads(line)
+                else:
+                    files.remove(f)
+    finally:
+        for f in files:
+            f.close()
+
+def run_sharded(identifiers, output_path, shards=None, fields=None, threads=2, spill_dir=None,
+                keep_spills=False, progress_callback=None):
+    # Looks up a whole catalog of ASINs/links in worker processes and writes
+    # one product info workbook. Nothing but the current chunk of each shard
+    # is held in memory: results go to per-shard JSONL spill files, merged
+    # at the end. A run that stops part way picks up where it left off when
+    # started again with the same input. Returns stats.
+    fields = fields or FETCH_PROFILES["full"]
+    unique, _, stats = canonicalize(identifiers, "Amazon")
+    asins = list(unique)
+    shards = max(1, min(shards or os.cpu_count() or 1, len(asins)))
+    spill_dir = spill_dir or os.path.join(SHARD_DIR, os.path.splitext(os.path.basename(output_path))[0])
+    paths = prepare_spill_dir(spill_dir, asins, shards, fields)
+
+    host_limits = {host: http_client.host_limit(host) for host in http_client.DEFAULT_HOST_LIMITS}
+    default_limit = http_client.host_limit(None)
+    limits = {
+        "hosts": {host: rate_share(limit, shards) for host, limit in host_limits.items()},
+        "default": rate_share(default_limit, shards),
+    }
+    slots = {host: multiprocessing.BoundedSemaphore(limit[0]) for host, limit in host_limits.items()}
+    slots[None] = multiprocessing.BoundedSemaphore(default_limit[0])
+
+    transport = http_client.get_transport()
+    jobs = [(index, part, paths[index], fields, limits, transport, threads)
+            for index, part in enumerate(shard_asins(asins, shards))]
+    logger.info(f"Looking up {len(asins)} products in {shards} shards, spilling to {spill_dir}")
+
+    def report():
+        if progress_callback:
+            progress_callback(sum(complete_lines(path)[0] for path in paths), len(asins))
+
+    totals = Counter()
+    finished = set()
+    try:
+        with ProcessPoolExecutor(max_workers=shards, initializer=init_shard, initargs=(slots,)) as pool:
+            futures = {pool.submit(run_shard, job): job[0] for job in jobs}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=PROGRESS_INTERVAL)
+                for future in done:
+                    totals.update(future.result())
+                    finished.add(futures[future])
+                report()
+    except (BrokenProcessPool, OSError) as e:
+        # Finished lines are kept; the rest of each shard runs here, at this process's own rate
+        logger.warning(f"Sharded lookup failed, finishing in a single process: {str(e)}")
+        for job in jobs:
+            if job[0] not in finished:
+                totals.update(run_shard(job[:4] + (None,) + job[5:]))
+                report()
+
+    failed = Counter()
+    def merged():
+        for product in iter_spilled(paths):
+            if product is None:
+                failed["products"] += 1
+            yield product
+
+    exported = export_product_info_stream(merged(), output_path, "Amazon")
+    stats.update({key: totals.get(key, 0) for key in ("resumed", "from_search", "search_requests", "detail_fetches")})
+    stats.update({"shards": shards, "exported": exported, "failed": failed["products"]})
+    if not keep_spills:
+        for path in paths + [os.path.join(spill_dir, MANIFEST_FILE)]:
+            os.remove(path)
+        if not os.listdir(spill_dir):
+            os.rmdir(spill_dir)
+    logger.info(f"Sharded product lookup finished: {stats}")
+    return stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch Amazon product info for a very large list of ASINs/links "
+                                                 "in worker processes and write one workbook")
+    parser.add_argument("input", help="txt/csv/xlsx file of ASINs or product links")
+    parser.add_argument("output", help="path of the .xlsx file")
+    parser.add_argument("--shards", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--threads", type=int, default=2, help="concurrent lookups per shard")
+    parser.add_argument("--profile", choices=list(FETCH_PROFILES), default="full", help="product fields to fetch")
+    parser.add_argument("--spill-dir", help=f"where shards write their results (default: {SHARD_DIR}/<output name>)")
+    parser.add_argument("--keep-spills", action="store_true", help="keep the per-shard JSONL files after the merge")
+    parser.add_argument("--http2", action="store_true", help="fetch over HTTP/2, one connection per site and shard")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    if args.http2:
+        http_client.set_transport("http2")
+
+    def progress(done, total):
+        logger.info(f"Progress: {done}/{total} products")
+
+    stats = run_sharded(iter_file_values(args.input), args.output, args.shards, FETCH_PROFILES[args.profile],
+                        args.threads, args.spill_dir, args.keep_spills, progress)
+    print(f"{stats['exported']} products written to {args.output} ({stats['failed']} failed, "
+          f"{stats['fetches_saved']} duplicates and {stats['invalid']} unrecognised lines skipped)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import datetime
+import json
+import logging
+import os
+import threading
+import uuid
+import zlib
+
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+SHEETS_STATE_FILE = 'sheets_sync.json'
+SPREADSHEET_MIME = 'application/vnd.google-apps.spreadsheet'
+MAX_TAB_TITLE = 100
+
+# Fixed columns, so rows appended by different runs line up under one header
+SHEET_COLUMNS = {
+    "Amazon": ["rank", "asin", "title", "price", "rating", "reviews", "type", "link", "BestSeller", "In Stock"],
+    "Flipkart": ["rank", "product_id", "title", "price", "rating", "reviews", "link", "In Stock"],
+}
+
+def has_target_ranks(results):
+    # find_target_ranks rows (rank and page per tracked product, on either
+    # platform) don't fit SHEET_COLUMNS; they keep going to Drive as CSV
+    # files. Search result rows never carry a page.
+    return any("page" in row for rows in results.values() for row in rows or [])
+
+def tab_title(keyword):
+    return keyword.strip()[:MAX_TAB_TITLE] or "keyword"
+
+def cell(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return {"userEnteredValue": {"stringValue": "" if value is None else str(value)}}
+    return {"userEnteredValue": {"numberValue": value}}
+
+def row_data(values):
+    return {"values": [cell(value) for value in values]}
+
+class SheetsSync:
+    # Keeps one spreadsheet per Drive folder (keyword group), with a tab per
+    # keyword, and appends every save's rows to it. A save is one
+    # spreadsheets.batchUpdate per spreadsheet: tabs for new keywords are
+    # added (with their header row) and every keyword's rows appended in the
+    # same request. Spreadsheet and tab ids are remembered in a local JSON
+    # file, so the lookups only happen the first time. The API clients are
+    # passed in on every call: they belong to the calling thread (see
+    # DriveClientCache), while this state is shared, so saves run one at a time.
+    def __init__(self, state_path=SHEETS_STATE_FILE):
+        self.state_path = state_path
+        self.spreadsheets = {}
+        self._lock = threading.Lock()
+        if state_path and os.path.exists(state_path):
+            try:
+                with open(state_path, encoding="utf-8") as f:
+                    self.spreadsheets = json.load(f)
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable {state_path}: {str(e)}")
+
+    def append_results(self, sheets_service, drive_service, results, platform, folder_id, title, timestamp=None):
+        # results: {keyword: [product, ...]} for one folder. Returns the
+        # number of rows appended.
+        timestamp = timestamp or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        results = {keyword: rows for keyword, rows in results.items() if rows}
+        if not results:
+            return 0
+        with self._lock:
+            try:
+                self._append(sheets_service, drive_service, results, platform, folder_id, title, timestamp)
+            except HttpError as e:
+                if e.resp.status not in (400, 404):
+                    raise
+                # A tab or the whole spreadsheet was deleted by hand: look them up again
+                logger.warning(f"Spreadsheet '{title}' changed outside the app, reloading it: {str(e)}")
+                self.spreadsheets.pop(folder_id, None)
+                self._append(sheets_service, drive_service, results, platform, folder_id, title, timestamp)
+            self.save_state()
+        rows = sum(len(rows) for rows in results.values())
+        logger.info(f"Appended {rows} rows for {len(results)} keywords to spreadsheet '{title}'")
+        return rows
+
+    def _append(self, sheets_service, drive_service, results, platform, folder_id, title, timestamp):
+        spreadsheet = self.spreadsheet(sheets_service, drive_service, folder_id, title)
+        columns = SHEET_COLUMNS[platform]
+        tabs = spreadsheet["tabs"]
+        requests = []
+        added = {}
+        for keyword, rows in results.items():
+            tab = tab_title(keyword)
+            sheet_id = tabs.get(tab, added.get(tab))
+            new_rows = [row_data([timestamp] + [row.get(column) for column in columns]) for row in rows]
+            if sheet_id is None:
+                sheet_id = self.new_sheet_id(tab, set(tabs.values()) | set(added.values()))
+                added[tab] = sheet_id
+                requests.append({"addSheet": {"properties": {"sheetId": sheet_id, "title": tab}}})
+                new_rows.insert(0, row_data(["Timestamp"] + columns))
+            requests.append({"appendCells": {"sheetId": sheet_id, "rows": new_rows, "fields": "userEnteredValue"}})
+        if spreadsheet.get("placeholder") is not None and added:
+            # The empty "Sheet1" a new spreadsheet comes with
+            requests.append({"deleteSheet": {"sheetId": spreadsheet["placeholder"]}})
+
+        sheets_service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet["id"], body={"requests": requests}).execute()
+        tabs.update(added)
+        if added:
+            spreadsheet["placeholder"] = None
+
+    def spreadsheet(self, sheets_service, drive_service, folder_id, title):
+        # The folder's spreadsheet: remembered, found in the folder, or created there
+        spreadsheet = self.spreadsheets.get(folder_id)
+        if spreadsheet:
+            return spreadsheet
+
+        query = (f"name = '{title}' and '{folder_id}' in parents and mimeType = '{SPREADSHEET_MIME}' "
+                 f"and trashed = false")
+        files = drive_service.files().list(q=query, fields="files(id)", pageSize=1).execute().get("files", [])
+        if files:
+            sheets = sheets_service.spreadsheets().get(spreadsheetId=files[0]["id"],
+                                                       fields="sheets.properties(sheetId,title)").execute()
+            tabs = {sheet["properties"]["title"]: sheet["properties"]["sheetId"] for sheet in sheets.get("sheets", [])}
+            spreadsheet = {"id": files[0]["id"], "tabs": tabs, "placeholder": None}
+        else:
+            created = drive_service.files().create(body={"name": title, "mimeType": SPREADSHEET_MIME, "parents": [folder_id]},
+                                                   fields="id").execute()
+            spreadsheet = {"id": created["id"], "tabs": {}, "placeholder": 0}
+            logger.info(f"Created spreadsheet '{title}' in Drive folder {folder_id}")
+        self.spreadsheets[folder_id] = spreadsheet
+        return spreadsheet
+
+    def new_sheet_id(self, tab, taken):
+        # Chosen here rather than by the API, so rows can be appended to a new
+        # tab in the same batchUpdate that adds it
+        sheet_id = zlib.crc32(tab.encode()) & 0x7FFFFFFF
+        while sheet_id in taken or sheet_id == 0:
+            sheet_id = (sheet_id + 1) & 0x7FFFFFFF
+        return sheet_id
+
+    def save_state(self):
+        if not self.state_path:
+            return
+        try:
+            temp_path = f"{self.state_path}.{uuid.uuid4().hex}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.spreadsheets, f, indent=2)
+            os.replace(temp_path, self.state_path)
+        except Exception as e:
+            logger.error(f"Error saving {self.state_path}: {str(e)}")
@@ -0,0 +1,55 @@
+import logging
+
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+def iter_closed_elements(chunks, matches, tags=None, encoding=None):
+    # Feeds body chunks to lxml's incremental HTML parser and yields every
+    # element accepted by matches() as soon as its end tag has been parsed, so
+    # extraction runs while the rest of the page is still downloading.
+    # Callers that break out early simply stop reading the body.
+    parser = etree.HTMLPullParser(events=("end",), tag=tags, encoding=encoding)
+    for chunk in chunks:
+        parser.feed(chunk)
+        for _, element in parser.read_events():
+            if matches(element):
+                yield element
+    parser.close()
+    for _, element in parser.read_events():
+        if matches(element):
+            yield element
+
+def capture_first(chunks, targets, is_complete=None, tags=None, encoding=None):
+    # Serializes the first element matching each of targets ({name: predicate})
+    # and stops parsing once all of them (or whatever is_complete() accepts)
+    # have been seen. The HTML is returned in document order, ready to be
+    # loaded into a small soup for the usual extraction code.
+    captured = {}
+
+    def wanted(element):
+        return any(name not in captured and matches(element) for name, matches in targets.items())
+
+    for element in iter_closed_elements(chunks, wanted, tags, encoding):
+        html = to_html(element)
+        for name, matches in targets.items():
+            if name not in captured and matches(element):
+                captured[name] = html
+        if len(captured) == len(targets) or (is_complete and is_complete(captured)):
+            break
+    else:
+        logger.debug("Page ended with %d of %d elements not found", len(targets) - len(captured), len(targets))
+    return captured
+
+def to_html(element):
+    return etree.tostring(element, encoding="unicode", method="html", with_tail=False)
+
+def has_class(element, class_name):
+    # Same rule as BeautifulSoup's class_ filter: a single name matches any of
+    # the element's classes, several names must match the attribute exactly.
+    value = element.get("class")
+    if not value:
+        return False
+    if " " in class_name:
+        return value == class_name
+    return class_name in value.split()
@@ -0,0 +1,330 @@
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import sys
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+from identifiers import canonicalize
+from input_files import iter_file_values
+from log_setup import setup_logging
+from product_info_fetcher import fetch_amazon_product_info, profile_for_fields
+
+logger = logging.getLogger(__name__)
+
+WATCHLIST_FILE = 'watchlist.json'
+CHANGES_FILE = 'watchlist_changes.jsonl'
+WATCHED_FIELDS = ["price", "In Stock", "BestSeller"]
+FIELD_WEIGHTS = {"price": 1.0, "In Stock": 1.0, "BestSeller": 0.5}  # how much a change in each field is worth catching
+RANK_CHANGE = 0.2  # a BestSeller rank has changed once it moves this far from the last reported rank
+DEFAULT_BUDGET = 500  # requests per day across the whole watchlist
+MIN_INTERVAL = 15 * 60  # seconds: the most often a product is polled
+MAX_INTERVAL = 3 * 24 * 3600  # seconds: the least often a product is polled
+RETRY_DELAY = 30 * 60  # seconds before a product whose fetch failed is tried again
+DECAY = 0.97  # weight kept by older polls each time a product is polled again
+PRIOR_RATE = 1 / (24 * 3600)  # changes per second assumed for a field before there is data: one a day
+PRIOR_POLLS = 1  # polls' worth of weight that assumption starts with, fading like real polls
+PRIOR_INTERVAL = 6 * 3600  # seconds between those assumed polls
+DAY = 24 * 3600
+
+def field_value(field, info):
+    value = info.get(field, "N/A")
+    if field == "price":
+        digits = re.sub(r"[^\d.]", "", value)
+        return digits or value
+    if field == "BestSeller":
+        # The top category's rank; other categories move with it
+        match = re.search(r"#(\d+)", value)
+        return int(match.group(1)) if match else value
+    return value
+
+def has_changed(field, old, new):
+    if field == "BestSeller" and isinstance(old, int) and isinstance(new, int):
+        return abs(new - old) > RANK_CHANGE * old
+    return old != new
+
+def new_item(asin, now):
+    # Starts from PRIOR_POLLS made-up polls that saw PRIOR_RATE, so a new
+    # product gets polled like a typical one until its own polls outweigh them
+    unchanged = (PRIOR_POLLS + 0.5) * math.exp(-PRIOR_RATE * PRIOR_INTERVAL) - 0.5
+    return {"asin": asin, "values": {}, "polls": float(PRIOR_POLLS), "interval_sum": float(PRIOR_POLLS * PRIOR_INTERVAL),
+            "unchanged": {field: unchanged for field in WATCHED_FIELDS}, "changes": 0, "requests": 0,
+            "last_poll": None, "next_poll": now}
+
+def change_rate(item, field):
+    # Changes per second, from how many polls found the field unchanged.
+    # Polls only show whether a field changed since the last one, not how
+    # often, so the plain ratio undercounts fast movers; the estimate corrects
+    # for that (Cho & Garcia-Molina). Older polls fade with DECAY so a product
+    # that starts or stops moving is noticed.
+    polls = item["polls"]
+    interval = item["interval_sum"] / polls
+    return -math.log((item["unchanged"][field] + 0.5) / (polls + 0.5)) / interval
+
+def item_rate(item):
+    return sum(FIELD_WEIGHTS[field] * change_rate(item, field) for field in WATCHED_FIELDS)
+
+def freshness_gain(ratio):
+    # Freshness one more poll per second buys, times the change rate, for a
+    # product polled every 1/ratio of its mean time between changes
+    return 1 - (1 + ratio) * math.exp(-ratio)
+
+def poll_rate(rate, level, low, high):
+    # Polls per second for a product changing rate times a second, at the
+    # budget's current level. Polled this often, the last poll buys as much
+    # freshness per request as any other product's last poll does (Cho &
+    # Garcia-Molina), which favours products that move every few hours over
+    # both the ones that never move and the ones that move faster than any
+    # affordable schedule could follow.
+    target = rate / level
+    if target >= 1:
+        return low
+    lo, hi = 0.0, 64.0
+    for _ in range(40):
+        mid = (lo + hi) / 2
+        if freshness_gain(mid) < target:
+            lo = mid
+        else:
+            hi = mid
+    return min(max(rate / hi, low), high)
+
+def budget_level(rates, budget, low, high):
+    # The level at which the products' poll rates add up to the budget
+    lo, hi = 1e-9, 1e3
+    for _ in range(60):
+        mid = math.sqrt(lo * hi)
+        if sum(poll_rate(rate, mid, low, high) for rate in rates) > budget:
+            hi = mid
+        else:
+            lo = mid
+    return lo
+
+class Watchlist:
+    # Keeps price, stock and BestSeller rank of watched ASINs fresh within a
+    # fixed number of requests a day. Each product's own change history sets
+    # how often it is polled; the state (values, change statistics, next poll
+    # times) lives in a JSON file so a restart picks up where it left off.
+    def __init__(self, path=WATCHLIST_FILE, budget_per_day=DEFAULT_BUDGET, min_interval=MIN_INTERVAL,
+                 max_interval=MAX_INTERVAL, changes_path=CHANGES_FILE, fetch=None):
+        self.path = path
+        self.budget_per_day = budget_per_day
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.changes_path = changes_path
+        self.fetch = fetch or (lambda asin: fetch_amazon_product_info(asin, profile_for_fields(WATCHED_FIELDS)))
+        self.items = {}
+        self.level = None  # see budget_level; worked out again once every product has had a poll
+        self.polls_since_reschedule = 0
+        self.sent = deque()  # times of requests in the last day, to hold the budget even through retries
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            self.items = {item["asin"]: item for item in state.get("items", [])}
+            self.sent = deque(state.get("sent", []))
+
+    def add(self, identifiers, now=None):
+        now = time.time() if now is None else now
+        unique, _, stats = canonicalize(identifiers, "Amazon")
+        added = [asin for asin in unique if asin not in self.items]
+        for asin in added:
+            self.items[asin] = new_item(asin, now)
+        logger.info(f"Watching {len(added)} new products ({len(self.items)} in total, {stats['invalid']} lines skipped)")
+        self.reschedule()
+        return added
+
+    def remove(self, asins):
+        removed = [asin for asin in asins if self.items.pop(asin, None) is not None]
+        self.reschedule()
+        return removed
+
+    def reschedule(self):
+        # Shares the budget out again and moves every product's next poll to match
+        self.polls_since_reschedule = 0
+        if not self.items:
+            return
+        budget = self.budget_per_day / DAY
+        low, high = 1 / self.max_interval, 1 / self.min_interval
+        if len(self.items) * low > budget:
+            logger.warning(f"A budget of {self.budget_per_day}/day can't poll {len(self.items)} products every "
+                           f"{self.max_interval / 3600:.0f}h; polling them evenly instead")
+            self.level = None
+        else:
+            self.level = budget_level([item_rate(item) for item in self.items.values()], budget, low, high)
+        for item in self.items.values():
+            self.schedule(item)
+
+    def schedule(self, item):
+        if self.level is None:
+            item["interval"] = len(self.items) * DAY / self.budget_per_day
+        else:
+            item["interval"] = 1 / poll_rate(item_rate(item), self.level, 1 / self.max_interval, 1 / self.min_interval)
+        if item.get("retry_at") is not None:
+            item["next_poll"] = item["retry_at"]
+        elif item["last_poll"] is not None:
+            item["next_poll"] = item["last_poll"] + item["interval"]
+
+    def due(self, now=None):
+        # Products whose poll time has come, most overdue (relative to their interval) first
+        now = time.time() if now is None else now
+        due = [item for item in self.items.values() if item["next_poll"] <= now]
+        due.sort(key=lambda item: (now - item["next_poll"]) / item.get("interval", 1), reverse=True)
+        return [item["asin"] for item in due]
+
+    def budget_left(self, now=None):
+        now = time.time() if now is None else now
+        while self.sent and self.sent[0] <= now - DAY:
+            self.sent.popleft()
+        return self.budget_per_day - len(self.sent)
+
+    def record(self, asin, info, now=None):
+        # Updates a product from a fetch result (None = the fetch failed) and
+        # returns the fields that changed
+        now = time.time() if now is None else now
+        item = self.items[asin]
+        item["requests"] += 1
+        if info is None:
+            item["retry_at"] = item["next_poll"] = now + RETRY_DELAY
+            return []
+        item["retry_at"] = None
+
+        changed = []
+        first = item["last_poll"] is None
+        if not first:
+            elapsed = max(now - item["last_poll"], 1.0)
+            item["polls"] = item["polls"] * DECAY + 1
+            item["interval_sum"] = item["interval_sum"] * DECAY + elapsed
+        for field in WATCHED_FIELDS:
+            value = field_value(field, info)
+            old = item["values"].get(field)
+            if first or has_changed(field, old, value):
+                item["values"][field] = value
+                if not first:
+                    changed.append(field)
+            if not first:
+                item["unchanged"][field] = item["unchanged"][field] * DECAY + (field not in changed)
+        item["changes"] += len(changed)
+        item["last_poll"] = now
+
+        if changed:
+            self.log_changes(asin, changed, info, now)
+        # The level only drifts as rates are learned: one product is
+        # rescheduled per poll, all of them once per round
+        self.polls_since_reschedule += 1
+        if self.polls_since_reschedule >= len(self.items):
+            self.reschedule()
+        else:
+            self.schedule(item)
+        return changed
+
+    def log_changes(self, asin, changed, info, now):
+        if not self.changes_path:
+            return
+        entry = {"time": datetime.fromtimestamp(now).isoformat(timespec="seconds"), "asin": asin,
+                 "changed": changed, **{field: info.get(field) for field in WATCHED_FIELDS}}
+        try:
+            with open(self.changes_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except Exception as e:
+            logger.error(f"Error writing watchlist change for {asin}: {str(e)}")
+
+    def run_once(self, now=None):
+        # Polls everything that is due, as far as the budget allows. Returns
+        # {asin: changed fields} for the products polled.
+        polled = {}
+        due = self.due(now)
+        for asin in due:
+            stamp = time.time() if now is None else now
+            if self.budget_left(stamp) <= 0:
+                logger.warning(f"Daily budget of {self.budget_per_day} requests used up; "
+                               f"{len(due) - len(polled)} products wait")
+                break
+            self.sent.append(stamp)
+            info = self.fetch(asin)
+            polled[asin] = self.record(asin, info, None if now is None else now)
+            if polled[asin]:
+                logger.info(f"{asin} changed: " + ", ".join(f"{field} -> {info.get(field)}" for field in polled[asin]))
+        if polled:
+            self.save()
+        return polled
+
+    def run(self, stop_after=None):
+        # Polls until stopped (or for stop_after seconds), sleeping until the next product is due
+        started = time.time()
+        while stop_after is None or time.time() - started < stop_after:
+            self.run_once()
+            next_poll = min((item["next_poll"] for item in self.items.values()), default=None)
+            if next_poll is None:
+                return
+            wait = next_poll - time.time()
+            if self.budget_left() <= 0 and self.sent:
+                wait = max(wait, self.sent[0] + DAY - time.time())
+            time.sleep(min(max(wait, 1), 60))
+
+    def stats(self, now=None):
+        now = time.time() if now is None else now
+        rows = []
+        for asin, item in self.items.items():
+            rows.append({
+                "asin": asin,
+                "changes_per_day": round(item_rate(item) * DAY, 2),
+                "interval_h": round(item.get("interval", 0) / 3600, 2),
+                "next_poll_in_h": round((item["next_poll"] - now) / 3600, 2),
+                "requests": item["requests"],
+                "changes": item["changes"],
+                **item["values"],
+            })
+        rows.sort(key=lambda row: row["changes_per_day"], reverse=True)
+        return rows
+
+    def save(self):
+        if not self.path:
+            return
+        state = {"items": list(self.items.values()), "sent": list(self.sent)}
+        temp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Poll watched Amazon products as often as their price, stock and rank move")
+    parser.add_argument("--state", default=WATCHLIST_FILE, help="watchlist state file")
+    parser.add_argument("--budget", type=int, default=DEFAULT_BUDGET, help="requests per day across all products")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="watch the ASINs or product links in a txt/csv/xlsx file")
+    add.add_argument("file")
+    remove = commands.add_parser("remove", help="stop watching ASINs")
+    remove.add_argument("asins", nargs="+")
+    run = commands.add_parser("run", help="poll products as they come due")
+    run.add_argument("--once", action="store_true", help="poll what is due now and exit")
+    commands.add_parser("status", help="change rates, poll intervals and last values")
+
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    watchlist = Watchlist(args.state, args.budget)
+    if args.command == "add":
+        watchlist.add(iter_file_values(args.file))
+        watchlist.save()
+    elif args.command == "remove":
+        print(f"Removed {len(watchlist.remove([asin.upper() for asin in args.asins]))} products")
+        watchlist.save()
+    elif args.command == "run":
+        watchlist.reschedule()
+        if args.once:
+            watchlist.run_once()
+        else:
+            watchlist.run()
+    elif args.command == "status":
+        watchlist.reschedule()
+        for row in watchlist.stats():
+            print("  ".join(f"{key}={value}" for key, value in row.items()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
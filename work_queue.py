@@ -0,0 +1,191 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 300  # a task not completed or renewed by then goes back to the queue
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_DELAY = 30  # seconds before a failed task may be leased again, doubled per attempt
+BUSY_TIMEOUT = 30  # seconds a connection waits for another node's write lock
+
+Task = namedtuple("Task", ["id", "kind", "payload", "attempts"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    task_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    updated_at REAL,
+    UNIQUE (kind, task_key)
+);
+CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (status, available_at);
+"""
+
+class WorkQueue:
+    # Task queue in one SQLite file that every node opens: the coordinator
+    # enqueues, workers lease, and a lease that isn't completed or renewed in
+    # time is simply leased again by someone else. Each thread gets its own
+    # connection. The default rollback journal (not WAL) is kept so the file
+    # can live on a network share that supports file locking.
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def enqueue(self, kind, payloads, key=None):
+        # Adds one task per payload; a task whose key (default: the payload
+        # itself) is already queued is skipped, so re-running the coordinator
+        # doesn't duplicate work. Returns the number of new tasks.
+        now = time.time()
+        rows = [(kind, key(payload) if key else json.dumps(payload, sort_keys=True), json.dumps(payload), now)
+                for payload in payloads]
+        with self._transaction() as db:
+            before = db.total_changes
+            db.executemany("INSERT OR IGNORE INTO tasks (kind, task_key, payload, updated_at) VALUES (?, ?, ?, ?)", rows)
+            added = db.total_changes - before
+        logger.info(f"Queued {added} new '{kind}' tasks ({len(rows) - added} already queued)")
+        return added
+
+    def lease(self, worker_id, limit=1, kinds=None):
+        # Claims up to limit ready tasks: pending ones whose retry delay has
+        # passed, and leased ones whose lease ran out. BEGIN IMMEDIATE takes
+        # the write lock up front so two workers never claim the same row.
+        now = time.time()
+        query = ("SELECT id, kind, payload, attempts FROM tasks "
+                 "WHERE ((status = 'pending' AND available_at <= ?) OR (status = 'leased' AND lease_expires < ?))")
+        params = [now, now]
+        if kinds:
+            query += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            params.extend(kinds)
+        query += " ORDER BY id LIMIT ?"
+        params.append(limit)
+
+        with self._transaction() as db:
+            rows = db.execute(query, params).fetchall()
+            tasks = []
+            for task_id, kind, payload, attempts in rows:
+                if attempts >= self.max_attempts:
+                    # Lease expired on the last attempt: the worker probably died on it
+                    db.execute("UPDATE tasks SET status = 'failed', error = COALESCE(error, 'lease expired'), "
+                               "lease_owner = NULL, updated_at = ? WHERE id = ?", (now, task_id))
+                    continue
+                db.execute("UPDATE tasks SET status = 'leased', attempts = attempts + 1, lease_owner = ?, "
+                           "lease_expires = ?, updated_at = ? WHERE id = ?",
+                           (worker_id, now + self.lease_seconds, now, task_id))
+                tasks.append(Task(task_id, kind, json.loads(payload), attempts + 1))
+        return tasks
+
+    def renew(self, task_id, worker_id):
+        # Extends a lease for a task that is still being worked on; False means
+        # the lease was lost and the task belongs to another worker now
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE tasks SET lease_expires = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                                (time.time() + self.lease_seconds, task_id, worker_id))
+            return cursor.rowcount == 1
+
+    def complete(self, task_id, worker_id, result):
+        # A result that arrives after the lease expired is still kept, unless
+        # the worker that took the task over has already finished it
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE tasks SET status = 'done', result = ?, error = NULL, lease_owner = ?, updated_at = ? "
+                                "WHERE id = ? AND status IN ('pending', 'leased')",
+                                (json.dumps(result), worker_id, time.time(), task_id))
+        if cursor.rowcount != 1:
+            logger.info(f"Result for task {task_id} from {worker_id} not needed: already done")
+        return cursor.rowcount == 1
+
+    def fail(self, task_id, worker_id, error):
+        # Puts the task back with a growing delay, or marks it failed once it
+        # has used up max_attempts
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT attempts FROM tasks WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                             (task_id, worker_id)).fetchone()
+            if row is None:
+                return False
+            attempts = row[0]
+            status = "failed" if attempts >= self.max_attempts else "pending"
+            db.execute("UPDATE tasks SET status = ?, error = ?, lease_owner = NULL, available_at = ?, updated_at = ? WHERE id = ?",
+                       (status, str(error), now + RETRY_DELAY * 2 ** (attempts - 1), now, task_id))
+        return True
+
+    def retry_failed(self, kind=None):
+        # Gives failed tasks a fresh set of attempts
+        with self._transaction() as db:
+            query = "UPDATE tasks SET status = 'pending', attempts = 0, available_at = 0 WHERE status = 'failed'"
+            cursor = db.execute(query + " AND kind = ?", (kind,)) if kind else db.execute(query)
+            return cursor.rowcount
+
+    def counts(self):
+        db = self._connection()
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        for status, count in db.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status"):
+            counts[status] = count
+        return counts
+
+    def next_ready_at(self):
+        # Earliest time a retry delay or a running lease ends, or None when
+        # there is nothing left that could become ready
+        db = self._connection()
+        row = db.execute("SELECT MIN(CASE WHEN status = 'pending' THEN available_at ELSE lease_expires END) "
+                         "FROM tasks WHERE status IN ('pending', 'leased')").fetchone()
+        return row[0]
+
+    def is_finished(self):
+        counts = self.counts()
+        return counts["pending"] == 0 and counts["leased"] == 0
+
+    def results(self, kind=None):
+        # Yields (payload, result) for completed tasks in queue order
+        db = self._connection()
+        query = "SELECT payload, result FROM tasks WHERE status = 'done'"
+        rows = db.execute(query + " AND kind = ? ORDER BY id", (kind,)) if kind else db.execute(query + " ORDER BY id")
+        for payload, result in rows:
+            yield json.loads(payload), json.loads(result)
+
+    def failures(self, kind=None):
+        db = self._connection()
+        query = "SELECT kind, payload, error FROM tasks WHERE status = 'failed'"
+        rows = db.execute(query + " AND kind = ? ORDER BY id", (kind,)) if kind else db.execute(query + " ORDER BY id")
+        for task_kind, payload, error in rows:
+            yield task_kind, json.loads(payload), error
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+class _Transaction:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("COMMIT" if exc_type is None else "ROLLBACK")